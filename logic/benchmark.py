@@ -0,0 +1,545 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import platform
+import time
+import timeit
+import tracemalloc
+import message
+from message import fromJSON, fromJSON_many, State
+from util import Location
+from workflow import (Workflow, SequenceWorkflow, ParallelWorkflow,
+                      CombinedWorkflow, BurstWorkflow, StatusTable,
+                      WorkflowState)
+from workflow_extras import (SendTriggerWorkflow, LightControlWorkflow,
+                             DelayWorkflow)
+from workflow_graph import WorkflowGraph
+from engine_client import EngineClient
+from simulation import FakeMessage, Simulation
+
+
+MESSAGES = [
+    '{"method": "status", "state": "active", "data": null}',
+    '{"method": "STATUS", "state": "SOLVED", "data": "Worked!"}',
+    '{"method": "trigger", "state": "on", "data": {"path": "video.mp4"}}',
+    '{"method": "status", "state": "inactive"}',
+    'no valid json',
+]
+
+
+def bench_message_parsing(number):
+    """
+    Measures the cost of parsing a message with message.fromJSON
+    for the selected JSON backend and the standard json module.
+
+    Parameters
+    ----------
+    number : int
+        Number of iterations over the sample messages.
+
+    Returns
+    -------
+    Dictionary of the cost per message in microseconds.
+    """
+    results = {}
+    count = number * len(MESSAGES)
+
+    backend = message.json_backend
+    elapsed = timeit.timeit(lambda: fromJSON_many(MESSAGES), number=number)
+    results[f"fromJSON ({backend})"] = elapsed / count * 1e6
+
+    loads = message._loads
+    message._loads = json.loads
+    try:
+        elapsed = timeit.timeit(
+            lambda: [fromJSON(m) for m in MESSAGES], number=number)
+        results["fromJSON (json)"] = elapsed / count * 1e6
+    finally:
+        message._loads = loads
+
+    elapsed = timeit.timeit(
+        lambda: [json.loads(m) for m in MESSAGES[:-1]], number=number)
+    results["json.loads only"] = elapsed / (number * (len(MESSAGES) - 1)) * 1e6
+
+    messages = [fromJSON(m) for m in MESSAGES[:-1]]
+    elapsed = timeit.timeit(
+        lambda: [m.toJSON() for m in messages], number=number)
+    results["toJSON"] = elapsed / (number * len(messages)) * 1e6
+
+    return results
+
+
+def generate_synthetic_tree(depth, width):
+    """
+    Generates a workflow tree of the given depth and width. The levels
+    alternate between sequences and parallel workflows, the leaves are
+    puzzles listening to "bench/<path>".
+
+    Parameters
+    ----------
+    depth : int
+        The number of levels below the root.
+
+    width : int
+        The number of child workflows of every inner workflow.
+
+    Returns
+    -------
+    The root of the workflow tree.
+    """
+    def build(level, path):
+        if level == depth:
+            return Workflow(f"Puzzle {path}", "bench/" + path.replace(".", "/"))
+        children = [build(level + 1, f"{path}.{i}" if path else str(i))
+                    for i in range(width)]
+        if level % 2:
+            return ParallelWorkflow(f"Parallel {path}", children)
+        return SequenceWorkflow(f"Sequence {path}" if path else "Rooms",
+                                children)
+    return build(0, "")
+
+
+class SyntheticWorkflow:
+    """
+    Workflow factory of the generated trees (see generate_synthetic_tree).
+    """
+
+    def __init__(self, depth, width):
+        self.depth = depth
+        self.width = width
+
+    def create(self, settings):
+        return [generate_synthetic_tree(self.depth, self.width)]
+
+
+def start_game(simulation):
+    """
+    Starts a game of the simulation and waits for the retained purge.
+
+    Return
+    ------
+    elapsed : float
+        The wall time of the start in seconds.
+    """
+    start = time.perf_counter()
+    simulation.publish("op/gameOptions", '{"participants": 3, "duration": 60}')
+    simulation.publish("op/gameControl", "START")
+    simulation.advance(simulation.session.purge.window)
+    return time.perf_counter() - start
+
+
+def bench_dispatch(depth, width, number):
+    """
+    Measures the throughput of the received messages through the workflow
+    controller (with and without inbound queue) into a game of a generated
+    tree, and the throughput of a played game.
+
+    Parameters
+    ----------
+    depth, width : int
+        The shape of the generated tree.
+
+    number : int
+        Number of dispatched messages.
+
+    Returns
+    -------
+    Dictionary of the messages per second.
+    """
+    results = {}
+    factory = SyntheticWorkflow(depth, width)
+    status = b'{"method": "STATUS", "state": "ACTIVE"}'
+    for name, queue_size in (("queued", 1000), ("direct", 0)):
+        simulation = Simulation(factory, inbound_queue_size=queue_size)
+        start_game(simulation)
+        client = simulation.controller.client
+        topics = [w.topic for w in simulation.active_puzzles()]
+        # The messages are handed to the controller like by paho
+        batch = [FakeMessage(topics[i % len(topics)], status, 0, False, i)
+                 for i in range(500)]
+        unrouted = [FakeMessage(f"bench/none/{i}", status, 0, False, i)
+                    for i in range(500)]
+        rounds = max(number // len(batch), 1)
+        for label, messages in (("active puzzle", batch), ("unrouted", unrouted)):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for msg in messages:
+                    client.on_message(client, None, msg)
+                simulation.runtime.settle()
+            elapsed = time.perf_counter() - start
+            results[f"{label}, {name} (msg/s)"] = \
+                rounds * len(messages) / elapsed
+        simulation.close()
+
+    # Whole games: every message solves a puzzle and changes the graph,
+    # which is much more expensive, so less messages are sent
+    simulation = Simulation(factory)
+    solved = b'{"method": "STATUS", "state": "SOLVED"}'
+    count = 0
+    elapsed = 0.0
+    while count < max(number // 10, 1):
+        start_game(simulation)
+        start = time.perf_counter()
+        puzzles = simulation.active_puzzles()
+        while puzzles:
+            for puzzle in puzzles:
+                simulation.player.publish(puzzle.topic, solved)
+            simulation.runtime.settle()
+            count += len(puzzles)
+            puzzles = simulation.active_puzzles()
+        elapsed += time.perf_counter() - start
+        simulation.advance(1)
+    simulation.close()
+    results["solved puzzles (msg/s)"] = count / elapsed
+    return results
+
+
+def bench_graph(depth, width, number):
+    """
+    Measures the cost of the graph configuration of a generated tree:
+    the full configuration by get_graph_config() and the patched
+    configuration of the workflow graph after a state change.
+
+    Parameters
+    ----------
+    depth, width : int
+        The shape of the generated tree.
+
+    number : int
+        Number of iterations.
+
+    Returns
+    -------
+    Dictionary of the cost per node in microseconds.
+    """
+    root = SequenceWorkflow(
+        "Main workflow", SyntheticWorkflow(depth, width).create(None))
+    count = sum(1 for _ in root.walk())
+    repeat = max(number // count, 10)
+    elapsed = timeit.timeit(root.get_graph_config, number=repeat)
+    results = {"nodes": count,
+               "get_graph_config (us per node)": elapsed / repeat / count * 1e6}
+
+    graph = WorkflowGraph(root)
+    leaf = next(w for w in root.walk() if isinstance(w, Workflow))
+    states = (WorkflowState.ACTIVE, WorkflowState.INACTIVE)
+
+    def change(i=iter(range(repeat))):
+        leaf.state = states[next(i) % 2]
+        return graph.to_json()
+    elapsed = timeit.timeit(change, number=repeat)
+    results["changed graph to_json (us per node)"] = \
+        elapsed / repeat / count * 1e6
+    return results
+
+
+def bench_parallel(sizes):
+    """
+    Measures the cost of a finished child workflow of large parallel
+    workflows (ex. many sensors which all have to be satisfied).
+    The messages are dispatched by an engine client without game session.
+
+    Parameters
+    ----------
+    sizes : int[]
+        The numbers of child workflows.
+
+    Returns
+    -------
+    Dictionary of the cost per finished child workflow in microseconds.
+    """
+    solved = b'{"method": "STATUS", "state": "SOLVED"}'
+    results = {}
+    for size in sizes:
+        client = EngineClient(NullClient())
+        sensors = ParallelWorkflow("Sensors", [
+            Workflow(f"Sensor {i}", f"bench/sensor/{i}") for i in range(size)])
+        messages = [FakeMessage(w.topic, solved, 0, False, i)
+                    for i, w in enumerate(sensors.workflows)]
+        sensors.execute(client)
+        start = time.perf_counter()
+        for msg in messages:
+            client.dispatch(msg)
+        elapsed = time.perf_counter() - start
+        assert sensors.state is WorkflowState.FINISHED
+        results[f"{size} workflows (us per workflow)"] = \
+            elapsed / size * 1e6
+    return results
+
+
+def bench_burst(sizes):
+    """
+    Measures the execution of long chains of steps: commands executed one
+    after another by a combined workflow, published at once by a burst
+    workflow, and skipped puzzles of a sequence.
+
+    Parameters
+    ----------
+    sizes : int[]
+        The numbers of steps.
+
+    Returns
+    -------
+    Dictionary of the cost per step in microseconds.
+    """
+    results = {}
+    for size in sizes:
+        for cls in (CombinedWorkflow, BurstWorkflow):
+            commands = cls("Commands", [
+                SendTriggerWorkflow(f"Command {i}", f"bench/command/{i}",
+                                    State.ON) for i in range(size)])
+            start = time.perf_counter()
+            commands.execute(EngineClient(NullClient()))
+            elapsed = time.perf_counter() - start
+            assert commands.state is WorkflowState.FINISHED
+            results[f"{cls.type} {size} (us per command)"] = \
+                elapsed / size * 1e6
+        chain = SequenceWorkflow("Chain", [
+            Workflow(f"Puzzle {i}", f"bench/puzzle/{i}") for i in range(size)])
+        for workflow in chain.workflows:
+            workflow.skip(workflow.name)
+        start = time.perf_counter()
+        chain.execute(EngineClient(NullClient()))
+        elapsed = time.perf_counter() - start
+        assert chain.state is WorkflowState.FINISHED
+        results[f"skipped {size} (us per puzzle)"] = elapsed / size * 1e6
+    return results
+
+
+class NullClient:
+    """
+    MQTT client dropping all messages.
+    """
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        pass
+
+    def subscribe(self, topic):
+        pass
+
+    def unsubscribe(self, topic):
+        pass
+
+
+def bench_start(depth, width, number):
+    """
+    Measures the latency of starting and resetting (STOP and START) a game
+    of a generated tree, without the purge window.
+
+    Parameters
+    ----------
+    depth, width : int
+        The shape of the generated tree.
+
+    number : int
+        Number of games.
+
+    Returns
+    -------
+    Dictionary of the latencies in milliseconds.
+    """
+    simulation = Simulation(SyntheticWorkflow(depth, width))
+    starts = []
+    resets = []
+    for _ in range(number):
+        starts.append(start_game(simulation))
+        start = time.perf_counter()
+        simulation.publish("op/gameControl", "STOP")
+        start_game(simulation)
+        resets.append(time.perf_counter() - start)
+        simulation.publish("op/gameControl", "STOP")
+        simulation.advance(1)
+    simulation.close()
+    return {"start (ms)": min(starts) * 1e3,
+            "reset (ms)": min(resets) * 1e3}
+
+
+def generate_tree(nodes):
+    """
+    Generates a workflow tree with (at least) the given number of nodes.
+    Every room is a sequence of puzzles, parallel puzzles and combined
+    workflows controlling the lights.
+
+    Parameters
+    ----------
+    nodes : int
+        The number of nodes (workflows) of the tree.
+
+    Returns
+    -------
+    The root of the workflow tree.
+    """
+    rooms = []
+    count = 1
+    while count < nodes:
+        i = len(rooms)
+        room = SequenceWorkflow(f"Room {i}", [
+            Workflow(f"Puzzle {i}.1", f"{i}/puzzle/1"),
+            ParallelWorkflow(f"Parallel {i}", [
+                Workflow(f"Puzzle {i}.2", f"{i}/puzzle/2"),
+                Workflow(f"Puzzle {i}.3", f"{i}/puzzle/3"),
+            ]),
+            CombinedWorkflow(f"Env {i}", [
+                LightControlWorkflow(Location.MAINROOM, State.ON, 255, (255, 0, 0)),
+                DelayWorkflow(f"Delay {i}", 1),
+                SendTriggerWorkflow(f"Door {i}", f"{i}/door", State.ON),
+            ]),
+        ])
+        rooms.append(room)
+        count += sum(1 for _ in room.walk())
+    return SequenceWorkflow("Main workflow", rooms)
+
+
+def bench_memory(nodes):
+    """
+    Measures the memory of a generated workflow tree and compares the
+    node states in the status table with the per-node snapshots.
+
+    Parameters
+    ----------
+    nodes : int
+        The number of nodes of the generated tree.
+
+    Returns
+    -------
+    Dictionary of the memory in bytes.
+    """
+    # The loggers and encoded commands are shared by all trees
+    generate_tree(nodes)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    root = generate_tree(nodes)
+    table = StatusTable(root)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    tree = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    count = len(table.workflows)
+
+    tracemalloc.start()
+    snapshots = [workflow.snapshot() for workflow in table.workflows]
+    dict_states = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del snapshots
+
+    return {
+        "nodes": count,
+        "tree (bytes)": tree,
+        "tree (bytes per node)": tree / count,
+        "states as snapshots (bytes)": dict_states,
+        "states in status table (bytes)": len(table.snapshot()),
+    }
+
+
+def load_results(path):
+    """
+    Returns the last stored run of a results file (JSON lines).
+    """
+    last = None
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                last = json.loads(line)
+    return last
+
+
+def save_results(path, args, results):
+    """
+    Appends a run to a results file (JSON lines), so later runs can be
+    compared with it.
+    """
+    run = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "json_backend": message.json_backend,
+        "args": vars(args),
+        "results": results,
+    }
+    with open(path, "a") as f:
+        f.write(json.dumps(run) + "\n")
+
+
+def print_results(results, baseline=None):
+    """
+    Prints the results, with the change against a stored run.
+    """
+    for section, values in results.items():
+        print(f"{section}:")
+        previous = (baseline or {}).get(section, {})
+        for name, value in values.items():
+            line = f"  {name:<40} {value:12.3f}"
+            if previous.get(name):
+                line += f"  {(value / previous[name] - 1) * 100:+7.1f}%"
+            print(line)
+
+
+def parse_args():
+    """
+    Parses the command line arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--number",
+        "-n",
+        type=int,
+        default=20000,
+        help="Number of iterations per benchmark. (default: 20000)")
+    parser.add_argument(
+        "--nodes",
+        type=int,
+        default=1000,
+        help="Number of nodes of the generated workflow tree. (default: 1000)")
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=4,
+        help="Depth of the synthetic workflow tree. (default: 4)")
+    parser.add_argument(
+        "--width",
+        type=int,
+        default=4,
+        help="Width of the synthetic workflow tree. (default: 4)")
+    parser.add_argument(
+        "--games",
+        type=int,
+        default=20,
+        help="Number of games started and reset. (default: 20)")
+    parser.add_argument(
+        "--save",
+        "-s",
+        help="Appends the results to a file (JSON lines).")
+    parser.add_argument(
+        "--compare",
+        "-c",
+        help="Compares the results with the last run stored in a file.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    baseline = None
+    if args.compare and os.path.exists(args.compare):
+        baseline = load_results(args.compare)
+    shape = f"depth {args.depth}, width {args.width}"
+    results = {
+        "Message parsing (us per message)":
+            bench_message_parsing(args.number),
+        f"Workflow tree memory ({args.nodes} nodes)":
+            bench_memory(args.nodes),
+        f"Message dispatch ({shape})":
+            bench_dispatch(args.depth, args.width, args.number),
+        f"Graph configuration ({shape})":
+            bench_graph(args.depth, args.width, args.number),
+        f"Game start ({shape})":
+            bench_start(args.depth, args.width, args.games),
+        "Parallel workflow completion":
+            bench_parallel([100, 1000, 10000]),
+        "Command execution":
+            bench_burst([100, 10000]),
+    }
+    if baseline:
+        print(f"Compared with the run of {baseline['time']}")
+    print_results(results, baseline and baseline["results"])
+    if args.save:
+        save_results(args.save, args, results)
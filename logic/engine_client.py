@@ -0,0 +1,290 @@
+import collections
+import contextlib
+import threading
+from topic_index import TopicIndex
+from timer_service import TimerService
+from metrics import registry as metrics
+
+
+class ScopedMessage:
+    """
+    View of a MQTT message with the topic prefix of the game removed.
+    """
+
+    __slots__ = ("topic", "payload", "qos", "retain", "mid")
+
+    def __init__(self, msg, topic):
+        self.topic = topic
+        self.payload = msg.payload
+        self.qos = msg.qos
+        self.retain = msg.retain
+        self.mid = msg.mid
+
+
+class PublishBatch:
+    """
+    Messages waiting for their acknowledgement (see PublishTracker).
+    """
+
+    __slots__ = ("tracker", "callback", "pending", "timer")
+
+    def __init__(self, tracker, callback):
+        self.tracker = tracker
+        self.callback = callback
+        self.pending = 0
+        self.timer = None
+
+    def cancel(self):
+        """
+        Cancels the batch, the callback isn't called anymore.
+        """
+        self.tracker.cancel(self)
+
+
+class PublishTracker:
+    """
+    The publish tracker reports when the MQTT server acknowledged a batch
+    of published messages (QoS 0: sent, QoS 1: PUBACK, QoS 2: PUBCOMP).
+    The acknowledgements are received on the network thread of the client,
+    the callbacks are executed by the timer service, so they hold the lock
+    of the engine.
+
+    >>> from timer_service import TimerService
+    >>> from types import SimpleNamespace as Info
+    >>> done = []
+    >>> tracker = PublishTracker(TimerService(lambda f, *args: f(*args)))
+    >>> infos = [Info(mid=mid, is_published=lambda: False) for mid in (1, 2)]
+    >>> batch = tracker.wait(infos, lambda acked: done.append(acked))
+    >>> tracker.on_publish(None, None, 1)
+    >>> tracker.on_publish(None, None, 2)
+    >>> tracker.timers.stop()
+    >>> batch.pending, len(tracker.timers._heap)
+    (0, 0)
+    """
+
+    # Acknowledgements of unknown messages, ex. received before wait()
+    EARLY_ACKS = 1024
+
+    def __init__(self, timers):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        timers : TimerService
+            The timer service executing the callbacks.
+        """
+        self.timers = timers
+        self._waiting = {}
+        self._early = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def wait(self, infos, callback, timeout=None):
+        """
+        Waits for the acknowledgements of published messages.
+
+        Parameters
+        ----------
+        infos : MQTTMessageInfo[]
+            The results of the publishes.
+
+        callback : Function
+            Handler function called once: callback(acked)
+            "acked" is False, if the timeout expired before.
+
+        timeout : float
+            Optional: The time in seconds to wait at most.
+
+        Return
+        ------
+        batch : PublishBatch
+            The batch, which can be cancelled.
+        """
+        batch = PublishBatch(self, callback)
+        with self._lock:
+            for info in infos:
+                # paho calls on_publish before the message info is updated
+                if info.is_published() or self._early.pop(info.mid, False):
+                    continue
+                self._waiting[info.mid] = batch
+                batch.pending += 1
+            if batch.pending == 0:
+                batch.timer = self.timers.schedule(
+                    0, self.__complete, batch, True)
+            elif timeout is not None:
+                batch.timer = self.timers.schedule(
+                    timeout, self.__complete, batch, False)
+        return batch
+
+    def cancel(self, batch):
+        """
+        Cancels a batch.
+        """
+        with self._lock:
+            self.__remove(batch)
+
+    def on_publish(self, client, userdata, mid):
+        """
+        Handles an acknowledgement of the MQTT client.
+        """
+        with self._lock:
+            batch = self._waiting.pop(mid, None)
+            if batch is None:
+                self._early[mid] = True
+                if len(self._early) > self.EARLY_ACKS:
+                    self._early.popitem(False)
+                return
+            batch.pending -= 1
+            if batch.pending:
+                return
+            if batch.timer:
+                batch.timer.cancel()
+            batch.timer = self.timers.schedule(
+                0, self.__complete, batch, True)
+
+    def __remove(self, batch):
+        if batch.timer:
+            batch.timer.cancel()
+            batch.timer = None
+        if batch.pending:
+            for mid in [m for m, b in self._waiting.items() if b is batch]:
+                del self._waiting[mid]
+            batch.pending = 0
+
+    def __complete(self, batch, acked):
+        with self._lock:
+            if batch.timer is None:
+                # Cancelled while waiting for the timer service
+                return
+            self.__remove(batch)
+        batch.callback(acked)
+
+
+class EngineClient:
+    """
+    The engine client wraps the MQTT client handed to the workflows.
+    Besides forwarding the publishes it keeps the topic index of the
+    active workflows up to date, so incoming messages can be dispatched
+    directly to the workflows interested in them.
+    Timed workflows register their deadlines with the timer service.
+    With a topic prefix the workflows of several games share one
+    connection: the prefix is added to the outgoing topics and removed
+    from the topics of the dispatched messages.
+    """
+
+    def __init__(self, client, index=None, timers=None, prefix="",
+                 acks=None):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        client : Client
+            MQTT client
+
+        index : TopicIndex
+            Optional: A shared topic index.
+
+        timers : TimerService
+            Optional: A shared timer service.
+
+        prefix : str
+            Optional: The topic prefix of the game, ex. "room1/".
+
+        acks : PublishTracker
+            Optional: The tracker of the acknowledgements of the
+            published messages.
+        """
+        self.client = client
+        self.prefix = prefix
+        self.index = index if index is not None else TopicIndex()
+        self.timers = timers if timers is not None else TimerService()
+        self.acks = acks
+        # The game the messages of the session belong to
+        # (see MessageJournal)
+        self.game = 0
+        self._batches = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        """
+        Publishes a message to the MQTT server.
+        """
+        topic = self.prefix + topic
+        metrics.published(topic)
+        info = self.client.publish(topic, payload, qos, retain)
+        if self._batches:
+            self._batches[-1].append(info)
+        return info
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Collects the results of the messages published in the context,
+        ex. to wait for their acknowledgements (see PublishTracker).
+        Nested batches only collect their own messages.
+        """
+        infos = []
+        self._batches.append(infos)
+        try:
+            yield infos
+        finally:
+            self._batches.pop()
+
+    def subscribe(self, topic, subscriber=None):
+        """
+        Subscribes to a topic and registers the subscriber in the index.
+        The subscription is always forwarded to the MQTT server,
+        so retained messages are delivered to the new subscriber.
+
+        Parameters
+        ----------
+        topic : str
+            The MQTT topic filter.
+
+        subscriber : any
+            Optional: The subscriber which provides "on_message(msg)".
+        """
+        topic = self.prefix + topic
+        if subscriber is not None:
+            self.index.add(topic, subscriber)
+        return self.client.subscribe(topic)
+
+    def unsubscribe(self, topic, subscriber=None):
+        """
+        Removes the subscriber from the index. The MQTT server subscription
+        is only removed if no subscriber is left for the topic.
+
+        Parameters
+        ----------
+        topic : str
+            The MQTT topic filter.
+
+        subscriber : any
+            Optional: The subscriber to be removed.
+        """
+        topic = self.prefix + topic
+        if subscriber is None or self.index.remove(topic, subscriber):
+            return self.client.unsubscribe(topic)
+
+    def dispatch(self, msg):
+        """
+        Dispatches a message to all subscribers of it's topic.
+
+        Parameters
+        ----------
+        msg : MQTTMessage
+            Message from the MQTT topic.
+
+        Return
+        ------
+        count : int
+            The number of subscribers the message was dispatched to.
+        """
+        subscribers = self.index.match(msg.topic)
+        if subscribers and self.prefix:
+            msg = ScopedMessage(msg, msg.topic[len(self.prefix):])
+        for subscriber in subscribers:
+            # A previous subscriber may have disposed this one
+            if self.index.contains(subscriber):
+                subscriber.on_message(msg)
+        return len(subscribers)
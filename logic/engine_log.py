@@ -0,0 +1,186 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from enum import Enum
+
+
+ROOT_LOGGER = "engine"
+WORKFLOW_LOGGER = ROOT_LOGGER + ".workflow"
+# Record attributes which are written as fields of the JSON lines
+FIELDS = ("session", "workflow", "event", "state", "topic", "data")
+FORMATS = ("json", "text")
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats the log records as JSON lines:
+
+    >>> record = logging.LogRecord(
+    ...     "engine.workflow.Door", logging.INFO, __file__, 1,
+    ...     "State change to '%s'", ("SOLVED",), None)
+    >>> record.created = 1.5
+    >>> record.workflow = "Door"
+    >>> print(JsonFormatter().format(record))
+    {"ts": 1.5, "level": "INFO", "logger": "engine.workflow.Door", "msg": "State change to 'SOLVED'", "workflow": "Door"}
+    """
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value.name if isinstance(value, Enum) else value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Formats the log records as human readable lines.
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(prefix)s%(message)s")
+
+    def format(self, record):
+        names = [getattr(record, f, None) for f in ("session", "workflow")]
+        record.prefix = "".join(f"[{n}] " for n in names if n)
+        return super().format(record)
+
+
+class WorkflowLogger(logging.LoggerAdapter):
+    """
+    Logger of a workflow which adds the workflow name to the records.
+    The message is only formatted if the level is enabled.
+    """
+
+    def process(self, msg, kwargs):
+        extra = kwargs.get("extra")
+        kwargs["extra"] = {**self.extra, **extra} if extra else self.extra
+        return msg, kwargs
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler which defers the formatting to the listener thread.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            # Tracebacks must be rendered before the frames are gone
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_workflow_loggers = {}
+
+
+def _logger_name(name):
+    # Dots would split the workflow name into a logger hierarchy
+    return name.replace(".", "_")
+
+
+def get_logger(name=None):
+    """
+    Returns a logger of the engine.
+
+    Parameters
+    ----------
+    name : str
+        Optional: The name of the component, ex. "session".
+    """
+    if not name:
+        return logging.getLogger(ROOT_LOGGER)
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def get_workflow_logger(name):
+    """
+    Returns the logger of a workflow.
+
+    Parameters
+    ----------
+    name : str
+        The name of the workflow.
+    """
+    adapter = _workflow_loggers.get(name)
+    if adapter is None:
+        # The adapters are shared, every game start creates the workflows anew
+        logger = logging.getLogger(f"{WORKFLOW_LOGGER}.{_logger_name(name)}")
+        adapter = _workflow_loggers.setdefault(
+            name, WorkflowLogger(logger, {"workflow": name}))
+    return adapter
+
+
+def set_workflow_level(name, level):
+    """
+    Sets the log level of a workflow.
+
+    Parameters
+    ----------
+    name : str
+        The name of the workflow.
+
+    level : str, int
+        The log level, ex. "DEBUG".
+    """
+    logging.getLogger(f"{WORKFLOW_LOGGER}.{_logger_name(name)}").setLevel(level)
+
+
+def setup(level="INFO", log_format="json", stream=None, workflow_levels=None):
+    """
+    Sets up the logging of the engine. The records are put into a queue
+    and written by a background thread, so a slow stdout (ex. journald)
+    doesn't block the MQTT and timer callbacks.
+
+    Parameters
+    ----------
+    level : str, int
+        The log level of the engine.
+
+    log_format : str
+        The output format: "json" (JSON lines) or "text".
+
+    stream : TextIO
+        Optional: The output stream (default: stdout).
+
+    workflow_levels : dict
+        Optional: The log levels of single workflows by name.
+    """
+    global _listener
+    shutdown()
+    formatter = JsonFormatter() if log_format == "json" else TextFormatter()
+    output = logging.StreamHandler(stream if stream is not None else sys.stdout)
+    output.setFormatter(formatter)
+    records = queue.SimpleQueue()
+    logger = get_logger()
+    logger.handlers = [_QueueHandler(records)]
+    logger.setLevel(level)
+    logger.propagate = False
+    for name, workflow_level in (workflow_levels or {}).items():
+        set_workflow_level(name, workflow_level)
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+
+
+@atexit.register
+def shutdown():
+    """
+    Writes the pending records and stops the background thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,151 @@
+import json
+import os
+from engine_log import get_logger
+
+
+log = get_logger("journal")
+
+
+class GameJournal:
+    """
+    The game journal persists the state of a running game, so it can be
+    resumed after a restart of the engine. The journal is an append-only
+    file of JSON lines: a full snapshot followed by deltas. After a number
+    of deltas the journal is compacted to a single snapshot again.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "game.journal")
+    >>> journal = GameJournal(path, compact_after=2)
+    >>> journal.write_snapshot({'elapsed': 0, 'nodes': [{'s': 1}, {'s': 0}]})
+    >>> journal.append({'elapsed': 5, 'nodes': {1: {'s': 1}}})
+    >>> GameJournal(path).load()
+    {'elapsed': 5, 'nodes': [{'s': 1}, {'s': 1}]}
+    >>> journal.clear()
+    >>> GameJournal(path).load() is None
+    True
+    """
+
+    def __init__(self, path, compact_after=100, fsync=False):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        path : str
+            The path of the journal file.
+
+        compact_after : int
+            The number of deltas after which the journal is compacted.
+
+        fsync : bool
+            Whether every record is synced to the disk (survives power
+            losses, but is slow on SD cards).
+        """
+        self.path = path
+        self.compact_after = compact_after
+        self.fsync = fsync
+        self.state = None
+        self._file = None
+        self._deltas = 0
+
+    def load(self):
+        """
+        Reads the journal and returns the last state of the game,
+        or None if the journal is empty.
+        """
+        state = None
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn write of the last record on a crash
+                        log.warning("Skipping invalid journal record in '%s'",
+                                    self.path)
+                        break
+                    if record.get('t') == 's':
+                        state = record['state']
+                    elif state is not None:
+                        self._merge(state, record['delta'])
+        except FileNotFoundError:
+            return None
+        self.state = state
+        return state
+
+    def write_snapshot(self, state):
+        """
+        Replaces the journal with a full snapshot of the game.
+
+        Parameters
+        ----------
+        state : dict
+            The state of the game.
+        """
+        self.close()
+        self.state = state
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            self._write(file, {'t': 's', 'state': state})
+        # The snapshot replaces the old journal atomically
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._deltas = 0
+
+    def append(self, delta):
+        """
+        Appends the changes of the game state to the journal.
+
+        Parameters
+        ----------
+        delta : dict
+            The changed values; "nodes" maps the indices of the changed
+            workflows to their new state.
+        """
+        if self.state is None:
+            return
+        self._merge(self.state, delta)
+        self._deltas += 1
+        if self._deltas >= self.compact_after:
+            self.write_snapshot(self.state)
+        else:
+            if self._file is None:
+                # The journal was loaded from an earlier run
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._write(self._file, {'t': 'd', 'delta': delta})
+
+    def clear(self):
+        """
+        Removes the journal, ex. when the game is stopped.
+        """
+        self.close()
+        self.state = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        """
+        Closes the journal file.
+        """
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _write(self, file, record):
+        file.write(json.dumps(record, separators=(',', ':')) + "\n")
+        file.flush()
+        if self.fsync:
+            os.fsync(file.fileno())
+
+    @staticmethod
+    def _merge(state, delta):
+        for key, value in delta.items():
+            if key == 'nodes':
+                nodes = state['nodes']
+                for index, node in value.items():
+                    nodes[int(index)] = node
+            else:
+                state[key] = value
@@ -0,0 +1,437 @@
+import json
+import time
+from workflow import SequenceWorkflow, StatusTable, WorkflowIndex
+from workflow_extras import LightControlWorkflow, TTSAudioWorkflow
+from message import State
+from util import Location
+from game_timer import GameTimer
+from engine_client import EngineClient
+from workflow_graph import WorkflowGraph
+from topic_purge import RetainedPurge
+from engine_log import get_logger
+from enum import Enum
+
+
+log = get_logger("session")
+
+
+class GameState(Enum):
+    STOPPED = 0
+    STARTED = 1
+    PAUSED = 2
+
+
+class GameSession:
+    """
+    A game session hosts one game: it's workflow tree, game timer and
+    game state. All topics of the session are prefixed by the topic prefix
+    of the session, so several games can share one MQTT connection.
+    """
+
+    def __init__(self, mqtt_url, workflow_factory, client, index, timers,
+                 publisher, prefix="", journal=None, acks=None, messages=None):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        mqtt_url : str
+            The url of the MQTT server.
+
+        workflow_factory : WorkflowFactory
+            A factory which creates the workflow structure defining
+            the sequence of their execution.
+
+        client : Client
+            The shared MQTT client.
+
+        index : TopicIndex
+            The shared topic index of the workflows.
+
+        timers : TimerService
+            The shared timer service.
+
+        publisher : Publisher
+            The client publishing the game time.
+
+        prefix : str
+            The topic prefix of the session, ex. "room1/"
+            (default: no prefix).
+
+        journal : GameJournal
+            Optional: The journal persisting the game state.
+
+        acks : PublishTracker
+            Optional: The shared tracker of the acknowledgements of the
+            published messages.
+
+        messages : MessageJournal
+            Optional: The shared journal recording the messages and the
+            workflow transitions of the games.
+        """
+        self.mqtt_url = mqtt_url
+        self.workflow_factory = workflow_factory
+        # Rejects duplicate workflow names before the first game
+        WorkflowIndex(SequenceWorkflow("Main workflow", workflow_factory.create(None)))
+        self.client = client
+        self.prefix = prefix
+        self.game_control_topic = prefix + "op/gameControl"
+        self.game_timer_topic = prefix + "op/gameTime"
+        self.game_state_topic = prefix + "op/gameState"
+        self.game_state_delta_topic = prefix + "op/gameState/delta"
+        self.game_option_topic = prefix + "op/gameOptions"
+        self.options = None
+        self.last_graph_config = None
+        self.game_graph = None
+        self.game_state = GameState.STOPPED
+        self.main_sequence = None
+        self.status = None
+        self.workflow_index = None
+        self.journal = journal
+        self._workflows = []
+        self._journal_nodes = None
+        self._journal_dirty = set()
+        self.messages = messages
+        self._recorded_states = None
+        self.workflow_client = EngineClient(
+            client, index, timers, prefix, acks)
+        self.game_timer = GameTimer(
+            mqtt_url, self.game_timer_topic, timers=timers,
+            publisher=publisher)
+        self.game_timer.register_on_expired(self.__on_game_time_expired)
+        self.purge = RetainedPurge(
+            client, timers, prefix + "#",
+            exclude=(self.game_control_topic, self.game_option_topic))
+        self._start_pending = False
+
+    @property
+    def name(self):
+        """
+        Returns the name of the session (the prefix without separator).
+        """
+        return self.prefix.rstrip("/") or "default"
+
+    def subscribe(self):
+        """
+        Subscribes to the game control topics of the session.
+        """
+        self.client.subscribe(self.game_control_topic)
+        self.client.subscribe(self.game_option_topic)
+
+    def on_message(self, msg):
+        """
+        Handles a message of the session.
+
+        Parameters
+        ----------
+        msg : MQTTMessage
+            Message from the MQTT topic.
+
+        Return
+        ------
+        handled : bool
+            False if no active workflow is interested in the message.
+        """
+        if self.purge.collect(msg):
+            # Retained messages which are purged aren't dispatched
+            return False
+        if msg.topic == self.game_control_topic:
+            self.__handle_command(msg)
+        elif msg.topic == self.game_option_topic:
+            self.__save_options(msg)
+        elif not self.workflow_client.dispatch(msg):
+            return False
+        return True
+
+    def start(self):
+        """
+        Starts the main workflow. The retained topics are purged before,
+        the workflow is executed when the purge is done.
+        """
+        if self.game_state != GameState.STARTED and not self._start_pending:
+            self._start_pending = True
+            self.__purge_all_topics(self.__on_topics_purged)
+
+    def resume(self):
+        """
+        Resumes the game persisted in the journal, ex. after a restart of
+        the engine. The workflows continue in their last state without
+        executing the init workflows or purging the topics again.
+
+        Return
+        ------
+        resumed : bool
+            True, if a started or paused game was resumed.
+        """
+        state = self.journal.load() if self.journal else None
+        if not state or state['game_state'] == GameState.STOPPED.name:
+            return False
+
+        self.options = state['options']
+        self.__create_workflow()
+        if [w.name for w in self._workflows] != state['names']:
+            log.warning("The journal doesn't match the workflow definition, "
+                        "the game isn't resumed.", extra=self.__extra())
+            self.main_sequence = None
+            self.workflow_index = None
+            self.game_graph = None
+            self.journal.clear()
+            return False
+
+        for workflow, data in zip(self._workflows, state['nodes']):
+            workflow.restore(data)
+        # The graph is rebuilt with the restored states
+        self.game_graph.rebuild()
+        self.main_sequence.resume(self.workflow_client)
+
+        elapsed = state['elapsed']
+        game_state = GameState[state['game_state']]
+        if game_state == GameState.STARTED:
+            # The game went on while the engine was down
+            elapsed += max(time.time() - state['wall'], 0)
+        self.game_timer.set_duration(self.options["duration"])
+        self.game_timer.set_elapsed(elapsed)
+        if game_state == GameState.STARTED:
+            self.game_timer.start()
+        self.game_state = game_state
+        self._journal_nodes = state['nodes']
+        self.__append_journal(True)
+        self.__begin_game(True)
+        log.info("Main workflow resumed at %.1fs...", elapsed,
+                 extra=self.__extra("game_state", self.game_state))
+        return True
+
+    def stop(self):
+        """
+        Stops the main workflow.
+        """
+        # A start waiting for the purge is cancelled
+        self._start_pending = False
+        if self.game_state != GameState.STOPPED:
+            self.__end_game("STOPPED")
+            self.game_timer.stop()
+            self.main_sequence.dispose(self.workflow_client)
+            self.game_state = GameState.STOPPED
+            if self.journal:
+                self.journal.clear()
+            self._journal_nodes = None
+            self.__purge_all_topics()
+            log.info("Main workflow stopped...",
+                     extra=self.__extra("game_state", self.game_state))
+
+    def reset(self):
+        """
+        Resets the main workflow
+        """
+        self.stop()
+        self.start()
+
+    def pause(self):
+        """
+        Pauses the main workflow.
+        """
+        # A stopped game isn't paused (ex. a late PAUSE after the game end)
+        if self.game_state == GameState.STARTED:
+            self.game_timer.pause()
+            self.game_state = GameState.PAUSED
+            self.__append_journal()
+            log.info("Main workflow paused...",
+                     extra=self.__extra("game_state", self.game_state))
+
+    def skip(self, workflow_name):
+        """
+        Skip the workflow with a given name.
+        """
+        if self.workflow_index is None:
+            log.warning("No game started, '%s' isn't skipped.", workflow_name,
+                        extra=self.__extra())
+        elif self.workflow_index.skip(workflow_name) is None:
+            log.warning("Unknown workflow '%s' isn't skipped.", workflow_name,
+                        extra=self.__extra())
+
+    def publish_game_state(self):
+        if self.game_graph:
+            # The graph returns the same object as long as nothing changed
+            config = self.game_graph.to_json()
+            if config is not self.last_graph_config:
+                delta = self.game_graph.pop_delta()
+                if delta:
+                    self.client.publish(
+                        self.game_state_delta_topic, delta, 0, False)
+                self.client.publish(self.game_state_topic, config, 0, True)
+                self.last_graph_config = config
+        # Not every transition changes the graph (ex. combined workflows)
+        self.__append_journal()
+        if self.messages is not None:
+            self.__record_transitions()
+            self.messages.flush()
+
+    def __on_topics_purged(self):
+        if self._start_pending:
+            self._start_pending = False
+            if self.game_state == GameState.STOPPED:
+                self.__create_workflow()
+                self.__begin_game()
+                self.main_sequence.execute(self.workflow_client)
+            log.info("Starting game timer...", extra=self.__extra())
+            self.game_timer.set_duration(self.options["duration"])
+            self.game_timer.start()
+            self.game_state = GameState.STARTED
+            self.__write_journal()
+            log.info("Main workflow started...",
+                     extra=self.__extra("game_state", self.game_state))
+
+    def __create_workflow(self):
+        workflow = self.workflow_factory.create(self.options)
+        self.main_sequence = SequenceWorkflow("Main workflow", workflow)
+        self.main_sequence.highlight = True
+        self.main_sequence.register_on_finished(self.__on_workflow_solved)
+        self.workflow_index = WorkflowIndex(self.main_sequence)
+        skip_to = self.options.get('skipTo') if self.options else None
+        if skip_to and self.workflow_index.skip_to(skip_to) is None:
+            log.warning("Unknown workflow '%s' to skip to.", skip_to,
+                        extra=self.__extra())
+        # The states of the workflows are kept in one table per game
+        self.status = StatusTable(self.main_sequence)
+        self.game_graph = WorkflowGraph(self.main_sequence)
+        self.game_graph.register_on_changed(self.__on_workflow_changed)
+        self._workflows = self.status.workflows
+        self._journal_dirty.clear()
+
+    def __begin_game(self, resumed=False):
+        """
+        Starts the records of the game in the message journal.
+        """
+        if self.messages is None:
+            return
+        self.workflow_client.game = self.messages.begin_game(
+            self.name, self.options, resumed)
+        # The first record of the transitions holds all states
+        self._recorded_states = bytes(len(self._workflows))
+
+    def __end_game(self, outcome):
+        """
+        Ends the records of the game in the message journal.
+        """
+        if self.messages is None or not self.workflow_client.game:
+            return
+        self.__record_transitions()
+        self.messages.end_game(self.workflow_client.game, outcome)
+        self.workflow_client.game = 0
+
+    def __record_transitions(self):
+        """
+        Records the workflows changed since the last record.
+        """
+        game = self.workflow_client.game
+        if not game or self.status is None:
+            return
+        states = self.status.states
+        if states == self._recorded_states:
+            return
+        for index, (state, last) in enumerate(
+                zip(states, self._recorded_states)):
+            if state != last:
+                self.messages.transition(
+                    game, self._workflows[index].name, state)
+        self._recorded_states = bytes(states)
+
+    def __on_workflow_changed(self, workflow):
+        self._journal_dirty.add(workflow._index)
+
+    def __write_journal(self):
+        """
+        Writes a full snapshot of the game to the journal.
+        """
+        if not self.journal:
+            return
+        self._journal_dirty.clear()
+        self._journal_nodes = [w.snapshot() for w in self._workflows]
+        self.journal.write_snapshot({
+            'options': self.options,
+            'game_state': self.game_state.name,
+            'elapsed': self.game_timer.elapsed(),
+            'wall': time.time(),
+            'names': [w.name for w in self._workflows],
+            'nodes': self._journal_nodes,
+        })
+
+    def __append_journal(self, force=False):
+        """
+        Appends the workflows changed since the last record to the journal.
+        Only the workflows which reported a change (and their parents) are
+        compared with the last record.
+        """
+        if not self.journal or self._journal_nodes is None:
+            return
+        dirty = self._journal_dirty
+        game_state = self.journal.state['game_state']
+        if not dirty and not force and game_state == self.game_state.name:
+            return
+        # The parents keep the progress of their children (ex. the position
+        # of a sequence), which changes without a change of their state
+        parents = self.workflow_index.parents
+        dirty.update([parents[i] for i in dirty if parents[i] >= 0])
+        changed = {}
+        for index in dirty:
+            node = self._workflows[index].snapshot()
+            if node != self._journal_nodes[index]:
+                self._journal_nodes[index] = node
+                changed[index] = node
+        dirty.clear()
+        if not changed and not force and game_state == self.game_state.name:
+            return
+        self.journal.append({
+            'game_state': self.game_state.name,
+            'elapsed': self.game_timer.elapsed(),
+            'wall': time.time(),
+            'nodes': changed,
+        })
+
+    def __handle_command(self, msg):
+        message = msg.payload.decode("utf-8").upper()
+        if message == "START":
+            self.start()
+        elif message == "STOP":
+            self.stop()
+        elif message == "PAUSE":
+            self.pause()
+        elif message.startswith("SKIP "):
+            workflow_name = message[5:].strip()
+            self.skip(workflow_name)
+        elif message == '':
+            pass
+        else:
+            log.warning("The game command '%s' is not supported.", message,
+                        extra=self.__extra())
+
+    def __save_options(self, msg):
+        message = msg.payload.decode("utf-8")
+        self.options = json.loads(message)
+
+    def __on_game_time_expired(self):
+        log.info("Game time expired!", extra=self.__extra("game_over", "FAILED"))
+        lwf = LightControlWorkflow(Location.SERVERROOM, State.ON, 255, (255, 0, 0))
+        lwf.execute(self.workflow_client)
+        lwf = LightControlWorkflow(Location.MAINROOM, State.ON, 255, (255, 0, 0))
+        lwf.execute(self.workflow_client)
+        awf = TTSAudioWorkflow("Play gameover", "gameover.mp3", True)
+        awf.execute(self.workflow_client)
+        self.__game_over("FAILED")
+
+    def __on_workflow_solved(self, name):
+        log.info("Escape room finished successfully!",
+                 extra=self.__extra("game_over", "SOLVED"))
+        self.__game_over("SOLVED")
+
+    def __game_over(self, outcome):
+        self.client.publish(self.game_control_topic, outcome, 2, True)
+        self.__end_game(outcome)
+        self.stop()
+
+    def __extra(self, event=None, state=None):
+        return {"session": self.name, "event": event, "state": state}
+
+    def __purge_all_topics(self, on_done=None):
+        log.info("Purges all topics", extra=self.__extra())
+        self.purge.start(on_done)
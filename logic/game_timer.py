@@ -1,5 +1,7 @@
 import threading
-import paho.mqtt.client as mqtt
+from timer_service import TimerService
+from publisher import get_publisher
+from metrics import registry as metrics
 from datetime import timedelta
 from enum import Enum
 
@@ -13,9 +15,13 @@ class TimerState(Enum):
 class GameTimer:
     """
     The game timer periodicaly updates the game time of a given topic.
+    The game time is measured from a monotonic clock anchor, so it doesn't
+    drift with the scheduling latency of the ticks. The ticks and the
+    expiry are scheduled on a timer service.
     """
 
-    def __init__(self, mqtt_url, topic, interval=1.0):
+    def __init__(self, mqtt_url, topic, interval=1.0,
+                 timers=None, publisher=None):
         """
         Initializes a new instance of this class.
 
@@ -29,13 +35,30 @@ class GameTimer:
 
         interval: float
             The intervall the game time is refreshed.
+
+        timers : TimerService
+            Optional: The timer service scheduling the ticks.
+
+        publisher : Publisher
+            Optional: The client publishing the game time
+            (default: the shared publisher of the MQTT server).
         """
-        self.client = None
+        self.timers = timers if timers is not None else TimerService()
+        self.publisher = publisher
+        if self.publisher is None:
+            self.publisher = get_publisher(mqtt_url)
         self.mqtt_url = mqtt_url
         self.topic = topic
         self.game_time_sec = 0
+        self.game_duration_in_sec = 0
         self.interval = interval
         self.timer_state = TimerState.STOPPED
+        self._on_time_expired = None
+        self._elapsed_offset = 0.0
+        self._anchor = 0.0
+        self._tick = -1
+        self._timer = None
+        self._lock = threading.RLock()
 
     def set_duration(self, duration_in_minutes):
         """
@@ -46,37 +69,69 @@ class GameTimer:
         duration_in_minutes : number
             The game time in duration.
         """
-        self.game_duration_in_sec = duration_in_minutes * 60
+        with self._lock:
+            self.game_duration_in_sec = duration_in_minutes * 60
+            if self.timer_state == TimerState.STARTED:
+                self.__schedule()
+
+    def set_elapsed(self, elapsed_sec):
+        """
+        Sets the elapsed game time of a stopped or paused timer,
+        ex. to resume a game. The timer continues with start().
+
+        Parameters
+        ----------
+        elapsed_sec : float
+            The elapsed game time in seconds.
+        """
+        with self._lock:
+            if self.timer_state == TimerState.STARTED:
+                self.__cancel()
+            self._elapsed_offset = elapsed_sec
+            self._tick = -1
+            self.game_time_sec = int(elapsed_sec // self.interval) * self.interval
+            self.timer_state = TimerState.PAUSED
+
+    def elapsed(self):
+        """
+        Returns the elapsed game time in seconds (without pauses).
+        """
+        with self._lock:
+            return self._elapsed()
 
     def start(self):
         """
-        Starts the game timer.
+        Starts or resumes the game timer.
         """
-        if self.timer_state != TimerState.STARTED:
-            if self.timer_state == TimerState.STOPPED:
-                self.client = mqtt.Client()
-                self.client.connect(self.mqtt_url)
-                self.client.loop_start()
-            self.timer_state = TimerState.STARTED
-            self.publish_game_time()
+        with self._lock:
+            if self.timer_state != TimerState.STARTED:
+                if self.timer_state == TimerState.STOPPED:
+                    self._elapsed_offset = 0.0
+                    self._tick = -1
+                self._anchor = self.timers.clock()
+                self.timer_state = TimerState.STARTED
+                self.__schedule(0)
 
     def stop(self):
         """
         Stops the game timer.
         """
-        if self.timer_state != TimerState.STOPPED:
-            self.timer.cancel()
-            self.client.loop_stop()
-            self.game_time_sec = 0
-            self.timer_state = TimerState.STOPPED
+        with self._lock:
+            if self.timer_state != TimerState.STOPPED:
+                self.__cancel()
+                self.game_time_sec = 0
+                self._elapsed_offset = 0.0
+                self.timer_state = TimerState.STOPPED
 
     def pause(self):
         """
         Pauses the game timer
         """
-        if self.timer_state != TimerState.PAUSED:
-            self.timer.cancel()
-            self.timer_state = TimerState.PAUSED
+        with self._lock:
+            if self.timer_state == TimerState.STARTED:
+                self.__cancel()
+                self._elapsed_offset = self._elapsed()
+                self.timer_state = TimerState.PAUSED
 
     def register_on_expired(self, func):
         """
@@ -93,15 +148,61 @@ class GameTimer:
         """
         Publishes the game time to the specified MQTT topic.
         """
-        self.game_time_sec += self.interval
-        if self.game_time_sec >= self.game_duration_in_sec:
-            self._on_time_expired()
-        else:
-            self.timer = threading.Timer(self.interval, self.publish_game_time)
-            self.timer.start()
-            formatted_game_time = str(timedelta(seconds=self.game_time_sec))
-            formatted_game_time_remain = str(timedelta(seconds=( self.game_duration_in_sec - self.game_time_sec)))
-            self.client.publish(self.topic + "_in_sec", self.game_time_sec)
-            self.client.publish(self.topic + "_remain_in_sec", self.game_duration_in_sec - self.game_time_sec)
-            self.client.publish(self.topic + "_formatted", formatted_game_time)
-            self.client.publish(self.topic + "_remain_formatted", formatted_game_time_remain)
+        game_time_remain = self.game_duration_in_sec - self.game_time_sec
+        formatted_game_time = str(timedelta(seconds=self.game_time_sec))
+        formatted_game_time_remain = str(timedelta(seconds=game_time_remain))
+        self.publisher.publish(self.topic + "_in_sec", self.game_time_sec)
+        self.publisher.publish(self.topic + "_remain_in_sec", game_time_remain)
+        self.publisher.publish(self.topic + "_formatted", formatted_game_time)
+        self.publisher.publish(self.topic + "_remain_formatted", formatted_game_time_remain)
+
+    def _elapsed(self):
+        elapsed = self._elapsed_offset
+        if self.timer_state == TimerState.STARTED:
+            elapsed += self.timers.clock() - self._anchor
+        return elapsed
+
+    def __cancel(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def __schedule(self, delay=None):
+        """
+        Schedules the next interval boundary or the expiry,
+        whatever comes first.
+        """
+        self.__cancel()
+        if delay is None:
+            elapsed = self._elapsed()
+            next_tick = (int(elapsed // self.interval) + 1) * self.interval
+            deadline = min(next_tick, self.game_duration_in_sec)
+            delay = max(deadline - elapsed, 0)
+        self._timer = self.timers.schedule(delay, self.__on_timer)
+
+    def __on_timer(self):
+        expired = False
+        with self._lock:
+            if self.timer_state != TimerState.STARTED:
+                return
+            if self._timer:
+                metrics.timer_drift.observe(
+                    max(self.timers.clock() - self._timer.deadline, 0))
+            self._timer = None
+            elapsed = self._elapsed()
+            if elapsed >= self.game_duration_in_sec:
+                expired = True
+            else:
+                tick = int(elapsed // self.interval)
+                publish = tick > self._tick
+                if publish:
+                    self._tick = tick
+                    self.game_time_sec = tick * self.interval
+                self.__schedule()
+
+        # Callbacks are executed outside the lock, they may stop the timer
+        if expired:
+            if self._on_time_expired:
+                self._on_time_expired()
+        elif publish:
+            self.publish_game_time()
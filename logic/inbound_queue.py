@@ -0,0 +1,239 @@
+import collections
+import threading
+from topic_index import topic_matches
+from engine_log import get_logger
+from metrics import registry as metrics
+
+
+log = get_logger("inbound")
+
+# Topics where only the latest value matters
+DEFAULT_COALESCE = ("op/gameTime_in_sec", "5/battery/1/level")
+
+
+class InboundQueue:
+    """
+    The inbound queue decouples the network thread of the MQTT client from
+    the workflows. Received messages are queued and handled by a worker
+    thread, so the network thread keeps the broker link alive even if a
+    flapping device floods a topic.
+
+    The queue is bounded: if it's full, new messages are shed unless they
+    are routed to an active workflow or reserved (ex. the game control),
+    events of the game are never lost. For the coalesced topics only the
+    latest message is kept, it replaces a pending message of the same topic
+    at it's position in the queue; they are shed if the queue is full.
+
+    >>> from types import SimpleNamespace as Msg
+    >>> log.disabled = True
+    >>> handled = []
+    >>> queue = InboundQueue(lambda msg, arrival: handled.append(msg.payload),
+    ...                      maxsize=2, coalesce=["op/gameTime_in_sec"],
+    ...                      routed=lambda topic: topic == "1/cube/state")
+    >>> for payload in (b"1", b"2", b"3"):
+    ...     _ = queue.put(Msg(topic="op/gameTime_in_sec", payload=payload), 0)
+    >>> queue.put(Msg(topic="5/noise", payload=b"a"), 0)
+    True
+    >>> queue.put(Msg(topic="5/noise", payload=b"b"), 0)
+    False
+    >>> queue.put(Msg(topic="1/cube/state", payload=b"c"), 0)
+    True
+    >>> queue.drain()
+    3
+    >>> handled, queue.coalesced, queue.dropped
+    ([b'3', b'a', b'c'], 2, 1)
+    >>> log.disabled = False
+    """
+
+    def __init__(self, handler, maxsize=1000, coalesce=(), reserved=(),
+                 batch=100, cache_size=1024, routed=None):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        handler : Function
+            Handler function of the messages: handler(msg, arrival)
+
+        maxsize : int
+            The maximum number of queued messages.
+
+        coalesce : str[]
+            Topic filters of the topics where only the latest message is
+            handled.
+
+        reserved : str[]
+            Topics which are queued even if the queue is full.
+
+        batch : int
+            The maximum number of messages handled by one drain() call.
+
+        cache_size : int
+            Maximum number of topics kept in the cache of the coalesced
+            topic filter matches.
+
+        routed : Function
+            Optional: Function checking whether a topic is routed to an
+            active workflow: routed(topic). It's only called if the queue
+            is full, the messages of these topics are queued anyway.
+        """
+        self.handler = handler
+        self.maxsize = maxsize
+        self.batch = batch
+        self.cache_size = cache_size
+        self.routed = routed
+        self.received = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.high_water = 0
+        self._queue = collections.deque()
+        self._latest = {}
+        self._coalesce = list(coalesce)
+        self._reserved = frozenset(reserved)
+        self._is_coalesced = {}
+        self._overflow = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def __len__(self):
+        return len(self._queue)
+
+    def configure(self, coalesce=None, reserved=None):
+        """
+        Replaces the coalesced topic filters or the reserved topics,
+        ex. when a game session is added.
+        """
+        with self._condition:
+            if coalesce is not None:
+                self._coalesce = list(coalesce)
+                self._is_coalesced.clear()
+            if reserved is not None:
+                self._reserved = frozenset(reserved)
+
+    def put(self, msg, arrival):
+        """
+        Queues a received message.
+
+        Parameters
+        ----------
+        msg : MQTTMessage
+            Message from the MQTT topic.
+
+        arrival : float
+            The time the message was received (time.perf_counter()).
+
+        Return
+        ------
+        queued : bool
+            False, if the message was dropped.
+        """
+        topic = msg.topic
+        with self._condition:
+            self.received += 1
+            coalesced = self._is_coalesced.get(topic)
+            if coalesced is None:
+                coalesced = any(
+                    topic_matches(f, topic) for f in self._coalesce)
+                if len(self._is_coalesced) >= self.cache_size:
+                    self._is_coalesced.clear()
+                self._is_coalesced[topic] = coalesced
+            if coalesced and topic in self._latest:
+                self._latest[topic] = (msg, arrival)
+                self.coalesced += 1
+                metrics.inbound_coalesced.inc(topic)
+                return True
+            full = len(self._queue) >= self.maxsize and \
+                topic not in self._reserved
+        # The routing is checked without holding the queue, it may wait
+        # for the workflows
+        if full and (coalesced or not self.routed or not self.routed(topic)):
+            with self._condition:
+                self.dropped += 1
+                metrics.inbound_dropped.inc(topic)
+                if not self._overflow:
+                    log.warning("Inbound queue full (%d), dropping messages "
+                                "(ex. '%s')", self.maxsize, topic)
+                self._overflow += 1
+            return False
+        with self._condition:
+            if coalesced:
+                # The queue keeps the position, the latest message the value
+                if topic not in self._latest:
+                    self._queue.append((topic, None, None))
+                self._latest[topic] = (msg, arrival)
+            else:
+                self._queue.append((topic, msg, arrival))
+            if len(self._queue) > self.high_water:
+                self.high_water = len(self._queue)
+            self._condition.notify()
+        self._notify()
+        return True
+
+    def drain(self):
+        """
+        Handles the queued messages (at most "batch" messages).
+
+        Return
+        ------
+        count : int
+            The number of handled messages.
+        """
+        count = 0
+        while count < self.batch:
+            with self._condition:
+                if not self._queue:
+                    if self._overflow:
+                        log.info("Inbound queue recovered, %d messages "
+                                 "were dropped", self._overflow)
+                        self._overflow = 0
+                    break
+                topic, msg, arrival = self._queue.popleft()
+                if msg is None:
+                    msg, arrival = self._latest.pop(topic)
+            try:
+                self.handler(msg, arrival)
+            except Exception:
+                log.exception("Handling a message of '%s' failed", topic)
+            count += 1
+        return count
+
+    def start(self):
+        """
+        Starts the worker thread handling the messages.
+        """
+        with self._condition:
+            if self._thread is None:
+                self._running = True
+                self._thread = threading.Thread(
+                    target=self.__run, name="InboundQueue", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """
+        Stops the worker thread; pending messages are dropped.
+        """
+        with self._condition:
+            self._running = False
+            self._queue.clear()
+            self._latest.clear()
+            self._condition.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _notify(self):
+        """
+        Wakes up the consumer after a message was queued
+        (the worker thread is woken up by the condition).
+        """
+        pass
+
+    def __run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._queue:
+                    self._condition.wait()
+                if not self._running:
+                    return
+            self.drain()
@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
 import sys
-import signal
 import argparse
-from workflow_controller import WorkflowController
+import engine_log
+import metrics
+from workflow_controller import WorkflowController, DEFAULT_CLIENT_ID
+from runtime import RUNTIMES
+from inbound_queue import DEFAULT_COALESCE
+from message_journal import MessageJournal
+from workflow_loader import WorkflowFile, WorkflowDefinitionError, is_definition_file
 
 
 def load_workflow(module_name, class_name):
@@ -36,7 +41,7 @@ def parse_args():
 
     help_text = """
     definition of the workflow.
-    Format: "module:class".
+    Format: "module:class" or the path of a YAML/JSON definition file.
     The referenced class must implement a method "create(self, settings)"
     returning an array of BaseWorkflow.
     (default: workflow_definition:WorkflowDefinition)
@@ -47,6 +52,90 @@ def parse_args():
         "-m",
         default="127.0.0.1",
         help="IP of the MQTT server. (default: 127.0.0.1)")
+    parser.add_argument(
+        "--engine",
+        "-e",
+        choices=list(RUNTIMES),
+        default="thread",
+        help="runtime of the workflow engine: MQTT network thread and "
+             "timer thread or a single asyncio event loop. (default: thread)")
+    help_text = """
+    hosts a game session with the given topic prefix.
+    Format: "prefix" or "prefix=definition" (see --workflow_def).
+    Can be repeated to host several games in one process.
+    (default: one game without topic prefix)
+    """
+    parser.add_argument("--session", "-s", action="append", help=help_text)
+    parser.add_argument(
+        "--client_id",
+        "-c",
+        default=DEFAULT_CLIENT_ID,
+        help=f"client id of the MQTT connection. (default: {DEFAULT_CLIENT_ID})")
+    parser.add_argument(
+        "--log_level",
+        "-l",
+        default="INFO",
+        help="log level of the engine. (default: INFO)")
+    parser.add_argument(
+        "--log_format",
+        choices=engine_log.FORMATS,
+        default="json",
+        help="format of the log output: JSON lines or text. (default: json)")
+    parser.add_argument(
+        "--workflow_log_level",
+        action="append",
+        metavar="NAME=LEVEL",
+        help="log level of a single workflow, ex. \"Puzzle Door=DEBUG\". "
+             "Can be repeated.")
+    parser.add_argument(
+        "--metrics_interval",
+        type=float,
+        default=10.0,
+        help="interval in seconds the metrics are published to "
+             "\"op/metrics\", 0 disables it. (default: 10)")
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        help="port of the local HTTP endpoint exposing the metrics in the "
+             "Prometheus text format on \"/metrics\". (default: disabled)")
+    parser.add_argument(
+        "--journal_dir",
+        "-j",
+        help="directory of the game journals. If set, the game state is "
+             "persisted and a running game is resumed after a restart. "
+             "(default: disabled)")
+    parser.add_argument(
+        "--message_dir",
+        help="directory of the message journal. If set, all messages and "
+             "workflow transitions of the engine are recorded, indexed by "
+             "game (see message_journal.py and replay.py). "
+             "(default: disabled)")
+    parser.add_argument(
+        "--message_segment_mb",
+        type=float,
+        default=16,
+        help="size in MB of the segment files of the message journal. "
+             "(default: 16)")
+    parser.add_argument(
+        "--message_segments",
+        type=int,
+        help="number of segment files of the message journal which are "
+             "kept. (default: all)")
+    parser.add_argument(
+        "--inbound_queue_size",
+        type=int,
+        default=1000,
+        help="bound of the queue of received messages. If it's full, "
+             "messages are dropped unless an active workflow or the game "
+             "control waits for them. 0 handles the messages on the network "
+             "thread. (default: 1000)")
+    parser.add_argument(
+        "--coalesce",
+        action="append",
+        metavar="TOPIC",
+        help="topic filter (without session prefix) where only the latest "
+             "queued message is handled. Can be repeated. "
+             f"(default: {', '.join(DEFAULT_COALESCE)})")
     return parser.parse_args()
 
 
@@ -55,6 +144,7 @@ def shutdown(controller):
     Shutdown the programm.
     """
     controller.disconnect()
+    engine_log.shutdown()
     sys.exit(0)
 
 
@@ -62,23 +152,44 @@ if __name__ == "__main__":
     # parse command line arguments
     args = parse_args()
     mqtt_url = args.mqtt_host
+    workflow_levels = dict(
+        level.rsplit("=", 1) for level in args.workflow_log_level or [])
+    engine_log.setup(args.log_level.upper(), args.log_format,
+                     workflow_levels=workflow_levels)
 
     # get parameter to load workflow definition
-    workflow_module = "workflow_definition"
-    workflow_class = "WorkflowDefinition"
-    if args.workflow_def:
-        definition = args.workflow_def.split(":")
-        workflow_module = definition[0]
-        workflow_class = definition[1]
-
-    # load workflow to be executed
-    workflow_factory = load_workflow(workflow_module, workflow_class)
-
-    # create workflow controller with defined workflow
-    controller = WorkflowController(mqtt_url, workflow_factory)
+    workflow_def = args.workflow_def or "workflow_definition:WorkflowDefinition"
+
+    # create workflow controller hosting the game sessions
+    runtime = RUNTIMES[args.engine]()
+    messages = None
+    if args.message_dir:
+        messages = MessageJournal(
+            args.message_dir, int(args.message_segment_mb * 2**20),
+            args.message_segments)
+    controller = WorkflowController(
+        mqtt_url, runtime=runtime, client_id=args.client_id,
+        metrics_interval=args.metrics_interval,
+        journal_dir=args.journal_dir,
+        inbound_queue_size=args.inbound_queue_size,
+        coalesce=args.coalesce or DEFAULT_COALESCE,
+        messages=messages)
+    for session in args.session or [""]:
+        prefix, _, definition = session.partition("=")
+        definition = definition or workflow_def
+        # load workflow to be executed
+        if is_definition_file(definition):
+            try:
+                workflow_factory = WorkflowFile(definition)
+            except (OSError, WorkflowDefinitionError) as e:
+                sys.exit(str(e))
+        else:
+            workflow_module, workflow_class = definition.split(":")
+            workflow_factory = load_workflow(workflow_module, workflow_class)
+        controller.add_session(prefix, workflow_factory)
     controller.connect()
+    if args.metrics_port:
+        metrics.MetricsServer(metrics.registry, args.metrics_port).start()
 
     # listen to SIGINT and wait until exit request received
-    signal.signal(signal.SIGINT, lambda sig, frame: shutdown(controller))
-    print('Press Ctrl+C to exit...')
-    signal.pause()
+    runtime.run(lambda: shutdown(controller))
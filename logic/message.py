@@ -1,6 +1,20 @@
 import json
 from enum import Enum
 
+# Use the fastest available JSON decoder
+try:
+    import orjson
+    json_backend = "orjson"
+    _loads = orjson.loads
+except ImportError:
+    try:
+        import ujson
+        json_backend = "ujson"
+        _loads = ujson.loads
+    except ImportError:
+        json_backend = "json"
+        _loads = json.loads
+
 
 class Method(Enum):
     MESSAGE = 0
@@ -18,6 +32,23 @@ class State(Enum):
     NONE = 99
 
 
+def _create_lookup(enum):
+    """
+    Creates a lookup table for the names of an enum (upper and lower case).
+    """
+    lookup = {k.name: k for k in enum}
+    lookup.update({k.name.lower(): k for k in enum})
+    return lookup
+
+
+_METHODS = _create_lookup(Method)
+_STATES = _create_lookup(State)
+
+# Interned encoded messages: (method, state, type(data), data) -> bytes
+_ENCODED = {}
+_ENCODED_MAX_SIZE = 4096
+
+
 def fromJSON(text):
     """
     Creates a message object from a JSON.
@@ -34,31 +65,36 @@ def fromJSON(text):
     True
     >>> (message.method, message.state, message.data)
     (<Method.TRIGGER: 2>, <State.ON: 1>, 'INACTIVE')
+    >>> message = fromJSON('no json')
+    >>> (message.method, message.state, message.data)
+    (<Method.MESSAGE: 0>, None, 'no json')
     """
     try:
-        obj = json.loads(text)
+        obj = _loads(text)
 
         methodStr = obj.get("method")
         if not methodStr:
             raise Exception("JSON attribute 'method' is missing.")
 
-        methodStr = methodStr.upper()
-        if methodStr not in [k.name for k in Method]:
-            raise Exception(f"Method '{methodStr}' is not valid.")
+        method = _METHODS.get(methodStr)
+        if method is None:
+            method = _METHODS.get(methodStr.upper())
+            if method is None:
+                raise Exception(f"Method '{methodStr.upper()}' is not valid.")
 
         stateStr = obj.get("state")
         if not stateStr:
             raise Exception("JSON attribute 'state' is missing.")
 
-        stateStr = stateStr.upper()
-        if stateStr not in [k.name for k in State]:
-            raise Exception(f"State '{stateStr}' is not valid.")
+        state = _STATES.get(stateStr)
+        if state is None:
+            state = _STATES.get(stateStr.upper())
+            if state is None:
+                raise Exception(f"State '{stateStr.upper()}' is not valid.")
 
-        method = Method[methodStr]
-        state = State[stateStr]
         data = obj.get("data")
-    except ValueError as error:
-        print(f"Message is no valid JSON: {error}")
+    except ValueError:
+        # No valid JSON: passed as plain message
         method = Method.MESSAGE
         state = None
         data = text
@@ -66,6 +102,46 @@ def fromJSON(text):
     return Message(method, state, data)
 
 
+def fromJSON_many(texts):
+    """
+    Creates message objects from multiple JSONs.
+
+    >>> messages = fromJSON_many([
+    ...     '{"method": "status", "state": "solved"}',
+    ...     '{"method": "trigger", "state": "off"}'])
+    >>> [(m.method.name, m.state.name) for m in messages]
+    [('STATUS', 'SOLVED'), ('TRIGGER', 'OFF')]
+    """
+    return [fromJSON(text) for text in texts]
+
+
+def encode(method, state, data=None):
+    """
+    Creates the encoded JSON (bytes) of a message. Recurring messages
+    are interned, so they are serialized only once.
+
+    >>> encode(Method.TRIGGER, State.ON, "skipped")
+    b'{"method": "trigger", "state": "on", "data": "skipped"}'
+    >>> encode(Method.TRIGGER, State.OFF) is encode(Method.TRIGGER, State.OFF)
+    True
+    >>> encode(Method.MESSAGE, State.NONE, {"path": "video.mp4"})
+    b'{"method": "message", "state": "none", "data": {"path": "video.mp4"}}'
+    """
+    try:
+        key = (method, state, type(data), data)
+        payload = _ENCODED.get(key)
+    except TypeError:
+        # Unhashable data can't be interned
+        return Message(method, state, data).toJSON().encode("utf-8")
+
+    if payload is None:
+        payload = Message(method, state, data).toJSON().encode("utf-8")
+        if len(_ENCODED) >= _ENCODED_MAX_SIZE:
+            _ENCODED.clear()
+        _ENCODED[key] = payload
+    return payload
+
+
 class Message:
     """
     Represents the specified data transfer object for the communication
@@ -99,10 +175,10 @@ class Message:
 
         >>> m = Message(Method.STATUS, State.ACTIVE)
         >>> m.toJSON()
-        '{"method": "status", "state": "active", "data": null}'
-        >>> m = Message(Method.TRIGGER, State.ON)
+        '{"method": "status", "state": "active"}'
+        >>> m = Message(Method.TRIGGER, State.ON, "INACTIVE")
         >>> m.toJSON()
-        '{"method": "trigger", "state": "on", "data": null}'
+        '{"method": "trigger", "state": "on", "data": "INACTIVE"}'
         """
         if self.data:
             result = json.dumps({
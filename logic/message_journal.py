@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import json
+import os
+import re
+import struct
+import threading
+import time
+from enum import IntEnum
+from engine_log import get_logger
+
+
+log = get_logger("messages")
+
+INDEX_FILE = "index.jsonl"
+SEGMENT_SUFFIX = ".mj"
+# Magic, version, wall time and monotonic time of the segment start
+_SEGMENT_HEADER = struct.Struct("<4sBdd")
+_MAGIC = b"UEMJ"
+_VERSION = 1
+# Length of the rest of the record, kind, monotonic time, game,
+# length of the topic, flags (QoS, retain, purged)
+_RECORD_HEADER = struct.Struct("<IBdIHB")
+_LENGTH = struct.Struct("<I")
+_RETAIN = 0x04
+_PURGED = 0x08
+
+
+class RecordKind(IntEnum):
+    INBOUND = 1
+    OUTBOUND = 2
+    TRANSITION = 3
+    BEGIN = 4
+    END = 5
+
+
+Record = collections.namedtuple(
+    "Record", ("kind", "time", "game", "topic", "payload", "qos", "retain",
+               "purged"))
+
+
+def _encode(payload):
+    """
+    Converts a payload to bytes like paho does.
+    """
+    if payload is None:
+        return b""
+    if isinstance(payload, str):
+        return payload.encode("utf-8")
+    if isinstance(payload, (bytes, bytearray)):
+        return bytes(payload)
+    return str(payload).encode("ascii")
+
+
+class MessageJournal:
+    """
+    The message journal records the traffic of the engine: every inbound
+    and outbound message and the workflow transitions, tagged with the
+    game they belong to (0: no game running). The records are appended
+    length-prefixed to binary segment files, which are rotated by size.
+    An index (JSON lines) keeps the position of the begin and the end of
+    every game, so a game is read without scanning the other segments.
+
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> journal = MessageJournal(directory, segment_size=100)
+    >>> game = journal.begin_game("default", options={"duration": 60})
+    >>> journal.inbound(game, "1/cube/state", b'{"state": "solved"}')
+    >>> journal.transition(game, "Panels Released", 2)
+    >>> journal.outbound(game, "op/gameControl", "SOLVED", 2, True)
+    >>> journal.end_game(game, "SOLVED")
+    >>> journal.close()
+    >>> games = read_index(directory)
+    >>> games[game]["session"], games[game]["outcome"]
+    ('default', 'SOLVED')
+    >>> [r.kind.name for r in read_records(directory, game)]
+    ['BEGIN', 'INBOUND', 'TRANSITION', 'OUTBOUND', 'END']
+    >>> len(segment_paths(directory)) > 1
+    True
+    """
+
+    def __init__(self, directory, segment_size=16 * 2**20, max_segments=None,
+                 clock=time.monotonic):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        directory : str
+            The directory of the segments and the index.
+
+        segment_size : int
+            The size in bytes after which a new segment is started.
+
+        max_segments : int
+            Optional: The number of segments which are kept, older ones are
+            removed.
+
+        clock : Function
+            The monotonic clock returning the time in seconds.
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.clock = clock
+        os.makedirs(directory, exist_ok=True)
+        games = read_index(directory)
+        self._next_game = max(games, default=0) + 1
+        segments = segment_paths(directory)
+        # Every run starts a new segment, a torn tail is never appended to
+        self._segment = _segment_number(segments[-1]) if segments else 0
+        self._file = None
+        self._size = 0
+        self._index = open(os.path.join(directory, INDEX_FILE), "a",
+                           encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def begin_game(self, session, options=None, resumed=False):
+        """
+        Starts the records of a new game.
+
+        Parameters
+        ----------
+        session : str
+            The name of the game session.
+
+        options : dict
+            The game options.
+
+        resumed : bool
+            True, if the game was resumed after a restart of the engine.
+
+        Return
+        ------
+        game : int
+            The ID of the game, which is unique in the journal directory.
+        """
+        with self._lock:
+            game = self._next_game
+            self._next_game += 1
+            info = {"session": session, "options": options,
+                    "resumed": resumed, "wall": time.time()}
+            segment, offset = self.__write(
+                RecordKind.BEGIN, game, session, json.dumps(info).encode())
+            self.__index({"game": game, "session": session,
+                          "segment": segment, "offset": offset,
+                          "time": self.clock(), "wall": info["wall"],
+                          "resumed": resumed})
+        return game
+
+    def end_game(self, game, outcome):
+        """
+        Ends the records of a game.
+
+        Parameters
+        ----------
+        game : int
+            The ID of the game.
+
+        outcome : str
+            The outcome of the game, ex. "SOLVED", "FAILED" or "STOPPED".
+        """
+        with self._lock:
+            segment, offset = self.__write(
+                RecordKind.END, game, "", outcome.encode())
+            self.__index({"game": game, "outcome": outcome,
+                          "end_segment": segment, "end_offset": offset,
+                          "end_time": self.clock(), "end_wall": time.time()})
+            self._file.flush()
+
+    def inbound(self, game, topic, payload, qos=0, retain=False,
+                purged=False):
+        """
+        Records a received message; "purged" marks a retained message
+        which was collected by the purge of the topics, not handled.
+        """
+        with self._lock:
+            self.__write(RecordKind.INBOUND, game, topic, _encode(payload),
+                         qos | (_PURGED if purged else 0), retain)
+
+    def outbound(self, game, topic, payload, qos=0, retain=False):
+        """
+        Records a published message.
+        """
+        with self._lock:
+            self.__write(RecordKind.OUTBOUND, game, topic, _encode(payload),
+                         qos, retain)
+
+    def transition(self, game, workflow, state):
+        """
+        Records the new state (WorkflowState value) of a workflow.
+        """
+        with self._lock:
+            self.__write(RecordKind.TRANSITION, game, workflow, bytes((state,)))
+
+    def flush(self):
+        """
+        Writes the buffered records to the segment file.
+        """
+        with self._lock:
+            if self._file:
+                self._file.flush()
+
+    def close(self):
+        """
+        Closes the segment and the index.
+        """
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+            self._index.close()
+
+    def __write(self, kind, game, topic, payload, qos=0, retain=False):
+        if self._file is None or self._size >= self.segment_size:
+            self.__rotate()
+        topic = topic.encode("utf-8")
+        offset = self._size
+        record = _RECORD_HEADER.pack(
+            _RECORD_HEADER.size - _LENGTH.size + len(topic) + len(payload),
+            kind, self.clock(), game, len(topic),
+            qos | (_RETAIN if retain else 0))
+        self._file.write(record + topic + payload)
+        self._size += len(record) + len(topic) + len(payload)
+        return self._segment, offset
+
+    def __rotate(self):
+        if self._file:
+            self._file.close()
+        self._segment += 1
+        path = _segment_path(self.directory, self._segment)
+        self._file = open(path, "wb")
+        self._file.write(_SEGMENT_HEADER.pack(
+            _MAGIC, _VERSION, time.time(), self.clock()))
+        self._size = _SEGMENT_HEADER.size
+        if self.max_segments:
+            for old in segment_paths(self.directory)[:-self.max_segments]:
+                os.remove(old)
+
+    def __index(self, entry):
+        self._index.write(json.dumps(entry) + "\n")
+        self._index.flush()
+
+
+class RecordingPublisher:
+    """
+    Records the messages sent through a MQTT client or a publisher in a
+    message journal, before they are handed over to it.
+    The client keeps it's own publish() if it's replaced by the one of
+    this class: client.publish = RecordingPublisher(client, ...).publish
+    """
+
+    def __init__(self, publisher, journal, game_of):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        publisher : Client, Publisher
+            The MQTT client or the publisher sending the messages.
+
+        journal : MessageJournal
+            The journal recording the messages.
+
+        game_of : Function
+            Function returning the ID of the game a topic belongs to:
+            game_of(topic)
+        """
+        self._publish = publisher.publish
+        self.journal = journal
+        self.game_of = game_of
+
+    def publish(self, topic, payload=None, qos=0, retain=False, *args,
+                **kwargs):
+        self.journal.outbound(self.game_of(topic), topic, payload, qos, retain)
+        return self._publish(topic, payload, qos, retain, *args, **kwargs)
+
+
+def _segment_path(directory, number):
+    return os.path.join(directory, f"{number:08d}{SEGMENT_SUFFIX}")
+
+
+def _segment_number(path):
+    return int(os.path.basename(path)[:-len(SEGMENT_SUFFIX)])
+
+
+def segment_paths(directory):
+    """
+    Returns the paths of the segments of a journal in their order.
+    """
+    pattern = re.compile(r"\d{8}" + re.escape(SEGMENT_SUFFIX) + "$")
+    try:
+        names = sorted(n for n in os.listdir(directory) if pattern.match(n))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in names]
+
+
+def read_index(directory):
+    """
+    Reads the index of a journal.
+
+    Return
+    ------
+    games : dict
+        The games by their ID: session, segment and offset of the begin,
+        time (monotonic) and wall time, and if the game ended: outcome,
+        end_segment, end_offset, end_time and end_wall.
+    """
+    games = {}
+    try:
+        with open(os.path.join(directory, INDEX_FILE), encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    log.warning("Skipping invalid index entry in '%s'",
+                                directory)
+                    continue
+                games.setdefault(entry["game"], {}).update(entry)
+    except FileNotFoundError:
+        pass
+    return games
+
+
+def read_segment(path, offset=None):
+    """
+    Reads the records of a segment file.
+
+    Parameters
+    ----------
+    path : str
+        The path of the segment.
+
+    offset : int
+        Optional: The position of the first record.
+
+    Return
+    ------
+    Generator of the records.
+    """
+    with open(path, "rb") as file:
+        header = file.read(_SEGMENT_HEADER.size)
+        if len(header) < _SEGMENT_HEADER.size or \
+                _SEGMENT_HEADER.unpack(header)[:2] != (_MAGIC, _VERSION):
+            log.warning("Skipping invalid segment '%s'", path)
+            return
+        if offset:
+            file.seek(offset)
+        while True:
+            head = file.read(_RECORD_HEADER.size)
+            if not head:
+                return
+            if len(head) < _RECORD_HEADER.size:
+                break
+            length, kind, clock, game, topic_length, flags = \
+                _RECORD_HEADER.unpack(head)
+            body = file.read(length - _RECORD_HEADER.size + _LENGTH.size)
+            if len(body) < length - _RECORD_HEADER.size + _LENGTH.size:
+                break
+            yield Record(RecordKind(kind), clock, game,
+                         body[:topic_length].decode("utf-8"),
+                         body[topic_length:], flags & 0x03,
+                         bool(flags & _RETAIN), bool(flags & _PURGED))
+    # Torn write of the last record on a crash
+    log.warning("Skipping truncated record in '%s'", path)
+
+
+def read_records(directory, game=None):
+    """
+    Reads the records of a journal.
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the journal.
+
+    game : int
+        Optional: Only the records of this game are read, from the segment
+        of it's begin up to the segment of it's end.
+
+    Return
+    ------
+    Generator of the records.
+    """
+    segments = segment_paths(directory)
+    first, last, offset = None, None, None
+    if game is not None:
+        info = read_index(directory).get(game)
+        if info is None:
+            return
+        first, offset = info["segment"], info["offset"]
+        last = info.get("end_segment")
+    for path in segments:
+        number = _segment_number(path)
+        if first is not None and number < first:
+            continue
+        if last is not None and number > last:
+            return
+        records = read_segment(path, offset if number == first else None)
+        for record in records:
+            if game is None or record.game == game:
+                yield record
+                if record.kind is RecordKind.END and record.game == game:
+                    return
+
+
+def format_record(record, start=0.0):
+    """
+    Formats a record as line of text.
+    """
+    if record.kind is RecordKind.TRANSITION:
+        from workflow import WorkflowState
+        data = WorkflowState(record.payload[0]).name
+    else:
+        data = record.payload.decode("utf-8", "replace")
+    flags = f" q{record.qos}{' r' if record.retain else ''}" \
+        f"{' purged' if record.purged else ''}" \
+        if record.kind in (RecordKind.INBOUND, RecordKind.OUTBOUND) else ""
+    return (f"{record.time - start:10.3f} {record.game:5d} "
+            f"{record.kind.name:<10} {record.topic}{flags} {data}")
+
+
+def parse_args():
+    """
+    Parses the command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Lists the games of a message journal or prints the "
+                    "records of a game.")
+    parser.add_argument("directory", help="directory of the journal.")
+    parser.add_argument(
+        "--game",
+        "-g",
+        type=int,
+        help="ID of the game to print. (default: list the games)")
+    parser.add_argument(
+        "--kind",
+        "-k",
+        action="append",
+        choices=[k.name.lower() for k in RecordKind],
+        help="kind of the printed records. Can be repeated. (default: all)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.game is None:
+        for game, info in sorted(read_index(args.directory).items()):
+            started = time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(info.get("wall", 0)))
+            duration = info.get("end_time", info.get("time", 0)) - \
+                info.get("time", 0)
+            print(f"{game:5d}  {started}  {info.get('session', '?'):<12} "
+                  f"{info.get('outcome', 'RUNNING'):<8} {duration:8.1f} s")
+    else:
+        kinds = {RecordKind[k.upper()] for k in args.kind or ()}
+        start = None
+        for record in read_records(args.directory, args.game):
+            if start is None:
+                start = record.time
+            if not kinds or record.kind in kinds:
+                print(format_record(record, start))
@@ -0,0 +1,401 @@
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Buckets of the latency histograms in seconds
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets:
+
+    >>> h = Histogram("latency_seconds", "Latency.", (0.1, 1.0))
+    >>> for value in (0.05, 0.5, 0.7, 3.0):
+    ...     h.observe(value)
+    >>> h.count, h.sum, h.max
+    (4, 4.25, 3.0)
+    >>> h.quantile(0.5)
+    1.0
+    """
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric.
+
+        help_text : str
+            The description of the metric.
+
+        buckets : float[]
+            The sorted upper bounds of the buckets.
+        """
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        Adds a value to the histogram.
+        """
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        """
+        Returns the upper bound of the bucket containing the quantile q.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return self.max
+
+    def summary(self):
+        """
+        Returns count, sum, max and quantiles as dictionary.
+        """
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+    def expose(self):
+        """
+        Returns the lines of the Prometheus text format.
+        """
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class Counter:
+    """
+    Counter with one label, ex. the messages per topic. The number of label
+    values is bounded, further values are counted as "other" (ex. the
+    topics invented by a flapping device):
+
+    >>> c = Counter("messages_total", "Messages.", "topic", max_values=2)
+    >>> for topic in ("1/door", "1/door", "2/light", "3/x", "4/y"):
+    ...     c.inc(topic)
+    >>> c.values
+    {'1/door': 2, '2/light': 1, 'other': 2}
+    """
+
+    OTHER = "other"
+
+    def __init__(self, name, help_text, label, max_values=200):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric.
+
+        help_text : str
+            The description of the metric.
+
+        label : str
+            The name of the label.
+
+        max_values : int
+            The maximum number of label values (without "other").
+        """
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.max_values = max_values
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value, amount=1):
+        """
+        Increments the counter of a label value.
+        """
+        with self._lock:
+            count = self.values.get(label_value)
+            if count is None:
+                known = len(self.values) - (self.OTHER in self.values)
+                if known >= self.max_values:
+                    label_value = self.OTHER
+                count = self.values.get(label_value, 0)
+            self.values[label_value] = count + amount
+
+    def counts(self):
+        """
+        Returns a copy of the counts by label value.
+        """
+        with self._lock:
+            return dict(self.values)
+
+    def expose(self):
+        """
+        Returns the lines of the Prometheus text format.
+        """
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} counter"]
+        for value, count in self.counts().items():
+            value = value.replace("\\", "\\\\").replace('"', '\\"')
+            lines.append(f'{self.name}{{{self.label}="{value}"}} {count}')
+        return lines
+
+
+class Gauge:
+    """
+    Gauge reading it's value from a function.
+    """
+
+    def __init__(self, name, help_text, func):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric.
+
+        help_text : str
+            The description of the metric.
+
+        func : Function
+            Function returning the current value: func()
+        """
+        self.name = name
+        self.help = help_text
+        self.func = func
+
+    def value(self):
+        try:
+            return self.func()
+        except Exception:
+            return None
+
+    def expose(self):
+        """
+        Returns the lines of the Prometheus text format.
+        """
+        value = self.value()
+        if value is None:
+            return []
+        return [f"# HELP {self.name} {self.help}",
+                f"# TYPE {self.name} gauge",
+                f"{self.name} {value}"]
+
+
+class Metrics:
+    """
+    The metrics of the engine. The instrumented components record
+    to the shared registry (see "registry"), which is exposed on the
+    MQTT topic "op/metrics" and in the Prometheus text format.
+    """
+
+    def __init__(self):
+        """
+        Initializes a new instance of this class.
+        """
+        self.started = time.time()
+        self.dispatch_latency = Histogram(
+            "engine_dispatch_latency_seconds",
+            "Time from the arrival of a message until it is handled.")
+        self.reaction_latency = Histogram(
+            "engine_reaction_latency_seconds",
+            "Time from the arrival of a message until a resulting publish.")
+        self.graph_rebuild = Histogram(
+            "engine_graph_rebuild_seconds",
+            "Time to build the graph configuration of a workflow tree.")
+        self.graph_update = Histogram(
+            "engine_graph_update_seconds",
+            "Time to patch and serialize the graph configuration.")
+        self.timer_drift = Histogram(
+            "engine_game_timer_drift_seconds",
+            "Delay of the game timer ticks behind their deadline.")
+        self.messages = Counter(
+            "engine_messages_total", "Received messages.", "topic")
+        self.publishes = Counter(
+            "engine_publishes_total", "Published messages.", "topic")
+        self.inbound_dropped = Counter(
+            "engine_inbound_dropped_total",
+            "Received messages dropped by the full inbound queue.", "topic")
+        self.inbound_coalesced = Counter(
+            "engine_inbound_coalesced_total",
+            "Received messages replaced by a newer message of the topic.",
+            "topic")
+        self.gauges = {}
+        # Arrival time of the message which is currently handled
+        self.event_start = None
+        self._last_report = (time.monotonic(), {})
+
+    @property
+    def histograms(self):
+        return (self.dispatch_latency, self.reaction_latency,
+                self.graph_rebuild, self.graph_update, self.timer_drift)
+
+    def gauge(self, name, help_text, func):
+        """
+        Registers a gauge, ex. the depth of a queue.
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric.
+
+        help_text : str
+            The description of the metric.
+
+        func : Function
+            Function returning the current value: func()
+        """
+        self.gauges[name] = Gauge(name, help_text, func)
+
+    def published(self, topic):
+        """
+        Records a published message. If it's published while handling
+        a message, the reaction latency is recorded.
+        """
+        self.publishes.inc(topic)
+        if self.event_start is not None:
+            self.reaction_latency.observe(time.perf_counter() - self.event_start)
+
+    def report(self):
+        """
+        Returns the summary of the metrics as dictionary. The message rates
+        are calculated since the last report.
+        """
+        now = time.monotonic()
+        last_time, last_counts = self._last_report
+        counts = self.messages.counts()
+        elapsed = max(now - last_time, 1e-9)
+        rates = {
+            topic: round((count - last_counts.get(topic, 0)) / elapsed, 3)
+            for topic, count in counts.items()
+            if count != last_counts.get(topic, 0)
+        }
+        self._last_report = (now, counts)
+        return {
+            'uptime': round(time.time() - self.started, 3),
+            'histograms': {h.name: h.summary() for h in self.histograms},
+            'messages': counts,
+            'publishes': self.publishes.counts(),
+            'inbound_dropped': self.inbound_dropped.counts(),
+            'inbound_coalesced': self.inbound_coalesced.counts(),
+            'rates': rates,
+            'gauges': {g.name: g.value() for g in self.gauges.values()},
+        }
+
+    def to_json(self):
+        """
+        Returns the summary of the metrics as JSON.
+        """
+        return json.dumps(self.report())
+
+    def expose(self):
+        """
+        Returns the metrics in the Prometheus text format.
+        """
+        lines = []
+        for metric in (*self.histograms, self.messages, self.publishes,
+                       self.inbound_dropped, self.inbound_coalesced,
+                       *self.gauges.values()):
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    HTTP server exposing the metrics in the Prometheus text format
+    on "/metrics".
+    """
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        metrics : Metrics
+            The exposed metrics.
+
+        port : int
+            The port of the HTTP server.
+
+        host : str
+            The address the server is bound to (default: localhost only).
+        """
+        self.metrics = metrics
+        self.address = (host, port)
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the HTTP server on a background thread.
+        """
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.expose().encode("utf-8")
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(self.address, Handler)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the HTTP server.
+        """
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+registry = Metrics()
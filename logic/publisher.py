@@ -0,0 +1,235 @@
+import atexit
+import os
+import queue
+import threading
+import time
+import paho.mqtt.client as mqtt
+from engine_log import get_logger
+from metrics import registry as metrics
+
+
+DEFAULT_HOST = os.environ.get("UE_MQTT_HOST", "10.0.0.2")
+DEFAULT_PORT = 1883
+# Bound of the outbound queue, the oldest messages are dropped on overflow
+DEFAULT_QUEUE_SIZE = 1000
+
+log = get_logger("publisher")
+
+_publishers = {}
+_publishers_lock = threading.Lock()
+
+
+class Publisher:
+    """
+    The publisher sends messages over one long-lived MQTT connection.
+    Messages are put into a thread-safe outbound queue and published by
+    a worker thread, so the callers don't wait for the connection setup.
+
+    While the connection is lost, messages are dropped instead of being
+    queued, so no stale messages (ex. game timer ticks) are published after
+    a reconnect. If the queue is full, the oldest message is dropped.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                 maxsize=DEFAULT_QUEUE_SIZE, connect_timeout=10.0):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        host : str
+            The url of the MQTT server.
+
+        port : int
+            The port of the MQTT server.
+
+        maxsize : int
+            Maximum number of queued messages (0: unbounded).
+
+        connect_timeout : float
+            Time in seconds after the start the messages wait for the
+            first connection before they are dropped.
+        """
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.client = None
+        self.queue = queue.Queue(maxsize)
+        self._connected = threading.Event()
+        self._connect_deadline = 0.0
+        self._dropped = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """
+        Connects to the MQTT server and starts the worker thread.
+        """
+        with self._lock:
+            if self._thread is None:
+                self.client = mqtt.Client()
+                self.client.on_connect = self.__on_connect
+                self.client.on_disconnect = self.__on_disconnect
+                self._connect_deadline = time.monotonic() + self.connect_timeout
+                self.client.connect_async(self.host, self.port)
+                self.client.loop_start()
+                self._thread = threading.Thread(
+                    target=self.__run, name="Publisher", daemon=True)
+                self._thread.start()
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        """
+        Queues a message to be published.
+
+        Parameters
+        ----------
+        topic : str
+            The MQTT topic.
+
+        payload : str, bytes, int, float
+            The payload of the message.
+
+        qos : int
+            The MQTT QoS level.
+
+        retain : bool
+            Whether the message should be retained.
+        """
+        self.start()
+        item = (topic, payload, qos, retain)
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                self.__drop_oldest()
+
+    def flush(self, timeout=None):
+        """
+        Waits until all queued messages are published.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum time in seconds to wait for each pending message.
+        """
+        if self._thread is None:
+            return
+        self.queue.join()
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for info in pending:
+            try:
+                info.wait_for_publish(timeout)
+            except (RuntimeError, ValueError):
+                pass
+
+    def stop(self):
+        """
+        Publishes all queued messages and closes the connection.
+        """
+        if self._thread is None:
+            return
+        self.flush(5)
+        self.queue.put(None)
+        self._thread.join()
+        self.client.disconnect()
+        self.client.loop_stop()
+        with self._lock:
+            self._thread = None
+            self._connected.clear()
+
+    def __on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self._connected.set()
+
+    def __drop_oldest(self):
+        try:
+            item = self.queue.get_nowait()
+        except queue.Empty:
+            return
+        self.queue.task_done()
+        self.__dropped(item, f"Outbound queue full ({self.queue.maxsize})")
+
+    def __dropped(self, item, reason):
+        with self._lock:
+            if not self._dropped:
+                log.warning("%s, dropping messages (ex. '%s').", reason,
+                            item[0] if item else None)
+            self._dropped += 1
+
+    def __recovered(self):
+        with self._lock:
+            log.info("Publishing to '%s' again, %d messages were dropped.",
+                     self.host, self._dropped)
+            self._dropped = 0
+
+    def __on_disconnect(self, client, userdata, rc):
+        self._connected.clear()
+
+    def __run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                # Only the first connection is waited for, while the
+                # connection is lost the messages are dropped immediately
+                timeout = max(self._connect_deadline - time.monotonic(), 0)
+                if not self._connected.wait(timeout):
+                    self.__dropped(item, f"Not connected to '{self.host}'")
+                    continue
+                if self._dropped:
+                    self.__recovered()
+                info = self.client.publish(*item)
+                if item[2] > 0:
+                    with self._lock:
+                        self._pending = [
+                            i for i in self._pending if not i.is_published()
+                        ]
+                        self._pending.append(info)
+            except Exception:
+                log.exception("Publishing to '%s' failed", item[0])
+            finally:
+                self.queue.task_done()
+
+
+def get_publisher(host=None, port=DEFAULT_PORT):
+    """
+    Returns the shared publisher of a MQTT server.
+
+    Parameters
+    ----------
+    host : str
+        Optional: The url of the MQTT server
+        (default: environment variable UE_MQTT_HOST or 10.0.0.2).
+
+    port : int
+        The port of the MQTT server.
+    """
+    key = (host or DEFAULT_HOST, port)
+    with _publishers_lock:
+        publisher = _publishers.get(key)
+        if publisher is None:
+            publisher = Publisher(key[0], port)
+            _publishers[key] = publisher
+    return publisher
+
+
+metrics.gauge(
+    "engine_publisher_queue_depth", "Messages waiting in the publisher queues.",
+    lambda: sum(p.queue.qsize() for p in list(_publishers.values())))
+
+
+@atexit.register
+def stop_all():
+    """
+    Stops all shared publishers. Called on exit, so queued messages
+    are not lost.
+    """
+    with _publishers_lock:
+        publishers = list(_publishers.values())
+        _publishers.clear()
+    for publisher in publishers:
+        publisher.stop()
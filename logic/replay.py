@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import json
+import sys
+import tempfile
+import time
+import engine_log
+from message_journal import RecordKind, read_index, read_records, format_record
+from simulation import Simulation, load_factory
+from workflow import WorkflowState
+
+
+ReplayResult = collections.namedtuple(
+    "ReplayResult",
+    ("outcome", "recorded_outcome", "replayed", "echoes", "diverged"))
+
+
+def _histories(records):
+    """
+    Returns the states each workflow went through, in the order of their
+    first transition. The transitions are recorded per handled event, so
+    the histories don't depend on how the events were grouped.
+    """
+    histories = {}
+    for record in records:
+        if record.kind is RecordKind.TRANSITION:
+            histories.setdefault(record.topic, []).append(record.payload[0])
+    return histories
+
+
+def replay(directory, game, workflow_factory, speed=0.0, on_record=None):
+    """
+    Replays the inbound messages of a recorded game against the engine
+    hosted by a simulation (fake broker and client on a virtual clock).
+    The replayed game is recorded itself, so the workflow transitions of
+    both games can be compared.
+
+    Messages published by the engine and received back (ex. the triggers
+    of a puzzle on it's own topic) aren't replayed, the replayed engine
+    publishes them again. Neither are the retained messages collected by
+    the purge of the topics.
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the message journal.
+
+    game : int
+        The ID of the game.
+
+    workflow_factory : WorkflowFactory
+        The factory creating the workflows of the game.
+
+    speed : float
+        The replay speed: 1 replays the game in real time, 10 ten times
+        faster, 0 as fast as possible.
+
+    on_record : Function
+        Optional: Handler function called with every replayed record:
+        on_record(record)
+
+    Return
+    ------
+    result : ReplayResult
+        The outcome of the replayed and the recorded game, the number of
+        replayed and skipped (echoed) messages and the name of the first
+        workflow which went through other states (None: the same states).
+    """
+    records = list(read_records(directory, game))
+    if not records or records[0].kind is not RecordKind.BEGIN:
+        raise ValueError(f"The game {game} isn't recorded in '{directory}'.")
+    begin = json.loads(records[0].payload)
+    session = begin["session"]
+    prefix = "" if session == "default" else session + "/"
+    if begin["resumed"]:
+        print(f"The game {game} was resumed after a restart, "
+              "it's replayed from the start.", file=sys.stderr)
+    recorded_outcome = None
+    with tempfile.TemporaryDirectory() as message_dir:
+        simulation = Simulation(workflow_factory, message_dir=message_dir)
+        if begin["options"] is not None:
+            simulation.publish("op/gameOptions", json.dumps(begin["options"]))
+        simulation.publish("op/gameControl", "START")
+        # The game begins when the retained topics were purged
+        waited = 0
+        while not simulation.session.workflow_client.game and waited < 10:
+            simulation.advance(0.1)
+            waited += 0.1
+        last = end = records[0].time
+        published = collections.Counter()
+        replayed = echoes = 0
+        for record in records[1:]:
+            if record.kind is RecordKind.OUTBOUND:
+                published[record.topic, record.payload] += 1
+            elif record.kind is RecordKind.END:
+                recorded_outcome = record.payload.decode("utf-8")
+            end = record.time
+            if record.kind is not RecordKind.INBOUND or record.purged:
+                continue
+            if published[record.topic, record.payload]:
+                published[record.topic, record.payload] -= 1
+                echoes += 1
+                continue
+            delay = max(record.time - last, 0)
+            last = record.time
+            if speed:
+                time.sleep(delay / speed)
+            simulation.advance(delay)
+            if on_record:
+                on_record(record)
+            simulation.publish(record.topic[len(prefix):], record.payload,
+                               record.qos)
+            replayed += 1
+        # Up to the end of the game, ex. the expiry of the game time
+        simulation.advance(end - last + 1)
+        simulation.close()
+        replayed_records = list(read_records(message_dir, 1))
+    outcome = next((r.payload.decode("utf-8") for r in replayed_records
+                    if r.kind is RecordKind.END), None)
+    recorded = _histories(records)
+    replayed_histories = _histories(replayed_records)
+    diverged = next(
+        (name for name in list(recorded) + list(replayed_histories)
+         if recorded.get(name) != replayed_histories.get(name)), None)
+    result = ReplayResult(outcome, recorded_outcome, replayed, echoes, diverged)
+    if diverged:
+        states = [[WorkflowState(s).name for s in h.get(diverged, ())]
+                  for h in (recorded, replayed_histories)]
+        print(f"'{diverged}' recorded {states[0]}, replayed {states[1]}",
+              file=sys.stderr)
+    return result
+
+
+def parse_args():
+    """
+    Parses the command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Replays a game of a message journal against the "
+                    "workflow engine and compares the workflow transitions.")
+    parser.add_argument("directory", help="directory of the journal.")
+    parser.add_argument(
+        "game", type=int,
+        help="ID of the game (see: python3 message_journal.py <directory>).")
+    parser.add_argument(
+        "--workflow_def", "-d",
+        default="workflow_definition:WorkflowDefinition",
+        help="definition of the workflow: \"module:class\" or the path of a "
+             "YAML/JSON definition file. "
+             "(default: workflow_definition:WorkflowDefinition)")
+    parser.add_argument(
+        "--speed", "-s", type=float, default=0,
+        help="replay speed: 1 is real time, 10 ten times faster, "
+             "0 as fast as possible. (default: 0)")
+    parser.add_argument(
+        "--verbose", "-v", action="store_true",
+        help="prints the replayed messages.")
+    parser.add_argument(
+        "--log_level", "-l", default="CRITICAL",
+        help="log level of the engine. (default: CRITICAL)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    engine_log.setup(args.log_level.upper(), "text", stream=sys.stderr)
+    info = read_index(args.directory).get(args.game)
+    if info is None:
+        sys.exit(f"The game {args.game} isn't recorded in '{args.directory}'.")
+    start = info.get("time", 0)
+    on_record = None
+    if args.verbose:
+        on_record = lambda record: print(format_record(record, start))  # noqa: E731
+    wall = time.perf_counter()
+    result = replay(args.directory, args.game, load_factory(args.workflow_def),
+                    args.speed, on_record)
+    wall = time.perf_counter() - wall
+    print(f"Game {args.game} ({info['session']}): recorded "
+          f"{result.recorded_outcome or 'unfinished'}, replayed "
+          f"{result.outcome or 'unfinished'}; {result.replayed} messages "
+          f"replayed, {result.echoes} echoes skipped in {wall:.2f} s")
+    print("Workflow transitions diverged" if result.diverged
+          else "Workflow transitions identical")
+    return 1 if result.diverged or result.outcome != result.recorded_outcome \
+        else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
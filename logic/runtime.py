@@ -0,0 +1,346 @@
+import asyncio
+import contextlib
+import signal
+import threading
+import paho.mqtt.client as mqtt
+from timer_service import TimerHandle, TimerService
+from inbound_queue import InboundQueue
+from publisher import get_publisher
+from engine_log import get_logger
+
+
+log = get_logger("runtime")
+
+
+class ThreadRuntime:
+    """
+    The thread runtime runs the MQTT client on paho's network thread and
+    the timers on the scheduler thread of a timer service.
+    The callbacks of both threads are serialized by a lock.
+    """
+
+    name = "thread"
+
+    def create_client(self, client_id):
+        """
+        Creates the MQTT client.
+        """
+        return mqtt.Client(client_id, False)
+
+    def create_lock(self):
+        """
+        Creates the lock serializing the engine callbacks.
+        """
+        return threading.RLock()
+
+    def create_timer_service(self, executor=None):
+        """
+        Creates the timer service.
+
+        Parameters
+        ----------
+        executor : Function
+            Optional: Function executing the expired callbacks.
+        """
+        return TimerService(executor)
+
+    def create_publisher(self, mqtt_url, client):
+        """
+        Returns the publisher for messages not sent by the workflows
+        (ex. the game time).
+        """
+        return get_publisher(mqtt_url)
+
+    def create_inbound_queue(self, handler, **kwargs):
+        """
+        Creates the inbound queue handling the received messages
+        on a worker thread (see InboundQueue).
+        """
+        return InboundQueue(handler, **kwargs)
+
+    def attach(self, client):
+        """
+        Prepares the MQTT client before it's connected.
+        """
+        pass
+
+    def start(self, client):
+        """
+        Starts processing the network traffic of the connected client.
+        """
+        client.loop_start()
+
+    def stop(self, client):
+        """
+        Stops processing the network traffic of the client.
+        """
+        client.loop_stop()
+
+    def run(self, on_shutdown):
+        """
+        Blocks until SIGINT is received.
+
+        Parameters
+        ----------
+        on_shutdown : Function
+            Handler function: on_shutdown()
+        """
+        signal.signal(signal.SIGINT, lambda sig, frame: on_shutdown())
+        log.info("Press Ctrl+C to exit...")
+        signal.pause()
+
+
+class AsyncioTimerService:
+    """
+    Timer service scheduling the callbacks on an asyncio event loop.
+    """
+
+    def __init__(self, loop, executor=None):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        loop : AbstractEventLoop
+            The event loop.
+
+        executor : Function
+            Optional: Function executing the expired callbacks.
+        """
+        self.loop = loop
+        self.executor = executor
+        self.clock = loop.time
+        self._handles = set()
+
+    def schedule(self, delay_sec, callback, *args):
+        """
+        Schedules a callback.
+
+        Parameters
+        ----------
+        delay_sec : float
+            The delay in seconds.
+
+        callback : Function
+            Handler function: callback(*args)
+
+        Return
+        ------
+        handle : TimerHandle
+            The handle to cancel the timer.
+        """
+        handle = TimerHandle(self.clock() + delay_sec, callback, args)
+        self.loop.call_at(handle.deadline, self.__execute, handle)
+        self._handles.add(handle)
+        return handle
+
+    def cancel(self, handle):
+        """
+        Cancels a scheduled timer.
+        """
+        if handle:
+            handle.cancel()
+
+    def stop(self):
+        """
+        Cancels all pending timers.
+        """
+        for handle in self._handles:
+            handle.cancel()
+        self._handles.clear()
+
+    def __call(self, handle):
+        if not handle.cancelled:
+            handle.callback(*handle.args)
+
+    def __execute(self, handle):
+        self._handles.discard(handle)
+        try:
+            if self.executor:
+                self.executor(self.__call, handle)
+            else:
+                self.__call(handle)
+        except Exception:
+            log.exception("Timer callback failed")
+
+
+class AsyncioInboundQueue(InboundQueue):
+    """
+    Inbound queue handling the messages on an asyncio event loop.
+    The messages are handled in batches after the received data was read,
+    so the socket readers and the keepalives aren't starved.
+    """
+
+    def __init__(self, loop, handler, **kwargs):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        loop : AbstractEventLoop
+            The event loop.
+
+        handler : Function
+            Handler function of the messages: handler(msg, arrival)
+
+        kwargs : keywords
+            The settings of the queue (see InboundQueue).
+        """
+        super().__init__(handler, **kwargs)
+        self.loop = loop
+        self._scheduled = False
+
+    def start(self):
+        """
+        Overridden: The messages are handled by the event loop.
+        """
+        pass
+
+    def _notify(self):
+        if not self._scheduled:
+            self._scheduled = True
+            self.loop.call_soon(self.__drain)
+
+    def __drain(self):
+        self._scheduled = False
+        self.drain()
+        if len(self):
+            self._notify()
+
+
+class AsyncioRuntime:
+    """
+    The asyncio runtime runs the MQTT client, the workflows and the timers
+    on a single asyncio event loop. The network traffic of the paho client
+    is processed by the loop's socket readers and writers, so no locks and
+    no further threads are needed.
+    """
+
+    name = "asyncio"
+
+    def __init__(self, loop=None, reconnect_delay=2.0):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        loop : AbstractEventLoop
+            Optional: The event loop.
+
+        reconnect_delay : float
+            The delay in seconds between reconnection attempts.
+        """
+        self.loop = loop if loop is not None else asyncio.new_event_loop()
+        self.reconnect_delay = reconnect_delay
+        self._misc = None
+        self._running = False
+
+    def create_client(self, client_id):
+        """
+        Creates the MQTT client.
+        """
+        return mqtt.Client(client_id, False)
+
+    def create_lock(self):
+        """
+        Creates the lock serializing the engine callbacks.
+        All callbacks are executed on the event loop, so no lock is needed.
+        """
+        return contextlib.nullcontext()
+
+    def create_timer_service(self, executor=None):
+        """
+        Creates the timer service.
+
+        Parameters
+        ----------
+        executor : Function
+            Optional: Function executing the expired callbacks.
+        """
+        return AsyncioTimerService(self.loop, executor)
+
+    def create_publisher(self, mqtt_url, client):
+        """
+        Returns the publisher for messages not sent by the workflows
+        (ex. the game time).
+        """
+        return client
+
+    def create_inbound_queue(self, handler, **kwargs):
+        """
+        Creates the inbound queue handling the received messages
+        on the event loop (see InboundQueue).
+        """
+        return AsyncioInboundQueue(self.loop, handler, **kwargs)
+
+    def attach(self, client):
+        """
+        Prepares the MQTT client before it's connected.
+        """
+        client.on_socket_open = self.__on_socket_open
+        client.on_socket_close = self.__on_socket_close
+        client.on_socket_register_write = self.__on_socket_register_write
+        client.on_socket_unregister_write = self.__on_socket_unregister_write
+
+    def start(self, client):
+        """
+        Starts processing the network traffic of the connected client.
+        """
+        self._running = True
+
+    def stop(self, client):
+        """
+        Stops processing the network traffic of the client.
+        """
+        self._running = False
+        if self._misc:
+            self._misc.cancel()
+            self._misc = None
+
+    def run(self, on_shutdown):
+        """
+        Runs the event loop until SIGINT is received.
+
+        Parameters
+        ----------
+        on_shutdown : Function
+            Handler function: on_shutdown()
+        """
+        self.loop.add_signal_handler(signal.SIGINT, on_shutdown)
+        log.info("Press Ctrl+C to exit...")
+        self.loop.run_forever()
+
+    def __on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        if self._misc is None:
+            self._misc = self.loop.create_task(self.__misc_loop(client))
+
+    def __on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+
+    def __on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def __on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def __misc_loop(self, client):
+        """
+        Handles the keepalives, retries and reconnects of the client.
+        """
+        while True:
+            rc = client.loop_misc()
+            if rc == mqtt.MQTT_ERR_NO_CONN and self._running:
+                await asyncio.sleep(self.reconnect_delay)
+                try:
+                    client.reconnect()
+                except OSError as e:
+                    log.warning("Reconnecting failed: %s", e)
+                continue
+            await asyncio.sleep(1)
+
+
+RUNTIMES = {
+    ThreadRuntime.name: ThreadRuntime,
+    AsyncioRuntime.name: AsyncioRuntime,
+}
@@ -0,0 +1,834 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import heapq
+import itertools
+import json
+import logging
+import math
+import random
+import sys
+import time
+import engine_log
+from timer_service import TimerHandle, TimerService
+from inbound_queue import InboundQueue
+from topic_index import TopicIndex, topic_matches
+from workflow import Workflow, WorkflowState
+from workflow_extras import DelayWorkflow
+from workflow_controller import WorkflowController
+from game_session import GameState
+from message_journal import MessageJournal
+from engine_log import get_logger
+
+
+log = get_logger("simulation")
+
+# The game of workflow_definition.py solved by the players,
+# events: (delay in seconds, topic, payload)
+SCRIPTED_TRACE = [
+    (0, "op/gameOptions", '{"participants": 3, "duration": 60}'),
+    (0, "op/gameControl", "START"),
+    # Lobby room
+    (10, "env/powerfail", '{"method": "STATUS", "state": "SOLVED"}'),
+    (30, "1/cube/state", '{"method": "STATUS", "state": "Invalid}'),
+    (5, "1/cube/state", '{"method": "STATUS", "state": "ACTIVE"}'),
+    (60, "1/cube/state", '{"method": "STATUS", "state": "SOLVED"}'),
+    (90, "1/panel/state", '{"method": "status", "state": "solved", "data": "Worked!"}'),
+    (45, "4/puzzle", '{"method": "STATUS", "state": "UNSOLVED"}'),
+    (15, "4/puzzle", '{"method": "STATUS", "state": "SOLVED"}'),
+    # Control room
+    (120, "5/control_room/power", '{"method": "STATUS", "state": "SOLVED"}'),
+    (0, "op/gameControl", "PAUSE"),
+    (300, "op/gameControl", "START"),
+    (60, "3/gamecontrol/antenna", '{"method": "STATUS", "state": "SOLVED"}'),
+    (60, "3/gamecontrol/map", '{"method": "STATUS", "state": "SOLVED"}'),
+    (30, "3/gamecontrol/touchgame", '{"method": "STATUS", "state": "INACTIVE"}'),
+    (30, "3/gamecontrol/touchgame", '{"method": "STATUS", "state": "SOLVED"}'),
+    (0, "op/gameControl", "SKIP Switchboard Solved"),
+    # Server room
+    (240, "4/gamecontrol", '{"method": "STATUS", "state": "SOLVED"}'),
+    (5, None, None),
+]
+
+# Payloads sent by flaky or misbehaving puzzles
+NOISE = (
+    '{"method": "STATUS", "state": "ACTIVE"}',
+    '{"method": "STATUS", "state": "INACTIVE"}',
+    '{"method": "STATUS", "state": "UNKNOWN"}',
+    '{"method": "TRIGGER", "state": "ON"}',
+    '{"method": "MESSAGE", "state": "NONE", "data": 42}',
+    '{"method": "STATUS"',
+    '',
+)
+
+
+class VirtualClock:
+    """
+    A clock which only advances when it's told so.
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+class VirtualTimerService(TimerService):
+    """
+    Timer service on a virtual clock. There is no scheduler thread,
+    the expired timers are executed by run_due() after the clock was
+    advanced.
+    """
+
+    def __init__(self, executor=None, clock=None):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        executor : Function
+            Optional: Function executing the expired callbacks.
+
+        clock : VirtualClock
+            Optional: The clock shared with further timer services.
+        """
+        super().__init__(executor, clock if clock is not None else VirtualClock())
+
+    def schedule(self, delay_sec, callback, *args):
+        """
+        Overridden: Schedules a callback without starting a thread.
+        """
+        now = self.clock()
+        deadline = now + max(delay_sec, 0)
+        if delay_sec > 0 and deadline <= now:
+            # A real clock always moves on, a delay below the resolution
+            # of the clock must not expire immediately again and again
+            deadline = math.nextafter(now, math.inf)
+        handle = TimerHandle(deadline, callback, args)
+        heapq.heappush(self._heap, (handle.deadline, next(self._counter), handle))
+        return handle
+
+    def stop(self):
+        """
+        Overridden: Drops all pending timers.
+        """
+        self._heap.clear()
+
+    def next_deadline(self):
+        """
+        Returns the deadline of the next pending timer (None: no timer).
+        """
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def run_due(self, limit=None):
+        """
+        Executes the timers which are expired at the current time
+        (in order of their deadline and scheduling).
+
+        Parameters
+        ----------
+        limit : int
+            Optional: The maximum number of executed timers.
+
+        Return
+        ------
+        count : int
+            The number of executed timers.
+        """
+        count = 0
+        while limit is None or count < limit:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > self.clock():
+                return count
+            _, _, handle = heapq.heappop(self._heap)
+            try:
+                self._execute(handle)
+            except Exception:
+                log.exception("Timer callback failed")
+            count += 1
+        return count
+
+
+class FakeMessage:
+    """
+    A message delivered by the fake broker (see paho's MQTTMessage).
+    """
+
+    __slots__ = ("topic", "payload", "qos", "retain", "mid")
+
+    def __init__(self, topic, payload, qos, retain, mid):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = mid
+
+
+class PublishInfo:
+    """
+    The result of a publish (see paho's MQTTMessageInfo). The fake broker
+    accepts the messages immediately.
+    """
+
+    __slots__ = ("rc", "mid")
+
+    def __init__(self, mid):
+        self.rc = 0
+        self.mid = mid
+
+    def is_published(self):
+        return True
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+
+class FakeBroker:
+    """
+    In-memory MQTT broker. Messages are delivered to the subscribed clients
+    by timers on the virtual clock: without latency they are delivered when
+    the simulation settles, with latency the deliveries of different
+    clients interleave like on a real network. The messages between two
+    clients keep their order, like on a MQTT connection.
+
+    >>> broker = FakeBroker(VirtualTimerService())
+    >>> engine, device = FakeClient(broker), FakeClient(broker)
+    >>> received = []
+    >>> engine.on_message = lambda c, u, msg: received.append(
+    ...     (msg.topic, msg.payload, msg.retain))
+    >>> for client in (engine, device):
+    ...     _ = client.connect()
+    >>> _ = device.publish("1/cube/state", "ACTIVE", 1, True)
+    >>> _ = engine.subscribe("1/+/state")
+    >>> _ = device.publish("1/cube/state", "SOLVED")
+    >>> broker.timers.run_due()
+    4
+    >>> received
+    [('1/cube/state', b'ACTIVE', True), ('1/cube/state', b'SOLVED', False)]
+    """
+
+    def __init__(self, timers, latency=None):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        timers : VirtualTimerService
+            The timer service delivering the messages.
+
+        latency : Function
+            Optional: Function returning the delay in seconds of a
+            delivery: latency()
+        """
+        self.timers = timers
+        self.latency = latency
+        self.subscriptions = TopicIndex()
+        self.retained = {}
+        self.published = 0
+        self._mid = itertools.count(1)
+        self._links = {}
+
+    def subscribe(self, client, topic_filter):
+        """
+        Subscribes a client and delivers the matching retained messages.
+        """
+        self.subscriptions.add(topic_filter, client)
+        for topic, (payload, qos) in list(self.retained.items()):
+            if topic_matches(topic_filter, topic):
+                self.__deliver(self, client, FakeMessage(
+                    topic, payload, qos, True, next(self._mid)))
+
+    def unsubscribe(self, client, topic_filter):
+        self.subscriptions.remove(topic_filter, client)
+
+    def is_subscribed(self, client, topic):
+        return client in self.subscriptions.match(topic)
+
+    def publish(self, sender, topic, payload, qos, retain):
+        """
+        Publishes a message to all subscribed clients.
+
+        Return
+        ------
+        mid : int
+            The message id.
+        """
+        mid = next(self._mid)
+        self.published += 1
+        if retain:
+            # An empty payload removes the retained message
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+        for client in self.subscriptions.match(topic):
+            self.__deliver(
+                sender, client, FakeMessage(topic, payload, qos, False, mid))
+        return mid
+
+    def __deliver(self, sender, receiver, msg):
+        now = self.timers.clock()
+        deadline = now + (self.latency() if self.latency else 0)
+        link = (id(sender), id(receiver))
+        deadline = max(deadline, self._links.get(link, deadline))
+        self._links[link] = deadline
+        self.timers.schedule(deadline - now, receiver.receive, msg)
+
+
+def _encode(payload):
+    """
+    Converts a payload to bytes like paho does.
+    """
+    if payload is None:
+        return b""
+    if isinstance(payload, str):
+        return payload.encode("utf-8")
+    if isinstance(payload, (bytes, bytearray)):
+        return bytes(payload)
+    if isinstance(payload, (int, float)):
+        return str(payload).encode("ascii")
+    raise TypeError("payload must be a string, bytearray, int, float or None.")
+
+
+class FakeClient:
+    """
+    MQTT client of the fake broker, it provides the parts of paho's client
+    used by the engine. It can also be used as publisher.
+    """
+
+    def __init__(self, broker, client_id=""):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        broker : FakeBroker
+            The broker of the client.
+
+        client_id : str
+            The client id.
+        """
+        self.broker = broker
+        self.client_id = client_id
+        self.on_connect = None
+        self.on_message = None
+        self.filters = set()
+        self._connected = False
+
+    def connect(self, host=None, port=1883, keepalive=60):
+        self._connected = True
+        self.broker.timers.schedule(0, self.__on_connect)
+        return 0
+
+    def disconnect(self):
+        self._connected = False
+        for topic in self.filters:
+            self.broker.unsubscribe(self, topic)
+        self.filters.clear()
+        return 0
+
+    def is_connected(self):
+        return self._connected
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        mid = self.broker.publish(self, topic, _encode(payload), qos, retain)
+        return PublishInfo(mid)
+
+    def subscribe(self, topic, qos=0):
+        self.filters.add(topic)
+        self.broker.subscribe(self, topic)
+        return 0, None
+
+    def unsubscribe(self, topic):
+        if topic in self.filters:
+            self.filters.remove(topic)
+            self.broker.unsubscribe(self, topic)
+        return 0, None
+
+    def receive(self, msg):
+        """
+        Handles a message delivered by the broker.
+        """
+        # Deliveries in flight are dropped after an unsubscribe
+        if self._connected and self.on_message \
+                and self.broker.is_subscribed(self, msg.topic):
+            self.on_message(self, None, msg)
+
+    def __on_connect(self):
+        if self._connected and self.on_connect:
+            self.on_connect(self, None, {}, 0)
+
+
+class SimulationInboundQueue(InboundQueue):
+    """
+    Inbound queue drained by the simulation instead of a worker thread.
+    """
+
+    def start(self):
+        pass
+
+
+class SimulationRuntime:
+    """
+    The simulation runtime runs the engine in-process on a virtual clock:
+    the MQTT server is a fake broker, the timers and the deliveries of the
+    messages are executed by advance(). Nothing waits on real time, so games
+    run thousands of times faster than real time and are reproducible.
+    """
+
+    name = "simulation"
+
+    def __init__(self, latency=None, max_steps=100000):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        latency : Function
+            Optional: Function returning the delay in seconds of a
+            message delivery (default: no delay).
+
+        max_steps : int
+            The maximum number of events executed by settle(), more
+            events indicate a message or timer loop.
+        """
+        self.clock = VirtualClock()
+        self.broker = FakeBroker(VirtualTimerService(clock=self.clock), latency)
+        self.max_steps = max_steps
+        self.timers = VirtualTimerService(clock=self.clock)
+        self.inbound = None
+
+    def create_client(self, client_id):
+        """
+        Creates the MQTT client.
+        """
+        return FakeClient(self.broker, client_id)
+
+    def create_lock(self):
+        """
+        Creates the lock serializing the engine callbacks.
+        The simulation is single threaded, so no lock is needed.
+        """
+        return contextlib.nullcontext()
+
+    def create_timer_service(self, executor=None):
+        """
+        Creates the timer service.
+
+        Parameters
+        ----------
+        executor : Function
+            Optional: Function executing the expired callbacks.
+        """
+        self.timers = VirtualTimerService(executor, self.clock)
+        return self.timers
+
+    def create_publisher(self, mqtt_url, client):
+        """
+        Returns the publisher for messages not sent by the workflows
+        (ex. the game time).
+        """
+        return client
+
+    def create_inbound_queue(self, handler, **kwargs):
+        """
+        Creates the inbound queue, which is drained by settle().
+        """
+        self.inbound = SimulationInboundQueue(handler, **kwargs)
+        return self.inbound
+
+    def attach(self, client):
+        pass
+
+    def start(self, client):
+        pass
+
+    def stop(self, client):
+        pass
+
+    def run(self, on_shutdown):
+        """
+        Runs until no event is pending.
+
+        Parameters
+        ----------
+        on_shutdown : Function
+            Handler function: on_shutdown()
+        """
+        while self.next_deadline() is not None:
+            self.advance(self.next_deadline() - self.clock())
+        on_shutdown()
+
+    def now(self):
+        """
+        Returns the virtual time in seconds.
+        """
+        return self.clock()
+
+    def next_deadline(self):
+        """
+        Returns the time of the next pending event (None: no event).
+        """
+        deadlines = [d for d in (self.timers.next_deadline(),
+                                 self.broker.timers.next_deadline())
+                     if d is not None]
+        return min(deadlines) if deadlines else None
+
+    def settle(self):
+        """
+        Executes all events due at the current time: the message deliveries,
+        the inbound queue and the timers.
+
+        Return
+        ------
+        count : int
+            The number of executed events.
+        """
+        total = 0
+        while total < self.max_steps:
+            limit = self.max_steps - total
+            count = self.broker.timers.run_due(limit)
+            if self.inbound is not None:
+                count += self.inbound.drain()
+            count += self.timers.run_due(limit)
+            if not count:
+                return total
+            total += count
+        raise RuntimeError(
+            f"The simulation doesn't settle after {total} events "
+            f"at {self.clock():.3f}s.")
+
+    def advance(self, seconds):
+        """
+        Advances the virtual clock and executes all events on the way.
+
+        Parameters
+        ----------
+        seconds : float
+            The time in seconds to advance.
+        """
+        until = self.clock.now + max(seconds, 0)
+        self.settle()
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > until:
+                break
+            self.clock.now = max(deadline, self.clock.now)
+            self.settle()
+        self.clock.now = until
+        self.settle()
+
+
+class ErrorCounter(logging.Handler):
+    """
+    Counts the error records of the engine.
+    """
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class Simulation:
+    """
+    The simulation hosts the engine with one game session on the simulation
+    runtime and plays games against it as a player client: traces of
+    scripted messages or randomized players. The outcome of a game is
+    received on the game control topic, like a real operator frontend.
+    """
+
+    def __init__(self, workflow_factory, latency=None, inbound_queue_size=1000,
+                 message_dir=None):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        workflow_factory : WorkflowFactory
+            A factory which creates the workflow structure of the game.
+
+        latency : Function
+            Optional: Function returning the delay in seconds of a
+            message delivery.
+
+        inbound_queue_size : int
+            The bound of the inbound queue of the engine.
+
+        message_dir : str
+            Optional: The directory of a message journal recording the
+            games (on the virtual clock).
+        """
+        self.runtime = SimulationRuntime(latency)
+        messages = None
+        if message_dir:
+            messages = MessageJournal(message_dir, clock=self.runtime.clock)
+        self.controller = WorkflowController(
+            "simulation", workflow_factory, runtime=self.runtime,
+            metrics_interval=0, inbound_queue_size=inbound_queue_size,
+            messages=messages)
+        self.controller.connect()
+        self.session = self.controller.session()
+        self.errors = ErrorCounter()
+        get_logger().addHandler(self.errors)
+        self.outcomes = []
+        self.player = self.runtime.create_client("Player")
+        self.player.on_message = self.__on_message
+        self.player.connect()
+        self.player.subscribe(self.session.game_control_topic)
+        self.runtime.settle()
+
+    def close(self):
+        get_logger().removeHandler(self.errors)
+        self.controller.disconnect()
+
+    @property
+    def now(self):
+        return self.runtime.now()
+
+    def advance(self, seconds):
+        self.runtime.advance(seconds)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """
+        Publishes a message of the player and handles it.
+        """
+        self.player.publish(self.session.prefix + topic, payload, qos, retain)
+        self.runtime.settle()
+
+    def active_puzzles(self):
+        """
+        Returns the active workflows waiting for a message of a puzzle.
+        """
+        if self.session.status is None:
+            return []
+        puzzles = []
+        for workflow in self.session.status.workflows:
+            if workflow.state is WorkflowState.ACTIVE and \
+                    isinstance(workflow, Workflow) and \
+                    not isinstance(workflow, DelayWorkflow):
+                puzzles.append(workflow)
+        return puzzles
+
+    def run_trace(self, trace):
+        """
+        Replays a trace of events: (delay in seconds, topic, payload).
+        An event without topic only advances the time.
+
+        Return
+        ------
+        outcome : str
+            "SOLVED", "FAILED" or None if the game didn't end.
+        """
+        count = len(self.outcomes)
+        for delay, topic, payload in trace:
+            self.advance(delay)
+            if topic is not None:
+                self.publish(topic, payload)
+        return self.outcomes[-1] if len(self.outcomes) > count else None
+
+    def play(self, rng, duration=60, participants=3, think_time=40.0,
+             noise=0.1, pause=0.01, skip=0.01):
+        """
+        Plays a game with a randomized player until it's solved or the game
+        time expired. The player sends status messages to the active
+        puzzles; some of them are noise, the game is paused and puzzles are
+        skipped now and then.
+
+        Parameters
+        ----------
+        rng : Random
+            The random number generator.
+
+        duration : int
+            The game time in minutes.
+
+        participants : int
+            The number of participants.
+
+        think_time : float
+            The mean time in seconds between two actions of the player.
+
+        noise, pause, skip : float
+            The probabilities of a noise message, a pause of the game and a
+            skipped puzzle per action.
+
+        Return
+        ------
+        outcome : str
+            "SOLVED", "FAILED" or None if the game didn't end in time.
+
+        trace : list
+            The events of the game, which can be replayed by run_trace().
+        """
+        trace = []
+        last = self.now
+        count = len(self.outcomes)
+        options = json.dumps({"participants": participants, "duration": duration})
+
+        def send(topic, payload):
+            nonlocal last
+            trace.append((round(self.now - last, 3), topic, payload))
+            last = self.now
+            self.publish(topic, payload)
+
+        send("op/gameOptions", options)
+        send("op/gameControl", "START")
+        # The game ends with the game time at the latest
+        deadline = self.now + duration * 60 + 5
+        while len(self.outcomes) == count and self.now < deadline:
+            self.advance(rng.expovariate(1 / think_time))
+            if len(self.outcomes) > count:
+                break
+            puzzles = self.active_puzzles()
+            action = rng.random()
+            if action < pause:
+                paused = rng.uniform(1, 120)
+                send("op/gameControl", "PAUSE")
+                self.advance(paused)
+                deadline += paused
+                send("op/gameControl", "START")
+            elif puzzles and action < pause + skip:
+                puzzle = rng.choice(puzzles)
+                send("op/gameControl", "SKIP " + puzzle.name)
+            elif puzzles and action < pause + skip + noise:
+                send(rng.choice(puzzles).topic, rng.choice(NOISE))
+            elif puzzles:
+                send(rng.choice(puzzles).topic,
+                     '{"method": "STATUS", "state": "SOLVED"}')
+        trace.append((round(self.now - last, 3), None, None))
+        outcome = self.outcomes[-1] if len(self.outcomes) > count else None
+        return outcome, trace
+
+    def __on_message(self, client, userdata, msg):
+        payload = msg.payload.decode("utf-8")
+        if not msg.retain and payload in ("SOLVED", "FAILED"):
+            self.outcomes.append(payload)
+
+
+def parse_args():
+    """
+    Parses the command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Plays simulated games against the workflow engine "
+                    "on a virtual clock.")
+    parser.add_argument(
+        "--workflow_def", "-d",
+        default="workflow_definition:WorkflowDefinition",
+        help="definition of the workflow: \"module:class\" or the path of a "
+             "YAML/JSON definition file. "
+             "(default: workflow_definition:WorkflowDefinition)")
+    parser.add_argument(
+        "--games", "-n", type=int, default=100,
+        help="number of games played by randomized players. (default: 100)")
+    parser.add_argument(
+        "--seed", type=int, default=0,
+        help="seed of the randomized players, a game is reproduced "
+             "by it's seed and number. (default: 0)")
+    parser.add_argument(
+        "--duration", type=int, default=60,
+        help="game time in minutes. (default: 60)")
+    parser.add_argument(
+        "--latency", type=float, default=0,
+        help="maximum random delay of the message deliveries in "
+             "milliseconds. (default: 0)")
+    parser.add_argument(
+        "--trace", "-t",
+        help="replays a trace (JSON: [[delay, topic, payload], ...]) instead "
+             "of random games, \"scripted\" replays the built-in trace.")
+    parser.add_argument(
+        "--record", "-r",
+        help="writes the trace of the first game with errors to a file.")
+    parser.add_argument(
+        "--message_dir", "-m",
+        help="records the games in a message journal in this directory "
+             "(see replay.py).")
+    parser.add_argument(
+        "--log_level", "-l", default="CRITICAL",
+        help="log level of the engine. (default: CRITICAL)")
+    return parser.parse_args()
+
+
+def load_factory(definition):
+    """
+    Loads the workflow factory like main.py.
+    """
+    from workflow_loader import WorkflowFile, is_definition_file
+    if is_definition_file(definition):
+        return WorkflowFile(definition)
+    module_name, class_name = definition.split(":")
+    return getattr(__import__(module_name), class_name)()
+
+
+def main():
+    args = parse_args()
+    engine_log.setup(args.log_level.upper(), "text", stream=sys.stderr)
+    workflow_factory = load_factory(args.workflow_def)
+    rng = random.Random(args.seed)
+    latency = None
+    if args.latency:
+        latency = lambda: rng.uniform(0, args.latency / 1000)  # noqa: E731
+
+    wall = time.perf_counter()
+    simulation = Simulation(workflow_factory, latency,
+                            message_dir=args.message_dir)
+    results = {"SOLVED": 0, "FAILED": 0, None: 0}
+    failures = 0
+    if args.trace:
+        if args.trace == "scripted":
+            trace = SCRIPTED_TRACE
+        else:
+            with open(args.trace) as f:
+                trace = json.load(f)
+        outcome = simulation.run_trace(trace)
+        results[outcome] += 1
+        failures = len(simulation.errors.records)
+        games = 1
+    else:
+        games = args.games
+        for game in range(games):
+            rng.seed(f"{args.seed}:{game}")
+            errors = len(simulation.errors.records)
+            outcome, trace = simulation.play(rng, args.duration)
+            results[outcome] += 1
+            if outcome is None or len(simulation.errors.records) > errors \
+                    or simulation.session.game_state != GameState.STOPPED:
+                failures += 1
+                print(f"Game {game} (seed {args.seed}) went wrong: "
+                      f"outcome {outcome}, state "
+                      f"{simulation.session.game_state.name}", file=sys.stderr)
+                if args.record and failures == 1:
+                    with open(args.record, "w") as f:
+                        json.dump(trace, f, indent=1)
+            # The next game starts after a break
+            simulation.advance(60)
+    simulated = simulation.now
+    simulation.close()
+    wall = time.perf_counter() - wall
+
+    print(f"{games} games: {results['SOLVED']} solved, "
+          f"{results['FAILED']} failed, {results[None]} unfinished, "
+          f"{len(simulation.errors.records)} errors")
+    print(f"{simulated / 3600:.1f} h simulated in {wall:.2f} s "
+          f"({simulated / wall:.0f}x real time), "
+          f"{simulation.runtime.broker.published} messages")
+    return 1 if failures or results[None] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
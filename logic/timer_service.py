@@ -0,0 +1,157 @@
+import heapq
+import itertools
+import threading
+import time
+from engine_log import get_logger
+
+
+log = get_logger("timers")
+
+
+class TimerHandle:
+    """
+    Handle of a scheduled timer, which allows to cancel it.
+    """
+
+    def __init__(self, deadline, callback, args):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        deadline : float
+            The monotonic time the timer expires.
+
+        callback : Function
+            Handler function: callback(*args)
+
+        args : tuple
+            The arguments passed to the callback.
+        """
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Cancels the timer. A cancelled timer is never executed.
+        """
+        self.cancelled = True
+
+
+class TimerService:
+    """
+    The timer service executes callbacks at registered deadlines.
+    All deadlines are kept in a heap which is processed by one scheduler
+    thread, so timers don't depend on MQTT messages and have
+    millisecond resolution.
+    """
+
+    def __init__(self, executor=None, clock=time.monotonic):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        executor : Function
+            Optional: Function executing the expired callbacks,
+            ex. to hold a lock: executor(callback, *args)
+
+        clock : Function
+            The monotonic clock returning the time in seconds.
+        """
+        self.executor = executor
+        self.clock = clock
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def schedule(self, delay_sec, callback, *args):
+        """
+        Schedules a callback.
+
+        Parameters
+        ----------
+        delay_sec : float
+            The delay in seconds.
+
+        callback : Function
+            Handler function: callback(*args)
+
+        Return
+        ------
+        handle : TimerHandle
+            The handle to cancel the timer.
+        """
+        handle = TimerHandle(self.clock() + delay_sec, callback, args)
+        with self._condition:
+            heapq.heappush(
+                self._heap, (handle.deadline, next(self._counter), handle))
+            if self._thread is None:
+                self._running = True
+                self._thread = threading.Thread(
+                    target=self.__run, name="TimerService", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return handle
+
+    def cancel(self, handle):
+        """
+        Cancels a scheduled timer.
+
+        Parameters
+        ----------
+        handle : TimerHandle
+            The handle returned by schedule().
+        """
+        if handle:
+            handle.cancel()
+
+    def stop(self):
+        """
+        Stops the scheduler thread and drops all pending timers.
+        """
+        with self._condition:
+            self._running = False
+            self._heap.clear()
+            self._condition.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _execute(self, handle):
+        if self.executor:
+            self.executor(self.__call, handle)
+        else:
+            self.__call(handle)
+
+    def __call(self, handle):
+        # The timer may have been cancelled while waiting for the executor
+        if not handle.cancelled:
+            handle.callback(*handle.args)
+
+    def __run(self):
+        while True:
+            with self._condition:
+                if not self._running:
+                    return
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                deadline, _, handle = self._heap[0]
+                if handle.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
+                now = self.clock()
+                if deadline > now:
+                    self._condition.wait(deadline - now)
+                    continue
+                heapq.heappop(self._heap)
+
+            try:
+                self._execute(handle)
+            except Exception:
+                log.exception("Timer callback failed")
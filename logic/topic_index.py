@@ -0,0 +1,187 @@
+def is_wildcard(topic_filter):
+    """
+    Checks whether a topic filter contains MQTT wildcards.
+
+    >>> is_wildcard("1/cube/state")
+    False
+    >>> is_wildcard("2/ledstrip/#")
+    True
+    >>> is_wildcard("3/+/antenna")
+    True
+    """
+    return "+" in topic_filter or "#" in topic_filter
+
+
+def topic_matches(topic_filter, topic):
+    """
+    Checks whether a topic matches a MQTT topic filter
+    (including the wildcards '+' and '#').
+
+    >>> topic_matches("1/cube/state", "1/cube/state")
+    True
+    >>> topic_matches("3/gamecontrol/+", "3/gamecontrol/map")
+    True
+    >>> topic_matches("3/gamecontrol/+", "3/gamecontrol/map/x")
+    False
+    >>> topic_matches("2/ledstrip/#", "2/ledstrip/labroom/north")
+    True
+    >>> topic_matches("2/ledstrip/#", "2/ledstrip")
+    True
+    >>> topic_matches("#", "$SYS/broker/uptime")
+    False
+    """
+    if topic_filter == topic:
+        return True
+    if topic.startswith("$") and topic_filter[:1] in ("+", "#"):
+        return False
+
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class TopicIndex:
+    """
+    The topic index maps MQTT topics to the subscribers (active workflows)
+    interested in them. Exact topics are resolved with a single dictionary
+    lookup, wildcard filters are matched once per topic and cached.
+
+    >>> index = TopicIndex()
+    >>> index.add("1/cube/state", "cube")
+    True
+    >>> index.add("3/gamecontrol/+", "radio")
+    True
+    >>> index.match("1/cube/state")
+    ('cube',)
+    >>> index.match("3/gamecontrol/map")
+    ('radio',)
+    >>> index.match("5/battery/1/level")
+    ()
+    >>> index.remove("3/gamecontrol/+", "radio")
+    True
+    >>> index.match("3/gamecontrol/map")
+    ()
+    """
+
+    def __init__(self, cache_size=1024):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        cache_size : int
+            Maximum number of resolved topics kept in the match cache.
+        """
+        self.cache_size = cache_size
+        self._exact = {}
+        self._wildcards = {}
+        self._subscribers = {}
+        self._cache = {}
+
+    def add(self, topic_filter, subscriber):
+        """
+        Adds a subscriber for a topic filter.
+
+        Parameters
+        ----------
+        topic_filter : str
+            The MQTT topic filter (wildcards are supported).
+
+        subscriber : any
+            The subscriber which provides a method "on_message(msg)".
+
+        Return
+        ------
+        first : bool
+            True, if this is the first subscriber of the topic filter.
+        """
+        filters = self._wildcards if is_wildcard(topic_filter) else self._exact
+        subscribers = filters.setdefault(topic_filter, [])
+        first = not subscribers
+        if subscriber not in subscribers:
+            subscribers.append(subscriber)
+            count = self._subscribers.get(subscriber, 0)
+            self._subscribers[subscriber] = count + 1
+        self._cache.clear()
+        return first
+
+    def remove(self, topic_filter, subscriber):
+        """
+        Removes a subscriber from a topic filter.
+
+        Parameters
+        ----------
+        topic_filter : str
+            The MQTT topic filter (wildcards are supported).
+
+        subscriber : any
+            The subscriber to be removed.
+
+        Return
+        ------
+        last : bool
+            True, if no subscriber is left for the topic filter.
+        """
+        filters = self._wildcards if is_wildcard(topic_filter) else self._exact
+        subscribers = filters.get(topic_filter)
+        if subscribers is None:
+            return False
+        if subscriber in subscribers:
+            subscribers.remove(subscriber)
+            count = self._subscribers.pop(subscriber) - 1
+            if count > 0:
+                self._subscribers[subscriber] = count
+        if not subscribers:
+            del filters[topic_filter]
+        self._cache.clear()
+        return not subscribers
+
+    def contains(self, subscriber):
+        """
+        Checks whether a subscriber is still subscribed to any topic filter.
+        """
+        return subscriber in self._subscribers
+
+    def match(self, topic):
+        """
+        Returns all subscribers of the filters matching the given topic.
+
+        Parameters
+        ----------
+        topic : str
+            The topic of a received message.
+
+        Return
+        ------
+        subscribers : tuple
+            The subscribers in order of their subscription.
+        """
+        subscribers = self._cache.get(topic)
+        if subscribers is None:
+            subscribers = list(self._exact.get(topic, ()))
+            for topic_filter, wildcard_subscribers in self._wildcards.items():
+                if topic_matches(topic_filter, topic):
+                    for subscriber in wildcard_subscribers:
+                        if subscriber not in subscribers:
+                            subscribers.append(subscriber)
+            subscribers = tuple(subscribers)
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[topic] = subscribers
+        return subscribers
+
+    def clear(self):
+        """
+        Removes all subscriptions.
+        """
+        self._exact.clear()
+        self._wildcards.clear()
+        self._subscribers.clear()
+        self._cache.clear()
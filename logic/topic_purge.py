@@ -0,0 +1,130 @@
+from engine_log import get_logger
+
+
+log = get_logger("purge")
+
+
+class RetainedPurge:
+    """
+    The retained purge removes all retained messages below a topic filter
+    with the existing MQTT client. It subscribes to the topic filter,
+    collects the topics of the retained messages sent by the server during
+    a bounded window and clears them with empty retained publishes.
+    The messages are handed to the client as one batch, so the clearing is
+    pipelined and ordered before any later publish.
+    """
+
+    def __init__(self, client, timers, topic_filter="#", exclude=(),
+                 window=0.5):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        client : Client
+            MQTT client
+
+        timers : TimerService
+            The timer service bounding the collection window.
+
+        topic_filter : str
+            The topic filter of the purged topics.
+
+        exclude : str[]
+            Topics which aren't purged.
+
+        window : float
+            The time in seconds the retained messages are collected.
+        """
+        self.client = client
+        self.timers = timers
+        self.topic_filter = topic_filter
+        self.exclude = frozenset(exclude)
+        self.window = window
+        self.topics = set()
+        self._callbacks = []
+        self._timer = None
+
+    @property
+    def running(self):
+        """
+        True, while the retained messages are collected.
+        """
+        return self._timer is not None
+
+    def start(self, on_done=None):
+        """
+        Starts collecting the retained messages.
+
+        Parameters
+        ----------
+        on_done : Function
+            Optional: Handler function called after the topics were
+            cleared: on_done()
+        """
+        if on_done:
+            self._callbacks.append(on_done)
+        if not self.running:
+            self.topics.clear()
+            self.client.subscribe(self.topic_filter)
+            self._timer = self.timers.schedule(self.window, self.__finish)
+
+    def add_done_callback(self, on_done):
+        """
+        Registers a further handler function for the completion.
+        """
+        self._callbacks.append(on_done)
+
+    def matches(self, msg):
+        """
+        Returns True, if the message is a retained message of the purge
+        (without collecting it, see collect()).
+        """
+        return self.running and bool(msg.retain)
+
+    def collect(self, msg):
+        """
+        Collects the topic of a retained message.
+
+        Parameters
+        ----------
+        msg : MQTTMessage
+            Message from the MQTT topic.
+
+        Return
+        ------
+        collected : bool
+            True, if the message was a retained message of the purge.
+        """
+        if not self.running:
+            return False
+        if not msg.retain:
+            # The topic got a new message during the window (ex. the
+            # game state published by the engine), it isn't stale anymore
+            self.topics.discard(msg.topic)
+            return False
+        # Empty payloads are already removed retained messages
+        if msg.payload and msg.topic not in self.exclude:
+            self.topics.add(msg.topic)
+        return True
+
+    def cancel(self):
+        """
+        Cancels the purge without clearing the topics.
+        """
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+            self.client.unsubscribe(self.topic_filter)
+        self._callbacks.clear()
+
+    def __finish(self):
+        self._timer = None
+        self.client.unsubscribe(self.topic_filter)
+        for topic in sorted(self.topics):
+            self.client.publish(topic, None, 1, True)
+        log.info("Purged %d retained topics of '%s'",
+                 len(self.topics), self.topic_filter)
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
@@ -1,7 +1,8 @@
 from threading import Timer
 import subprocess
 from enum import Enum
-from paho.mqtt import publish
+from publisher import get_publisher
+from engine_log import get_logger
 
 
 class Location(Enum):
@@ -58,7 +59,7 @@ class ProcessList(list):
             for process in self:
                 process.wait()
         except subprocess.CalledProcessError as e:
-            print(str(e))
+            get_logger("util").error("%s", e)
             self.wait()
 
 
@@ -71,11 +72,12 @@ class RepeatTimer(Timer):
             self.function(*self.args, **self.kwargs)
 
 
-def publish_tts(text):
+def publish_tts(text, host=None):
     """
     This method publishes a message to the TTS topic to have it played
     :param text: The text to play
+    :param host: An optional MQTT server (default: UE_MQTT_HOST or 10.0.0.2)
     :return:
     """
     msg = f'{{"method":"message","data":"{text}"}}'
-    publish.single("2/textToSpeech", msg, hostname="10.0.0.2")
+    get_publisher(host).publish("2/textToSpeech", msg)
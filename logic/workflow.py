@@ -1,5 +1,10 @@
+import functools
 import json
-from message import Message, Method, State, fromJSON
+import logging
+import time
+from engine_log import get_workflow_logger
+from message import Method, State, fromJSON, encode
+from topic_index import topic_matches
 from enum import Enum
 
 
@@ -10,11 +15,204 @@ class WorkflowState(Enum):
     SKIPPED = 3
 
 
+# The workflow states by their value (the codes in the status table)
+_STATES = tuple(WorkflowState)
+
+
+class StatusTable:
+    """
+    The status table keeps the states of all workflows of a tree in one
+    array, indexed by the node index (the order of walk()). The workflows
+    read and write their state in the table, so the states of a game can
+    be copied or compared as a single bytes object.
+
+    >>> root = SequenceWorkflow("Main", [Workflow("A", "a"), Workflow("B", "b")])
+    >>> root.workflows[1].state = WorkflowState.FINISHED
+    >>> table = StatusTable(root)
+    >>> table.snapshot()
+    b'\\x00\\x00\\x02'
+    >>> table.restore(b'\\x01\\x02\\x00')
+    >>> [w.state.name for w in table.workflows]
+    ['ACTIVE', 'FINISHED', 'INACTIVE']
+    """
+
+    __slots__ = ("workflows", "states")
+
+    def __init__(self, root):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        root : BaseWorkflow
+            The root of the workflow tree.
+        """
+        self.workflows = list(root.walk())
+        self.states = bytearray(len(self.workflows))
+        for index, workflow in enumerate(self.workflows):
+            self.states[index] = workflow._status[workflow._index]
+            workflow._status = self.states
+            workflow._index = index
+
+    def snapshot(self):
+        """
+        Returns the states of all workflows as bytes.
+        """
+        return bytes(self.states)
+
+    def restore(self, states):
+        """
+        Restores the states of all workflows (without notifying changes).
+
+        Parameters
+        ----------
+        states : bytes
+            The states returned by snapshot().
+        """
+        self.states[:] = states
+
+
+class WorkflowIndex:
+    """
+    The workflow index resolves the workflows of a tree by their name
+    (case insensitive) without walking the tree. It's built once with the
+    tree and keeps the parent of every workflow, so a skip can check the
+    ancestors and a "skip to" can mark the preceding siblings in one pass.
+
+    The names of the workflows shown in the graph must be unique. The
+    workflows hidden in combined workflows are only indexed if their name
+    is unique in the tree.
+
+    >>> root = SequenceWorkflow("Main", [
+    ...     SequenceWorkflow("Room 1", [Workflow("A", "a"), Workflow("B", "b")]),
+    ...     SequenceWorkflow("Room 2", [Workflow("C", "c")])])
+    >>> index = WorkflowIndex(root)
+    >>> index.find("room 1").name
+    'Room 1'
+    >>> [w.name for w in index.skip_to("c")]
+    ['Room 1']
+    >>> [w.state.name for w in index.workflows]
+    ['INACTIVE', 'INACTIVE', 'SKIPPED', 'SKIPPED', 'INACTIVE', 'INACTIVE']
+    >>> WorkflowIndex(SequenceWorkflow("Main", [Workflow("A", "a"), Workflow("a", "b")]))
+    Traceback (most recent call last):
+    ...
+    ValueError: Duplicate workflow name 'a'.
+    """
+
+    __slots__ = ("workflows", "parents", "names")
+
+    def __init__(self, root):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        root : BaseWorkflow
+            The root of the workflow tree.
+        """
+        self.workflows = []
+        self.parents = []
+        self.names = {}
+        hidden = {}
+        stack = [(root, -1, False)]
+        while stack:
+            workflow, parent, combined = stack.pop()
+            index = len(self.workflows)
+            self.workflows.append(workflow)
+            self.parents.append(parent)
+            key = workflow.name.upper()
+            if combined:
+                # Ambiguous hidden workflows can't be addressed by name
+                hidden[key] = None if key in hidden else index
+            elif key in self.names:
+                raise ValueError(f"Duplicate workflow name '{workflow.name}'.")
+            else:
+                self.names[key] = index
+            children = getattr(workflow, 'workflows', ())
+            combined = combined or isinstance(workflow, CombinedWorkflow)
+            for child in reversed(children):
+                stack.append((child, index, combined))
+        for key, index in hidden.items():
+            if index is not None and key not in self.names:
+                self.names[key] = index
+
+    def find(self, name):
+        """
+        Returns the workflow with the given name or None.
+        """
+        index = self.names.get(name.upper())
+        return None if index is None else self.workflows[index]
+
+    def skip(self, name):
+        """
+        Skips the workflow with the given name (and all of it's child
+        workflows), unless it's already finished.
+
+        Return
+        ------
+        workflow : BaseWorkflow
+            The skipped workflow or None, if the name is unknown.
+        """
+        index = self.names.get(name.upper())
+        if index is None:
+            return None
+        parent = self.parents[index]
+        while parent >= 0:
+            if self.workflows[parent].state is WorkflowState.FINISHED:
+                return self.workflows[index]
+            parent = self.parents[parent]
+        workflow = self.workflows[index]
+        workflow.skip(workflow.name)
+        return workflow
+
+    def skip_to(self, name):
+        """
+        Skips all workflows preceding the workflow with the given name:
+        the preceding siblings of the workflow and of it's ancestors in
+        sequences.
+
+        Return
+        ------
+        skipped : BaseWorkflow[]
+            The skipped workflows or None, if the name is unknown.
+        """
+        index = self.names.get(name.upper())
+        if index is None:
+            return None
+        skipped = []
+        parent = self.parents[index]
+        target = self.workflows[index]
+        while parent >= 0:
+            sequence = self.workflows[parent]
+            if isinstance(sequence, SequenceWorkflow):
+                position = sequence.workflows.index(target)
+                siblings = sequence.workflows[:position]
+                for workflow in siblings:
+                    workflow.skip(workflow.name)
+                skipped[:0] = siblings
+            target = sequence
+            parent = self.parents[parent]
+        return skipped
+
+
 class BaseWorkflow:
     """
     This class provides the basic structure and functionality for workflows.
+    The workflows are slotted; the state is kept in a status table, which
+    is shared by all workflows of a tree (see StatusTable).
     """
 
+    __slots__ = ("name", "settings", "log", "highlight", "_status", "_index",
+                 "_on_workflow_failed", "_on_workflow_finished",
+                 "_on_workflow_changed", "_graph_nodes")
+
+    # The class name is shown as node type in the graph
+    type = "BaseWorkflow"
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.type = cls.__name__
+
     def __init__(self, name, settings=None):
         """
         Initializes a new instance of this class.
@@ -29,12 +227,37 @@ class BaseWorkflow:
         """
         self.name = name
         self.settings = settings
+        self.log = get_workflow_logger(name)
         self._on_workflow_failed = None
         self._on_workflow_finished = None
-        self.state = WorkflowState.INACTIVE
-        self.type = self.__class__.__name__
+        self._on_workflow_changed = None
+        # Own status until the tree is attached to a status table
+        self._status = bytearray(1)
+        self._index = 0
+        self._graph_nodes = ()
         self.highlight = False
 
+    @property
+    def state(self):
+        """
+        The current state of the workflow.
+        """
+        return _STATES[self._status[self._index]]
+
+    @state.setter
+    def state(self, value):
+        if value.value != self._status[self._index]:
+            self._status[self._index] = value.value
+            self.log.info("Workflow state '%s'", value.name,
+                          extra={"event": "workflow_state", "state": value})
+            self._changed()
+
+    def walk(self):
+        """
+        Iterates over this workflow and all of it's child workflows.
+        """
+        yield self
+
     def execute(self, client):
         """
         Executes this workflow.
@@ -84,10 +307,43 @@ class BaseWorkflow:
         if self.state is WorkflowState.ACTIVE:
             self.state = WorkflowState.INACTIVE
 
+    def snapshot(self):
+        """
+        Returns the runtime state of this workflow (without it's child
+        workflows) as compact dictionary, which can be serialized as JSON.
+        """
+        return {'s': self._status[self._index]}
+
+    def restore(self, data):
+        """
+        Restores the runtime state of this workflow from a snapshot.
+        The workflow isn't executed, see resume().
+
+        Parameters
+        ----------
+        data : dict
+            The data returned by snapshot().
+        """
+        self._status[self._index] = WorkflowState(data['s']).value
+
+    def resume(self, client):
+        """
+        Resumes a restored workflow: the subscriptions, callbacks and timers
+        of the active workflows are set up again, without publishing the
+        triggers of their execution.
+
+        Parameters
+        ----------
+        client : Client
+            MQTT client
+        """
+        pass
+
     def skip(self, name):
         if self.state not in [WorkflowState.SKIPPED, WorkflowState.FINISHED]:
             if name.upper() == self.name.upper():
-                print(f"[{self.name}] Mark workflow as skipped...")
+                self.log.info("Mark workflow as skipped...",
+                              extra={"event": "skip"})
                 old_state = self.state
                 self.state = WorkflowState.SKIPPED
                 if old_state is WorkflowState.ACTIVE:
@@ -145,18 +401,90 @@ class BaseWorkflow:
         """
         self._on_workflow_finished = func
 
+    def register_on_changed(self, func):
+        """
+        Register a new handler for handling changes of the graph node data
+        (state, message state or message) of the workflow.
+
+        Parameters
+        ----------
+        func : Function
+            Handler function: func(workflow)
+        """
+        self._on_workflow_changed = func
+
+    def _changed(self):
+        """
+        Marks the graph node data of the workflow as dirty.
+        """
+        if self._on_workflow_changed:
+            self._on_workflow_changed(self)
+
     def get_graph_config(self):
         """
         Generates a JSON configuration for a cyptoscape graph.
         """
+        return json.dumps(self.build_graph(False))
+
+    def build_graph(self, track=True):
+        """
+        Generates the configuration for a cyptoscape graph.
+
+        Parameters
+        ----------
+        track : bool
+            Whether the created node data is kept by the workflows, so it
+            can be patched in place by update_graph_nodes().
+
+        Return
+        ------
+        graphConfig : dict
+            Nodes and edges of the graph.
+        """
+        workflows = list(self.walk())
+        tracked_nodes = [workflow._graph_nodes for workflow in workflows]
+        for workflow in workflows:
+            workflow._graph_nodes = []
+
         graph = self.get_graph()
 
+        if not track:
+            for workflow, nodes in zip(workflows, tracked_nodes):
+                workflow._graph_nodes = nodes
+
         graphConfig = {
             'nodes': graph[0],
             'edges': graph[1]
         }
 
-        return json.dumps(graphConfig)
+        return graphConfig
+
+    def update_graph_nodes(self):
+        """
+        Patches the node data created by the last build_graph() call
+        with the current state of the workflow.
+
+        Return
+        ------
+        changed_nodes : dict[]
+            The node data which was changed.
+        """
+        changed_nodes = []
+        status = self._create_node_status()
+        for nodeData in self._graph_nodes:
+            changed = False
+            for key in ('status', 'messageState', 'message'):
+                value = status.get(key)
+                if value is None:
+                    if key in nodeData:
+                        del nodeData[key]
+                        changed = True
+                elif nodeData.get(key) != value:
+                    nodeData[key] = value
+                    changed = True
+            if changed:
+                changed_nodes.append(nodeData)
+        return changed_nodes
 
     def get_graph(self, predecessors=None, parent=None,
                   name=None, highlight=None):
@@ -218,12 +546,21 @@ class BaseWorkflow:
             'id': name_id,
             'name': name_id,
             'highlight': hl,
-            'status': self.state.name,
             'type': self.type
         }
+        nodeData.update(self._create_node_status())
+        if not self._graph_nodes:
+            self._graph_nodes = []
+        self._graph_nodes.append(nodeData)
 
         return nodeData
 
+    def _create_node_status(self):
+        """
+        Creates the variable part of the node data.
+        """
+        return {'status': self.state.name}
+
     def _create_edges(self, target, predecessors):
         """
         Generates the edges from a target and it's predecessors.
@@ -261,6 +598,8 @@ class Workflow(BaseWorkflow):
     https://github.com/ubilab-ws21/operator/blob/master/doc/design/general_%CE%BCC_workflow.svg
     """
 
+    __slots__ = ("topic", "client", "_message_state", "_message")
+
     def __init__(self, name, topic, settings=None):
         """
         Initializes a new instance of this class.
@@ -279,8 +618,34 @@ class Workflow(BaseWorkflow):
         super().__init__(name, settings)
         self.topic = topic
         self.client = None
-        self.message_state = None
-        self.message = None
+        self._message_state = None
+        self._message = None
+
+    @property
+    def message_state(self):
+        """
+        The state of the last status message.
+        """
+        return self._message_state
+
+    @message_state.setter
+    def message_state(self, value):
+        if value is not self._message_state:
+            self._message_state = value
+            self._changed()
+
+    @property
+    def message(self):
+        """
+        The data of the last status message.
+        """
+        return self._message
+
+    @message.setter
+    def message(self, value):
+        if value != self._message:
+            self._message = value
+            self._changed()
 
     def execute(self, client):
         """
@@ -321,6 +686,25 @@ class Workflow(BaseWorkflow):
         self._unsubscripeFromTopic(client)
         super()._dispose(client)
 
+    def snapshot(self):
+        data = super().snapshot()
+        if self._message_state:
+            data['m'] = self._message_state.name
+        if self._message is not None:
+            data['d'] = self._message
+        return data
+
+    def restore(self, data):
+        super().restore(data)
+        message_state = data.get('m')
+        self._message_state = State[message_state] if message_state else None
+        self._message = data.get('d')
+
+    def resume(self, client):
+        self.client = client
+        if self.state is WorkflowState.ACTIVE:
+            self._subscripeToTopic(client)
+
     def on_message(self, msg):
         """
         Processes the message sended by the MQTT server.
@@ -332,13 +716,15 @@ class Workflow(BaseWorkflow):
         """
         try:
             # Check for relevant topic
-            if msg.topic != self.topic:
+            if not topic_matches(self.topic, msg.topic):
                 return
 
             message = msg.payload.decode("utf-8")
             obj = fromJSON(message)
             if obj.method == Method.STATUS:
-                print(f"[{self.name}] State change to '{obj.state.name}'")
+                self.log.info("State change to '%s'", obj.state.name,
+                              extra={"event": "status", "state": obj.state,
+                                     "data": obj.data})
                 self.message_state = obj.state
                 self.message = obj.data
                 if obj.state == State.INACTIVE:
@@ -355,7 +741,9 @@ class Workflow(BaseWorkflow):
                         f"[{self.name}] State '{obj.state}' is not supported"
                     )
             elif obj.method == Method.TRIGGER:
-                print(f"[{self.name}] Requested trigger '{obj.state.name}'")
+                self.log.info("Requested trigger '%s'", obj.state.name,
+                              extra={"event": "trigger_request",
+                                     "state": obj.state})
                 if obj.state == State.ON:
                     self._on_received_trigger_on(obj.data)
                 elif obj.state == State.OFF:
@@ -367,8 +755,8 @@ class Workflow(BaseWorkflow):
                         f"'{obj.state}' is not supported"
                     )
             elif obj.method == Method.MESSAGE:
-                print(f"[{self.name}] Received message with method 'MESSAGE'. "
-                      "Nothing to do...")
+                self.log.debug("Received message with method 'MESSAGE'. "
+                               "Nothing to do...")
             else:
                 self.on_error(
                     self.name,
@@ -376,7 +764,8 @@ class Workflow(BaseWorkflow):
                 )
         except Exception as e:
             error_msg = f"[{self.name}] No valid JSON: {str(e)}"
-            print(error_msg)
+            self.log.warning("No valid JSON: %s", e,
+                             extra={"topic": msg.topic})
             self.on_error(self.name, error_msg)
 
         super().on_message(msg)
@@ -393,11 +782,18 @@ class Workflow(BaseWorkflow):
         """
         nodeData = super()._create_node_data(name, highlight)
         nodeData['topic'] = self.topic
+        return nodeData
+
+    def _create_node_status(self):
+        """
+        Creates the variable part of the node data.
+        """
+        status = super()._create_node_status()
         if self.message_state:
-            nodeData['messageState'] = self.message_state.name
+            status['messageState'] = self.message_state.name
         if self.message:
-            nodeData['message'] = self.message
-        return nodeData
+            status['message'] = self.message
+        return status
 
     def on_finished(self, name, skipped=False):
         self._publishTrigger(self.client, State.OFF, skipped)
@@ -409,49 +805,69 @@ class Workflow(BaseWorkflow):
                 data = "skipped"
             else:
                 data = self.get_settings()
-            message = Message(Method.TRIGGER, state, data)
-            client.publish(self.topic, message.toJSON(), 2)
-            msg = f"[{self.name}] Trigger state '{state.name}'"
-            if data:
-                msg += f" with settings '{data}'"
-            print(msg + "...")
+            client.publish(self.topic, encode(Method.TRIGGER, state, data), 2)
+            self.log.info("Trigger state '%s'...", state.name,
+                          extra={"event": "trigger", "state": state,
+                                 "topic": self.topic, "data": data})
 
     def _subscripeToTopic(self, client):
         if self.topic is not None:
-            client.subscribe(self.topic)
-            print(f"[{self.name}] Subscribed to topic '{self.topic}'...")
+            client.subscribe(self.topic, self)
+            self.log.debug("Subscribed to topic '%s'...", self.topic)
 
     def _unsubscripeFromTopic(self, client):
         if self.topic is not None:
-            client.unsubscribe(self.topic)
-            print(f"[{self.name}] Unsubscribed from topic '{self.topic}'...")
+            client.unsubscribe(self.topic, self)
+            self.log.debug("Unsubscribed from topic '%s'...", self.topic)
 
     def _on_received_status_inactive(self, data):
-        print("  ==> Nothing to do")
+        self.log.debug("Nothing to do")
 
     def _on_received_status_active(self, data):
-        print("  ==> Nothing to do")
+        self.log.debug("Nothing to do")
 
     def _on_received_status_finished(self, data):
-        print("  ==> Puzzle solved successfully")
+        self.log.info("Puzzle solved successfully")
         self.on_finished(self.name)
 
     def _on_received_status_failed(self, data):
-        print("  ==> An error occured: %s" % (data))
+        self.log.error("An error occured: %s", data,
+                       extra={"event": "failed", "data": data})
         self.on_error(self.name, data)
 
     def _on_received_trigger_on(self, data):
-        print("  ==> Nothing to do")
+        self.log.debug("Nothing to do")
 
     def _on_received_trigger_off(self, data):
-        print("  ==> Nothing to do")
+        self.log.debug("Nothing to do")
 
 
 class SequenceWorkflow(BaseWorkflow):
     """
     This class implements a wrapper to run multiple workflows in sequence.
+
+    The workflows are stepped by a loop: a workflow finishing while it's
+    executed (ex. a single command or a skipped workflow) only advances
+    the current workflow and the loop executes the next one. So the stack
+    depth is bounded by the depth of the tree, not by the length of the
+    sequence.
+
+    >>> from engine_client import EngineClient
+    >>> class Client:
+    ...     def publish(self, *args): pass
+    ...     def subscribe(self, topic): pass
+    ...     def unsubscribe(self, topic): pass
+    >>> chain = SequenceWorkflow("Chain", [
+    ...     Workflow(f"Step {i}", f"step/{i}") for i in range(10000)])
+    >>> for workflow in chain.workflows[:-1]:
+    ...     workflow.skip(workflow.name)
+    >>> chain.execute(EngineClient(Client()))
+    >>> chain.current_workflow, chain.workflows[-1].state.name
+    (9999, 'ACTIVE')
     """
 
+    __slots__ = ("workflows", "client", "current_workflow", "_stepping")
+
     def __init__(self, name, workflows, settings=None):
         """
         Initializes a new instance of this class.
@@ -471,6 +887,15 @@ class SequenceWorkflow(BaseWorkflow):
         self.workflows = workflows
         self.client = None
         self.current_workflow = 0
+        self._stepping = False
+
+    def walk(self):
+        """
+        Iterates over this workflow and all of it's child workflows.
+        """
+        yield self
+        for workflow in self.workflows:
+            yield from workflow.walk()
 
     def _execute(self, client):
         """
@@ -483,7 +908,7 @@ class SequenceWorkflow(BaseWorkflow):
         """
         super()._execute(client)
         self.client = client
-        self.__subscribe_current_workflow(self.client)
+        self.__step()
 
     def _dispose(self, client):
         """
@@ -499,11 +924,28 @@ class SequenceWorkflow(BaseWorkflow):
             self.__unsubscribe_current_workflow(self.client)
         super()._dispose(client)
 
+    def snapshot(self):
+        data = super().snapshot()
+        data['c'] = self.current_workflow
+        return data
+
+    def restore(self, data):
+        super().restore(data)
+        self.current_workflow = data['c']
+
+    def resume(self, client):
+        self.client = client
+        if self.state is WorkflowState.ACTIVE and \
+                self.current_workflow < len(self.workflows):
+            self.__register_current_workflow()
+            self.workflows[self.current_workflow].resume(client)
+
     def skip(self, name):
         skipped = False
         if self.state is not WorkflowState.FINISHED:
             if name.upper() == self.name.upper():
-                print(f"[{self.name}] Set workflow sequence to skipped...")
+                self.log.info("Set workflow sequence to skipped...",
+                              extra={"event": "skip"})
                 skipped = True
 
             for workflow in self.workflows:
@@ -560,17 +1002,34 @@ class SequenceWorkflow(BaseWorkflow):
     def on_finished(self, name, skipped=False):
         self.__unsubscribe_current_workflow(self.client)
         self.current_workflow += 1
-        if self.current_workflow >= len(self.workflows):
-            print(f"  ==> Workflow sequence '{self.name}' finished...")
-            super().on_finished(self.name)
-        else:
-            self.__subscribe_current_workflow(self.client)
+        if not self._stepping:
+            self.__step()
 
-    def __subscribe_current_workflow(self, client):
+    def __step(self):
+        """
+        Executes the workflows from the current one on, until a workflow
+        doesn't finish immediately or the sequence is finished.
+        """
+        self._stepping = True
+        try:
+            while self.current_workflow < len(self.workflows):
+                position = self.current_workflow
+                workflow = self.__register_current_workflow()
+                workflow.execute(self.client)
+                if self.current_workflow == position or \
+                        self.state is not WorkflowState.ACTIVE:
+                    # Waiting for the workflow or disposed meanwhile
+                    return
+        finally:
+            self._stepping = False
+        self.log.info("Workflow sequence finished...")
+        super().on_finished(self.name)
+
+    def __register_current_workflow(self):
         workflow = self.workflows[self.current_workflow]
         workflow.register_on_failed(self.on_error)
         workflow.register_on_finished(self.on_finished)
-        workflow.execute(client)
+        return workflow
 
     def __unsubscribe_current_workflow(self, client):
         workflow = self.workflows[self.current_workflow]
@@ -582,9 +1041,40 @@ class ParallelWorkflow(BaseWorkflow):
     This class implements a wrapper to run multiple workflows in parallel.
     The parallel workflow is a composition organising the flow of one or
     more arbitary workflows.
+
+    The finished child workflows are tracked by their position in a bitset
+    and a counter of the remaining ones, so a completion costs the same for
+    large groups (ex. many sensors). By default all child workflows have to
+    finish; with a quorum the first N of M finish the parallel workflow and
+    the others are stopped, with a timeout it finishes after the given time
+    in any case.
+
+    >>> from engine_client import EngineClient
+    >>> from message import Method, State, encode
+    >>> from types import SimpleNamespace as Msg
+    >>> class Client:
+    ...     def publish(self, *args): pass
+    ...     def subscribe(self, topic): pass
+    ...     def unsubscribe(self, topic): pass
+    >>> client = EngineClient(Client())
+    >>> sensors = ParallelWorkflow("Sensors", [
+    ...     Workflow(f"Sensor {i}", f"sensor/{i}") for i in range(5)], quorum=2)
+    >>> sensors.execute(client)
+    >>> solved = encode(Method.STATUS, State.SOLVED)
+    >>> for i in (3, 3, 1):
+    ...     for subscriber in client.index.match(f"sensor/{i}"):
+    ...         subscriber.on_message(Msg(topic=f"sensor/{i}", payload=solved))
+    >>> sensors.state.name, [w.state.name[0] for w in sensors.workflows]
+    ('FINISHED', ['I', 'F', 'I', 'F', 'I'])
+    >>> client.index.match("sensor/0")
+    ()
     """
 
-    def __init__(self, name, workflows, settings=None):
+    __slots__ = ("workflows", "quorum", "timeout_sec", "client", "timer",
+                 "end_time", "_finished", "_remaining", "_active")
+
+    def __init__(self, name, workflows, settings=None, quorum=None,
+                 timeout_sec=None):
         """
         Initializes a new instance of this class.
 
@@ -598,14 +1088,45 @@ class ParallelWorkflow(BaseWorkflow):
 
         settings: keywords
             An dictionary of global settings.
+
+        quorum : int
+            Optional: The number of child workflows which have to finish,
+            1 up to the number of child workflows (default: all).
+
+        timeout_sec : float
+            Optional: The time in seconds the workflow finishes at the
+            latest, even if the quorum isn't reached.
         """
         super().__init__(name, settings)
         self.workflows = workflows
-        self.workflow_finished = {}
-        for workflow in self.workflows:
-            self.workflow_finished[workflow.name] = False
+        if quorum is None:
+            quorum = len(workflows)
+        elif not 1 <= quorum <= len(workflows):
+            raise ValueError(
+                f"The quorum of '{name}' must be 1-{len(workflows)}.")
+        self.quorum = quorum
+        self.timeout_sec = timeout_sec
+        self.client = None
+        self.timer = None
+        # Wall clock time the timeout ends (kept in snapshots)
+        self.end_time = None
+        # Bitset of the finished child workflows by position
+        self._finished = 0
+        self._remaining = quorum
+        # The running child workflows by position
+        self._active = {}
+        for i, workflow in enumerate(self.workflows):
             workflow.register_on_failed(self.on_error)
-            workflow.register_on_finished(self.on_finished)
+            workflow.register_on_finished(
+                functools.partial(self.__on_child_finished, i))
+
+    def walk(self):
+        """
+        Iterates over this workflow and all of it's child workflows.
+        """
+        yield self
+        for workflow in self.workflows:
+            yield from workflow.walk()
 
     def _execute(self, client):
         """
@@ -616,11 +1137,27 @@ class ParallelWorkflow(BaseWorkflow):
         client : Client
             MQTT client
         """
-        names = [w.name for w in self.workflows]
-        print(f"[{', '.join(names)}] Starting in parallel...")
+        if self.log.isEnabledFor(logging.INFO):
+            names = [w.name for w in self.workflows]
+            self.log.info("Starting in parallel: %s", ", ".join(names))
+        # Active before the child workflows, they may finish immediately
+        super()._execute(client)
+        self.client = client
+        self._finished = 0
+        self._remaining = self.quorum
+        self._active = dict(enumerate(self.workflows))
+        if self.timeout_sec is not None:
+            self.end_time = time.time() + self.timeout_sec
+            self.timer = client.timers.schedule(
+                self.timeout_sec, self.__on_timeout)
+        if self._remaining <= 0:
+            self.__complete()
+            return
         for workflow in self.workflows:
+            if self.state is not WorkflowState.ACTIVE:
+                # The quorum was reached by the previous workflows
+                break
             workflow.execute(client)
-        super()._execute(client)
 
     def _dispose(self, client):
         """
@@ -631,16 +1168,47 @@ class ParallelWorkflow(BaseWorkflow):
         client : Client
             MQTT client
         """
+        self.__cancel_timer()
         if self.state is WorkflowState.ACTIVE:
-            for workflow in self.workflows:
+            for workflow in self._active.values():
                 workflow.dispose(client)
+        self._active = {}
+        self.end_time = None
         super()._dispose(client)
 
+    def snapshot(self):
+        data = super().snapshot()
+        data['f'] = [i for i in range(len(self.workflows))
+                     if self._finished >> i & 1]
+        if self.end_time is not None:
+            data['e'] = self.end_time
+        return data
+
+    def restore(self, data):
+        super().restore(data)
+        self._finished = 0
+        for i in data['f']:
+            self._finished |= 1 << i
+        self._remaining = self.quorum - len(data['f'])
+        self._active = {i: workflow for i, workflow in enumerate(self.workflows)
+                        if not self._finished >> i & 1}
+        self.end_time = data.get('e')
+
+    def resume(self, client):
+        self.client = client
+        if self.state is WorkflowState.ACTIVE:
+            for workflow in self._active.values():
+                workflow.resume(client)
+            if self.end_time is not None:
+                remaining = max(self.end_time - time.time(), 0)
+                self.timer = client.timers.schedule(remaining, self.__on_timeout)
+
     def skip(self, name):
         skipped = False
         if self.state is not WorkflowState.FINISHED:
             if name.upper() == self.name.upper():
-                print(f"[{self.name}] Set parallel workflows to skipped...")
+                self.log.info("Set parallel workflows to skipped...",
+                              extra={"event": "skip"})
                 skipped = True
 
             for workflow in self.workflows:
@@ -658,7 +1226,8 @@ class ParallelWorkflow(BaseWorkflow):
         msg : Message
             Message from the MQTT topic.
         """
-        for workflow in self.workflows:
+        # A workflow may finish the others, so the running ones are copied
+        for workflow in list(self._active.values()):
             workflow.on_message(msg)
         super().on_message(msg)
 
@@ -694,12 +1263,44 @@ class ParallelWorkflow(BaseWorkflow):
 
         return nodes, edges, final_states
 
-    def on_finished(self, name, skipped=False):
-        self.workflow_finished[name] = True
-        if all(list(self.workflow_finished.values())):
-            print(f"  ==> Parallel workflow sequence"
-                  f" '{self.name}' finished...")
-            super().on_finished(self.name)
+    def __on_child_finished(self, position, name):
+        bit = 1 << position
+        # Finished workflows may report again (ex. a repeated SOLVED)
+        if self._finished & bit or self.state is not WorkflowState.ACTIVE:
+            return
+        self._finished |= bit
+        workflow = self._active.pop(position, None)
+        if workflow is not None:
+            workflow.dispose(self.client)
+        self._remaining -= 1
+        if self._remaining <= 0:
+            if self._active:
+                self.log.info("Quorum of %d/%d workflows reached...",
+                              self.quorum, len(self.workflows))
+            self.__complete()
+
+    def __on_timeout(self):
+        self.timer = None
+        if self.state is WorkflowState.ACTIVE:
+            self.log.info("Parallel workflow timed out after %ss, "
+                          "%d of %d workflows finished.", self.timeout_sec,
+                          len(self.workflows) - len(self._active),
+                          len(self.workflows))
+            self.__complete()
+
+    def __complete(self):
+        self.__cancel_timer()
+        # The workflows not needed for the quorum are stopped
+        for workflow in self._active.values():
+            workflow.dispose(self.client)
+        self._active = {}
+        self.log.info("Parallel workflow sequence finished...")
+        super().on_finished(self.name)
+
+    def __cancel_timer(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
 
 
 class CombinedWorkflow(SequenceWorkflow):
@@ -708,6 +1309,8 @@ class CombinedWorkflow(SequenceWorkflow):
     it's capsulate workflows as one node in the graph config.
     """
 
+    __slots__ = ()
+
     def get_graph(self, predecessors=None, parent=None):
         """
         Generates a graph from the workflow and returns a tuple:
@@ -747,6 +1350,8 @@ class SingleCommandWorkflow(BaseWorkflow):
     This workflow executes a single command without waiting for an answer.
     """
 
+    __slots__ = ()
+
     def _execute(self, client):
         """
         Executes this workflow.
@@ -756,7 +1361,7 @@ class SingleCommandWorkflow(BaseWorkflow):
         client : Client
             MQTT client
         """
-        print(f"[{self.name}] Executing single command workflow.")
+        self.log.debug("Executing single command workflow.")
         super()._execute(client)
         self._execute_single_command(client)
         self.on_finished(self.name)
@@ -778,3 +1383,140 @@ class SingleCommandWorkflow(BaseWorkflow):
         single command (atomic).
         """
         pass
+
+
+class BurstWorkflow(CombinedWorkflow):
+    """
+    This combined workflow publishes the commands of all it's workflows at
+    once, instead of executing them one after another. The commands are
+    independent, so they are pipelined without waiting for their
+    acknowledgements; the burst is finished when the MQTT server
+    acknowledged all of them (see PublishTracker). Without a tracker of
+    the client it's finished right after publishing.
+
+    The workflows have to be single commands or bursts.
+
+    >>> from engine_client import EngineClient
+    >>> published = []
+    >>> class Client:
+    ...     def publish(self, topic, *args): published.append(topic)
+    >>> class Command(SingleCommandWorkflow):
+    ...     def _execute_single_command(self, client):
+    ...         client.publish(self.name, b"on")
+    >>> burst = BurstWorkflow("Lights", [Command("light/1"), BurstWorkflow(
+    ...     "Doors", [Command("door/1"), Command("door/2")])])
+    >>> burst.execute(EngineClient(Client()))
+    >>> published
+    ['light/1', 'door/1', 'door/2']
+    >>> [w.state.name for w in burst.walk()]
+    ['FINISHED', 'FINISHED', 'FINISHED', 'FINISHED', 'FINISHED']
+    """
+
+    __slots__ = ("ack_timeout", "_pending")
+
+    def __init__(self, name, workflows, settings=None, ack_timeout=5.0):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        name : str
+            Display name of the workflow.
+
+        workflows : Workflow[]
+            Collection of single commands should be published at once.
+
+        settings: keywords
+            An dictionary of global settings.
+
+        ack_timeout : float
+            The time in seconds to wait at most for the acknowledgements.
+        """
+        for workflow in workflows:
+            if not isinstance(workflow, (SingleCommandWorkflow, BurstWorkflow)):
+                raise ValueError(
+                    f"The workflow '{workflow.name}' of the burst '{name}' "
+                    "isn't a single command.")
+        super().__init__(name, workflows, settings)
+        self.ack_timeout = ack_timeout
+        self._pending = None
+
+    def _execute(self, client):
+        """
+        Executes this workflow.
+
+        Parameters
+        ----------
+        client : EngineClient
+            MQTT client
+        """
+        self.log.debug("Publishing burst of commands.")
+        BaseWorkflow._execute(self, client)
+        self.client = client
+        with client.batch() as published:
+            self._publish(client)
+        self.current_workflow = len(self.workflows)
+        if client.acks is None:
+            self.__on_acknowledged(True)
+        else:
+            self._pending = client.acks.wait(
+                published, self.__on_acknowledged, self.ack_timeout)
+
+    def _publish(self, client):
+        """
+        Publishes the commands of the workflows (nested bursts are
+        published as part of this burst).
+
+        Parameters
+        ----------
+        client : EngineClient
+            MQTT client
+        """
+        for workflow in self.workflows:
+            if workflow.state is WorkflowState.SKIPPED:
+                continue
+            if isinstance(workflow, BurstWorkflow):
+                BaseWorkflow._execute(workflow, client)
+                workflow._publish(client)
+                workflow.current_workflow = len(workflow.workflows)
+                workflow.state = WorkflowState.FINISHED
+            else:
+                workflow.execute(client)
+
+    def _dispose(self, client):
+        """
+        Disposes this workflow.
+
+        Parameters
+        ----------
+        client : Client
+            MQTT client
+        """
+        self.__cancel()
+        self.current_workflow = 0
+        BaseWorkflow._dispose(self, client)
+
+    def resume(self, client):
+        """
+        Overridden: The commands were published before, so a restored
+        active burst is finished without waiting again.
+        """
+        self.client = client
+        if self.state is WorkflowState.ACTIVE:
+            self._pending = client.timers.schedule(
+                0, self.__on_acknowledged, True)
+
+    def __on_acknowledged(self, acked):
+        self._pending = None
+        if self.state is not WorkflowState.ACTIVE:
+            return
+        if not acked:
+            self.log.warning("Commands weren't acknowledged within %s s",
+                             self.ack_timeout)
+        self.log.info("Workflow burst finished...")
+        BaseWorkflow.on_finished(self, self.name)
+
+    def __cancel(self):
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
@@ -1,27 +1,33 @@
-import paho.mqtt.client as mqtt
-import subprocess
-import json
-from workflow import SequenceWorkflow
-from workflow_extras import LightControlWorkflow, TTSAudioWorkflow
-from message import State
-from util import Location
-from game_timer import GameTimer
-from enum import Enum
+import os
+import time
+from game_session import GameSession, GameState  # noqa: F401
+from runtime import ThreadRuntime
+from topic_index import TopicIndex
+from engine_client import PublishTracker
+from engine_log import get_logger
+from game_journal import GameJournal
+from inbound_queue import DEFAULT_COALESCE
+from message_journal import RecordingPublisher
+from metrics import registry as metrics
 
 
-class GameState(Enum):
-    STOPPED = 0
-    STARTED = 1
-    PAUSED = 2
+DEFAULT_CLIENT_ID = "EscapeRoomGameLogic"
+
+log = get_logger("controller")
 
 
 class WorkflowController:
     """
-    The workflow controller manages the MQTT connection and organizes
-    the transitions between the registered workflows.
+    The workflow controller manages the MQTT connection and hosts the
+    game sessions. All sessions share the connection, the topic index
+    and the timer service; the messages are routed to the sessions by
+    their topic prefix.
     """
 
-    def __init__(self, mqtt_url, workflow_factory):
+    def __init__(self, mqtt_url, workflow_factory=None, runtime=None,
+                 client_id=DEFAULT_CLIENT_ID, metrics_interval=10.0,
+                 journal_dir=None, inbound_queue_size=1000,
+                 coalesce=DEFAULT_COALESCE, messages=None):
         """
         Initializes a new instance of this class.
 
@@ -31,167 +37,244 @@ class WorkflowController:
             The url of the MQTT server.
 
         workflow_factory : WorkflowFactory
-            A factory which creates the workflow structure defining
-            the sequence of their execution.
+            Optional: A factory which creates the workflow structure of
+            the game session without topic prefix.
+
+        runtime : ThreadRuntime, AsyncioRuntime
+            Optional: The runtime executing the engine
+            (default: ThreadRuntime).
+
+        client_id : str
+            The client id of the MQTT connection.
+
+        metrics_interval : float
+            The interval in seconds the metrics are published
+            to "op/metrics" (0: disabled).
+
+        journal_dir : str
+            Optional: The directory of the game journals. If set, the state
+            of the games is persisted and resumed after a restart.
+
+        inbound_queue_size : int
+            The bound of the inbound queue between the MQTT client and the
+            game sessions (0: the messages are handled on the network
+            thread of the client).
+
+        coalesce : str[]
+            Topic filters (without session prefix) of the topics where only
+            the latest pending message is handled.
+
+        messages : MessageJournal
+            Optional: The journal recording all received and published
+            messages and the workflow transitions of the games. It's closed
+            on disconnect.
         """
+        self.runtime = runtime if runtime is not None else ThreadRuntime()
         self.client = None
+        self.client_id = client_id
         self.mqtt_url = mqtt_url
-        self.game_control_topic = "op/gameControl"
-        self.game_timer_topic = "op/gameTime"
-        self.game_state_topic = "op/gameState"
-        self.game_option_topic = "op/gameOptions"
-        self.options = None
-        self.workflow_factory = workflow_factory
-        self.last_graph_config = None
-        self.game_timer = GameTimer(mqtt_url, self.game_timer_topic)
-        self.game_timer.register_on_expired(self.__on_game_time_expired)
-        self.game_state = GameState.STOPPED
-        self.main_sequence = None
+        self.metrics_topic = "op/metrics"
+        self.metrics_interval = metrics_interval
+        self.journal_dir = journal_dir
+        self.messages = messages
+        self._resumed = False
+        self.index = TopicIndex()
+        self.sessions = {}
+        self._routes = []
+        self._pending = []
+        # Serializes the MQTT callbacks and the timer callbacks
+        self.lock = self.runtime.create_lock()
+        self.timers = self.runtime.create_timer_service(self.__execute_timer)
+        self.acks = PublishTracker(self.timers)
+        self.coalesce = tuple(coalesce)
+        self.inbound = None
+        if inbound_queue_size:
+            self.inbound = self.runtime.create_inbound_queue(
+                self.__handle_message, maxsize=inbound_queue_size,
+                routed=self.__is_routed)
+            metrics.gauge("engine_inbound_queue_depth",
+                          "Messages waiting in the inbound queue.",
+                          lambda: len(self.inbound))
+        if workflow_factory is not None:
+            self.add_session("", workflow_factory)
+
+    def add_session(self, prefix, workflow_factory):
+        """
+        Adds a game session.
+
+        Parameters
+        ----------
+        prefix : str
+            The topic prefix of the session, ex. "room1"
+            ("": the session uses the plain topics).
+
+        workflow_factory : WorkflowFactory
+            A factory which creates the workflow structure of the session.
+        """
+        if prefix and not prefix.endswith("/"):
+            prefix += "/"
+        if prefix in self.sessions or prefix in [p for p, _ in self._pending]:
+            raise ValueError(f"The session '{prefix}' already exists.")
+        if self.client is None:
+            # The sessions are created with the client in connect()
+            self._pending.append((prefix, workflow_factory))
+            return None
+        return self.__create_session(prefix, workflow_factory)
+
+    def session(self, prefix=""):
+        """
+        Returns the game session of a topic prefix.
+        """
+        if prefix and not prefix.endswith("/"):
+            prefix += "/"
+        return self.sessions[prefix]
 
     def connect(self):
         """
-        Connects the game to the MQTT server
-        and subscripes to the game control topic.
+        Connects the game sessions to the MQTT server
+        and subscripes to their game control topics.
         """
-        self.client = mqtt.Client("EscapeRoomGameLogic", False)
+        self.client = self.runtime.create_client(self.client_id)
+        if self.messages is not None:
+            # Every message sent over the connection is recorded
+            self.client.publish = RecordingPublisher(
+                self.client, self.messages, self.__game).publish
         self.client.on_connect = self.__on_connect
         self.client.on_message = self.__on_message
+        self.client.on_publish = self.acks.on_publish
+        pending, self._pending = self._pending, []
+        for prefix, workflow_factory in pending:
+            self.__create_session(prefix, workflow_factory)
+        if self.inbound is not None:
+            self.inbound.start()
+        self.runtime.attach(self.client)
         self.client.connect(self.mqtt_url)
-        self.client.loop_start()
-        print("Waiting for game control commands...")
+        self.runtime.start(self.client)
+        if self.metrics_interval:
+            self.timers.schedule(self.metrics_interval, self.__publish_metrics)
+        log.info("Waiting for game control commands...")
 
     def disconnect(self):
+        self.timers.stop()
         self.client.disconnect()
-        self.client.loop_stop()
-        print("Main workflow disconnected...")
+        self.runtime.stop(self.client)
+        if self.inbound is not None:
+            self.inbound.stop()
+        if self.messages is not None:
+            self.messages.close()
+        log.info("Main workflow disconnected...")
 
-    def start(self):
+    def publish_game_state(self):
         """
-        Starts the main workflow.
+        Publishes the changed game states of all sessions.
         """
-        if self.game_state != GameState.STARTED:
-            self.__purge_all_topics()
-            if self.game_state == GameState.STOPPED:
-                workflow = self.workflow_factory.create(self.options)
-                self.main_sequence = SequenceWorkflow("Main workflow", workflow)
-                self.main_sequence.highlight = True
-                self.main_sequence.register_on_finished(self.__on_workflow_solved)
-                self.main_sequence.execute(self.client)
-            print("Starting game timer...")
-            self.game_timer.set_duration(self.options["duration"])
-            self.game_timer.start()
-            self.game_state = GameState.STARTED
-            print("Main workflow started...")
+        for session in self.sessions.values():
+            session.publish_game_state()
 
-    def stop(self):
-        """
-        Stops the main workflow.
-        """
-        if self.game_state != GameState.STOPPED:
-            self.game_timer.stop()
-            self.main_sequence.dispose(self.client)
-            self.game_state = GameState.STOPPED
-            self.__purge_all_topics()
-            print("Main workflow stopped...")
+    def __create_session(self, prefix, workflow_factory):
+        journal = None
+        if self.journal_dir:
+            name = prefix.rstrip("/").replace("/", "_") or "default"
+            journal = GameJournal(
+                os.path.join(self.journal_dir, f"{name}.journal"))
+        publisher = self.runtime.create_publisher(self.mqtt_url, self.client)
+        if self.messages is not None and publisher is not self.client:
+            # The game time is sent over the connection of the publisher
+            publisher = RecordingPublisher(
+                publisher, self.messages, self.__game)
+        session = GameSession(
+            self.mqtt_url, workflow_factory, self.client, self.index,
+            self.timers, publisher, prefix, journal, self.acks, self.messages)
+        self.sessions[prefix] = session
+        # The longest prefix wins, the session without prefix matches all
+        self._routes = sorted(
+            self.sessions.values(), key=lambda s: len(s.prefix), reverse=True)
+        if self.inbound is not None:
+            # The game control is never dropped by the inbound queue
+            self.inbound.configure(
+                coalesce=[s.prefix + f for s in self._routes
+                          for f in self.coalesce],
+                reserved=[t for s in self._routes
+                          for t in (s.game_control_topic, s.game_option_topic)])
+        if self.client.is_connected():
+            session.subscribe()
+        return session
 
-    def reset(self):
-        """
-        Resets the main workflow
-        """
-        self.stop()
-        self.start()
+    def __route(self, topic):
+        for session in self._routes:
+            if topic.startswith(session.prefix):
+                return session
+        return None
 
-    def pause(self):
+    def __game(self, topic):
         """
-        Pauses the main workflow.
+        Returns the ID of the game a topic belongs to (0: no game running).
         """
-        if self.game_state != GameState.PAUSED:
-            self.game_timer.pause()
-            self.game_state = GameState.PAUSED
-            print("Main workflow paused...")
-
-    def skip(self, workflow_name):
-        """
-        Skip the workflow with a given name.
-        """
-        self.main_sequence.skip(workflow_name)
+        session = self.__route(topic)
+        return session.workflow_client.game if session else 0
 
     def __on_connect(self, client, userdata, flags, rc):
         """
         Subscribing in on_connect() means that if we lose the connection and
         reconnect then subscriptions will be renewed.
         """
-        client.subscribe(self.game_control_topic)
-        client.subscribe(self.game_option_topic)
-        print("Main workflow (re)connected...")
+        with self.lock:
+            if not self._resumed:
+                # Resume the games persisted before a restart
+                self._resumed = True
+                for session in self.sessions.values():
+                    if session.resume():
+                        session.publish_game_state()
+            for session in self.sessions.values():
+                session.subscribe()
+        log.info("Main workflow (re)connected...")
 
     def __on_message(self, client, userdata, msg):
-        if msg.topic == self.game_control_topic:
-            self.__handle_command(msg)
-        elif msg.topic == self.game_option_topic:
-            self.__save_options(msg)
+        arrival = time.perf_counter()
+        metrics.messages.inc(msg.topic)
+        if self.messages is not None:
+            self.__record_message(msg)
+        if self.inbound is not None:
+            self.inbound.put(msg, arrival)
         else:
-            if self.main_sequence:
-                self.main_sequence.on_message(msg)
-        self.publish_game_state()
+            self.__handle_message(msg, arrival)
 
-    def publish_game_state(self):
-        if self.main_sequence:
-            config = self.main_sequence.get_graph_config()
-            if config != self.last_graph_config:
-                self.client.publish(self.game_state_topic, config, 0, True)
-                self.last_graph_config = config
-
-    def __handle_command(self, msg):
-        message = msg.payload.decode("utf-8").upper()
-        if message == "START":
-            self.start()
-        elif message == "STOP":
-            self.stop()
-        elif message == "PAUSE":
-            self.pause()
-        elif message.startswith("SKIP "):
-            workflow_name = message[5:].strip()
-            self.skip(workflow_name)
-        elif message == '':
-            pass
-        else:
-            print(f"The game command '{str(message)}' is not supported.")
-
-    def __save_options(self, msg):
-        message = msg.payload.decode("utf-8")
-        self.options = json.loads(message)
-
-    def __on_game_time_expired(self):
-        print("==================")
-        print("Game time expired!")
-        print("==================")
-        lwf = LightControlWorkflow(Location.SERVERROOM, State.ON, 255, (255, 0, 0))
-        lwf.execute(self.client)
-        lwf = LightControlWorkflow(Location.MAINROOM, State.ON, 255, (255, 0, 0))
-        lwf.execute(self.client)
-        awf = TTSAudioWorkflow("Play gameover", "gameover.mp3", True)
-        awf.execute(self.client)
-        self.client.publish(self.game_control_topic, "FAILED", 2, True)
-        self.stop()
-
-    def __on_workflow_solved(self, name):
-        print("==================================")
-        print("Escape room finished successfully!")
-        print("==================================")
-        self.client.publish(self.game_control_topic, "SOLVED", 2, True)
-        self.stop()
-
-    def __purge_all_topics(self):
-        print("=== Purges all topics ===")
-        try:
-            subprocess.Popen([
-                "/opt/ue-operator/mosquitto_sub",
-                "-h", self.mqtt_url,
-                "-t", "#",
-                "-T", "op/gameControl",
-                "-T", "op/gameOptions",
-                "--remove-retained",
-                "--retained-only"], stdout=subprocess.PIPE)
-        except subprocess.CalledProcessError:
-            pass
+    def __is_routed(self, topic):
+        """
+        Checks whether a topic is routed to an active workflow. Called by
+        the full inbound queue, it waits for the message being handled.
+        """
+        with self.lock:
+            return bool(self.index.match(topic))
+
+    def __record_message(self, msg):
+        """
+        Records a received message, before it's queued or dropped.
+        """
+        session = self.__route(msg.topic)
+        game = session.workflow_client.game if session else 0
+        # Retained messages collected by the purge aren't dispatched
+        purged = session is not None and session.purge.matches(msg)
+        self.messages.inbound(game, msg.topic, msg.payload, msg.qos,
+                              msg.retain, purged)
+
+    def __handle_message(self, msg, arrival):
+        with self.lock:
+            metrics.event_start = arrival
+            try:
+                session = self.__route(msg.topic)
+                if session and session.on_message(msg):
+                    session.publish_game_state()
+                    metrics.dispatch_latency.observe(
+                        time.perf_counter() - arrival)
+            finally:
+                metrics.event_start = None
+
+    def __publish_metrics(self):
+        self.client.publish(self.metrics_topic, metrics.to_json(), 0, False)
+        self.timers.schedule(self.metrics_interval, self.__publish_metrics)
+
+    def __execute_timer(self, callback, *args):
+        with self.lock:
+            callback(*args)
+            self.publish_game_state()
@@ -11,10 +11,8 @@ class WorkflowDefinition:
 
     def create(self, settings):
         participants = 4
-        skip_to = None
         if settings:
             participants = settings.get('participants')
-            skip_to = settings.get('skipTo')
 
         workflow = [
             # Init
@@ -39,21 +37,25 @@ class WorkflowDefinition:
             SequenceWorkflow("Lobby Room", [
                 Workflow("Power Failure Trigger", "env/powerfail"),
                 CombinedWorkflow("Power Failure Env", [
-                    LightControlWorkflow(Location.LOBBYROOM, State.ON, 255, (0, 0, 0)),
-                    LightControlWorkflow(Location.MAINROOM, State.ON, 255, (0, 0, 0)),
-                    LightControlWorkflow(Location.SERVERROOM, State.ON, 255, (0, 0, 0)),
+                    BurstWorkflow("Power Failure Blackout", [
+                        LightControlWorkflow(Location.LOBBYROOM, State.ON, 255, (0, 0, 0)),
+                        LightControlWorkflow(Location.MAINROOM, State.ON, 255, (0, 0, 0)),
+                        LightControlWorkflow(Location.SERVERROOM, State.ON, 255, (0, 0, 0)),
+                    ]),
                     DelayWorkflow("FailDelay1", 1),
                     TTSAudioWorkflow("FailTTS1", "Warning, power failure! Warning, power failure!"),
                     DelayWorkflow("FailDelay2", 5),
-                    LightControlWorkflow(Location.LOBBYROOM, State.ON, 255, (255, 0, 0)),
-                    SendTriggerWorkflow("Play Video Loop", "env/video", State.ON, data={"path":"/home/ubilab/Videos/PowerGridFailSplit/PowerGridFailSplit_2.mp4"}),
+                    BurstWorkflow("Power Failure Alarm", [
+                        LightControlWorkflow(Location.LOBBYROOM, State.ON, 255, (255, 0, 0)),
+                        SendTriggerWorkflow("Play Video Loop", "env/video", State.ON, data={"path":"/home/ubilab/Videos/PowerGridFailSplit/PowerGridFailSplit_2.mp4"}),
+                    ]),
                 ]),
                 SequenceWorkflow("Puzzle 1 - Cube", [
                     Workflow("Panels Released", "1/cube/state"),
                     Workflow("Panels Placed", "1/panel/state"),
                 ]),
                 Workflow("Input Keypad Code", "4/puzzle"),
-                CombinedWorkflow("1st Door", [
+                BurstWorkflow("1st Door", [
                     SendTriggerWorkflow("Open Control Room Door", "4/door/entrance", State.ON),
                     LightControlWorkflow(Location.MAINROOM, State.ON, 255, (255, 0, 0)),
                     TTSAudioWorkflow("Door1TTS1", "Warning, emergency backup battery empty, please recharge!"),
@@ -65,7 +67,7 @@ class WorkflowDefinition:
                 SequenceWorkflow("Puzzle 5 - Battery", [
                     Workflow("Battery Recharged", "5/control_room/power"),
                 ]),
-                CombinedWorkflow("Backup Power Restored Env", [
+                BurstWorkflow("Backup Power Restored Env", [
                     LightControlWorkflow(Location.LOBBYROOM, State.ON, 255, (255, 255, 255)),
                     LightControlWorkflow(Location.MAINROOM, State.ON, 255, (255, 255, 255)),
                     LightControlWorkflow(Location.SERVERROOM, State.ON, 255, (255, 0, 0)),
@@ -79,7 +81,7 @@ class WorkflowDefinition:
                 SequenceWorkflow("Puzzle 2 - Switchboard", [
                     Workflow("Switchboard Solved", "2/esp"),
                 ]),
-                CombinedWorkflow("2nd Door", [
+                BurstWorkflow("2nd Door", [
                     SendTriggerWorkflow("Open Server Room Door", "4/door/server", State.ON),
                     LightControlWorkflow(Location.SERVERROOM, State.ON, 255, (255, 255, 255)),
                 ]),
@@ -103,18 +105,12 @@ class WorkflowDefinition:
             ])
         ]
 
-        self.apply_initial_settings(workflow, skip_to)
+        self.apply_initial_settings(workflow)
 
         return workflow
 
-    def apply_initial_settings(self, workflow, skip_to):
-        skip_node_reached = False
+    def apply_initial_settings(self, workflow):
+        # Highlight room nodes
+        # (the "skipTo" option is applied by the game session)
         for w in workflow:
-            name = w.name.upper()
-            # Highlight room nodes
             w.highlight = True
-            # Skip until the "skip_to" node reached
-            if skip_to and name != skip_to.upper() and not skip_node_reached:
-                w.skip(name)
-            else:
-                skip_node_reached = True
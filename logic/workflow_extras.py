@@ -1,15 +1,19 @@
 import json
-from workflow import WorkflowState, Workflow, CombinedWorkflow, SingleCommandWorkflow
-from message import Message, Method, State
+import functools
+import time
+from workflow import WorkflowState, Workflow, BurstWorkflow, SingleCommandWorkflow
+from message import Method, State, encode
 from util import Location, LEDPattern
 
 
-class InitWorkflow(CombinedWorkflow):
+class InitWorkflow(BurstWorkflow):
     """
-    This workflow is just a named ("Init") combined workflow to do some initial
+    This workflow is just a named ("Init") burst workflow to do some initial
     tasks.
     """
 
+    __slots__ = ()
+
     def __init__(self, workflows, settings=None):
         """
         Initializes a new instance of this class.
@@ -31,12 +35,14 @@ class InitWorkflow(CombinedWorkflow):
         super().__init__("Init", workflows, settings)
 
 
-class ExitWorkflow(CombinedWorkflow):
+class ExitWorkflow(BurstWorkflow):
     """
-    This workflow is just a named ("Exit") combined workflow to do some
+    This workflow is just a named ("Exit") burst workflow to do some
     finalization tasks.
     """
 
+    __slots__ = ()
+
     def __init__(self, workflows, settings=None):
         """
         Initializes a new instance of this class.
@@ -63,6 +69,8 @@ class SendTriggerWorkflow(SingleCommandWorkflow):
     This workflow sends trigger:on and trigger:off to a given topic. Can optionally send data as well.
     """
 
+    __slots__ = ("target_state", "topic", "data", "payload")
+
     def __init__(self, name, topic, target_state, data=None):
         """
         Initializes a new instance of this class.
@@ -77,10 +85,14 @@ class SendTriggerWorkflow(SingleCommandWorkflow):
 
         target_state: State
             Target state of the workflow.
+
+        data: any
+            Optional: Data of the trigger.
         """
         self.target_state = target_state
         self.topic = topic
         self.data = data
+        self.payload = encode(Method.TRIGGER, target_state, data)
         super().__init__(name)
 
     def _execute_single_command(self, client):
@@ -92,13 +104,14 @@ class SendTriggerWorkflow(SingleCommandWorkflow):
         client : Client
             MQTT client
         """
-        self._publishTrigger(client, self.target_state, self.data)
+        self._publishTrigger(client, self.target_state)
 
-    def _publishTrigger(self, client, state, data=None):
+    def _publishTrigger(self, client, state):
         if self.topic is not None:
-            message = Message(Method.TRIGGER, state, data)
-            client.publish(self.topic, message.toJSON(), 2)
-            print(f"[{self.name}] Trigger '{state.name}' on topic '{self.topic}'...")
+            client.publish(self.topic, self.payload, 2)
+            self.log.info("Trigger '%s' on topic '%s'...", state.name, self.topic,
+                          extra={"event": "trigger", "state": state,
+                                 "topic": self.topic})
 
 
 class SendMessageWorkflow(SingleCommandWorkflow):
@@ -106,6 +119,8 @@ class SendMessageWorkflow(SingleCommandWorkflow):
     This workflow sends a message to a given topic.
     """
 
+    __slots__ = ("message", "topic", "payload")
+
     def __init__(self, name, topic, message_to_send):
         """
         Initializes a new instance of this class.
@@ -123,6 +138,7 @@ class SendMessageWorkflow(SingleCommandWorkflow):
         """
         self.message = message_to_send
         self.topic = topic
+        self.payload = encode(Method.MESSAGE, State.NONE, message_to_send)
         super().__init__(name)
 
     def _execute_single_command(self, client):
@@ -138,9 +154,9 @@ class SendMessageWorkflow(SingleCommandWorkflow):
 
     def _publishTrigger(self, client, message_str):
         if self.topic is not None:
-            message_obj = Message(Method.MESSAGE, State.NONE, message_str)
-            client.publish(self.topic, message_obj.toJSON(), 2)
-            print(f"[{self.name}] Message '{message_str}' sent to '{self.topic}'...")
+            client.publish(self.topic, self.payload, 2)
+            self.log.info("Message '%s' sent to '%s'...", message_str, self.topic,
+                          extra={"event": "message", "topic": self.topic})
 
 
 class TTSAudioWorkflow(SingleCommandWorkflow):
@@ -149,6 +165,10 @@ class TTSAudioWorkflow(SingleCommandWorkflow):
     audio files over the audio system.
     """
 
+    __slots__ = ("payload", "from_file", "encoded_message")
+
+    topic = "2/textToSpeech"
+
     def __init__(self, name, payload, from_file=False):
         """
         Initializes a new instance of this class.
@@ -166,18 +186,6 @@ class TTSAudioWorkflow(SingleCommandWorkflow):
         """
         self.payload = payload
         self.from_file = from_file
-        self.topic = "2/textToSpeech"
-        super().__init__(name)
-
-    def _execute_single_command(self, client):
-        """
-        Executes an atomic command.
-
-        Parameters
-        ----------
-        client : Client
-            MQTT client
-        """
         if self.from_file:
             message = {
                 "method": "message",
@@ -189,7 +197,57 @@ class TTSAudioWorkflow(SingleCommandWorkflow):
                 "method": "message",
                 "data": self.payload
             }
-        client.publish(self.topic, json.dumps(message), 2)
+        self.encoded_message = json.dumps(message).encode("utf-8")
+        super().__init__(name)
+
+    def _execute_single_command(self, client):
+        """
+        Executes an atomic command.
+
+        Parameters
+        ----------
+        client : Client
+            MQTT client
+        """
+        client.publish(self.topic, self.encoded_message, 2)
+
+
+def publish_light_commands(client, strips):
+    """
+    Publishes the commands of the given LED strips as one scene.
+    The commands are sent phase by phase (color/pattern, brightness,
+    power), so all strips change together. Repeated commands for a strip
+    within the scene are dropped; commands of earlier scenes aren't taken
+    into account, the engine doesn't know the real state of the strips
+    (ex. after a reboot of a strip).
+
+    Parameters
+    ----------
+    client : Client
+        MQTT client
+
+    strips : SingleLightControlWorkflow[]
+        The strips to control.
+
+    Return
+    ------
+    count : int
+        The number of published commands.
+    """
+    sent = set()
+    count = 0
+    phases = max([len(strip.commands) for strip in strips], default=0)
+    for phase in range(phases):
+        for strip in strips:
+            if phase >= len(strip.commands):
+                continue
+            payload = strip.commands[phase][2]
+            if (strip.topic, payload) in sent:
+                continue
+            sent.add((strip.topic, payload))
+            client.publish(strip.topic, payload, strip.qos)
+            count += 1
+    return count
 
 
 class SingleLightControlWorkflow(SingleCommandWorkflow):
@@ -197,8 +255,12 @@ class SingleLightControlWorkflow(SingleCommandWorkflow):
     This workflow allows to contol the light of the room.
     """
 
+    __slots__ = ("target_state", "brightness", "color", "topic", "pattern",
+                 "qos", "commands")
+
     def __init__(self, name, topic, target_state,
-                 brightness=255, color=(255, 255, 255), pattern=LEDPattern.RGB):
+                 brightness=255, color=(255, 255, 255), pattern=LEDPattern.RGB,
+                 qos=2):
         """
         Initializes a new instance of this class.
 
@@ -221,12 +283,20 @@ class SingleLightControlWorkflow(SingleCommandWorkflow):
 
         pattern: LEDPattern
             Pattern of the LED stripe (see util.py)
+
+        qos: int
+            The MQTT QoS level of the commands.
         """
         self.target_state = target_state
         self.brightness = brightness
         self.color = color
         self.topic = topic
         self.pattern = pattern
+        self.qos = qos
+
+        # Strips with the same settings share the encoded commands
+        self.commands = self._create_commands(
+            target_state, brightness, tuple(color), pattern)
         super().__init__(name)
 
     def _execute_single_command(self, client):
@@ -238,33 +308,46 @@ class SingleLightControlWorkflow(SingleCommandWorkflow):
         client : Client
             MQTT client
         """
-        if self.pattern == LEDPattern.RGB:
-            col = f"{self.color[0]},{self.color[1]},{self.color[2]}"
-            self._publishTrigger(client, 'rgb', col)
-        else:
-            self._publishTrigger(client, 'pattern', str(self.pattern))
-
-        self._publishTrigger(client, 'brightness', self.brightness)
-        self._publishTrigger(client, 'power', self.target_state.name.lower())
-
-    def _publishTrigger(self, client, state, data):
-        client.publish(
-            self.topic,
-            json.dumps({
-                'method': 'trigger',
-                'state': state,
-                'data': data
-            }),
-            2
-        )
-
+        publish_light_commands(client, [self])
 
-class LightControlWorkflow(CombinedWorkflow):
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _create_commands(target_state, brightness, color, pattern):
+        if pattern == LEDPattern.RGB:
+            commands = [('rgb', f"{color[0]},{color[1]},{color[2]}")]
+        else:
+            commands = [('pattern', str(pattern))]
+        commands.append(('brightness', brightness))
+        commands.append(('power', target_state.name.lower()))
+        return tuple(
+            (state, data, SingleLightControlWorkflow._encode_trigger(state, data))
+            for state, data in commands)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _encode_trigger(state, data):
+        return json.dumps({
+            'method': 'trigger',
+            'state': state,
+            'data': data
+        }).encode("utf-8")
+
+
+@functools.lru_cache(maxsize=256)
+def _scene_name(target_location, target_state, brightness, pattern):
+    # The scenes with the same settings share their name
+    return f"Turn {target_state.name} {target_location.name} lights {brightness}/255 pattern {pattern}"
+
+
+class LightControlWorkflow(BurstWorkflow):
     """
     This workflow controls the LED stripes at the specified location in one single workfow.
+    The commands of all stripes are published as one scene.
     """
 
-    def __init__(self, target_location, target_state, brightness=255, color=(255, 255, 255), pattern=LEDPattern.RGB):
+    __slots__ = ()
+
+    def __init__(self, target_location, target_state, brightness=255, color=(255, 255, 255), pattern=LEDPattern.RGB, qos=2):
         """
         Initializes a new instance of this class.
 
@@ -284,33 +367,52 @@ class LightControlWorkflow(CombinedWorkflow):
 
         pattern: LEDPattern
             Pattern of the LED stripe (see util.py)
+
+        qos: int
+            The MQTT QoS level of the scene's commands.
         """
         if target_location == Location.LOBBYROOM:
             workflows = [
-                SingleLightControlWorkflow("Control lobbyroom light", "2/ledstrip/lobby", target_state, brightness, color, pattern)
+                SingleLightControlWorkflow("Control lobbyroom light", "2/ledstrip/lobby", target_state, brightness, color, pattern, qos)
             ]
         elif target_location == Location.MAINROOM:  
             workflows = [
-                SingleLightControlWorkflow("Control mainroom light north", "2/ledstrip/labroom/north", target_state, brightness, color, pattern),
-                SingleLightControlWorkflow("Control mainroom light south", "2/ledstrip/labroom/south", target_state, brightness, color, pattern),
-                SingleLightControlWorkflow("Control mainroom light middle", "2/ledstrip/labroom/middle", target_state, brightness, color, pattern)
+                SingleLightControlWorkflow("Control mainroom light north", "2/ledstrip/labroom/north", target_state, brightness, color, pattern, qos),
+                SingleLightControlWorkflow("Control mainroom light south", "2/ledstrip/labroom/south", target_state, brightness, color, pattern, qos),
+                SingleLightControlWorkflow("Control mainroom light middle", "2/ledstrip/labroom/middle", target_state, brightness, color, pattern, qos)
             ]
         elif target_location == Location.SERVERROOM:
             workflows = [
-                SingleLightControlWorkflow("Control serverroom light", "2/ledstrip/serverroom", target_state, brightness, color, pattern),
+                SingleLightControlWorkflow("Control serverroom light", "2/ledstrip/serverroom", target_state, brightness, color, pattern, qos),
             ]
         else:
             workflows = []
 
-        name = f"Turn {target_state.name} {target_location.name} lights {brightness}/255 pattern {pattern}"
-        super().__init__(name, workflows, None)
+        super().__init__(_scene_name(target_location, target_state, brightness, pattern),
+                         workflows, None)
+
+    def _publish(self, client):
+        """
+        Overridden: Publishes the commands of the stripes as one scene.
+
+        Parameters
+        ----------
+        client : EngineClient
+            MQTT client
+        """
+        publish_light_commands(client, self.workflows)
+        for workflow in self.workflows:
+            workflow.state = WorkflowState.FINISHED
 
 
 class DelayWorkflow(Workflow):
     """
     This workflow implements a blocking delay.
+    The delay is registered with the timer service of the client.
     """
 
+    __slots__ = ("delay_sec", "timer", "end_time")
+
     def __init__(self, name, delay_sec):
         """
         Initializes a new instance of this class.
@@ -320,12 +422,14 @@ class DelayWorkflow(Workflow):
         name : str
             Display name of the workflow.
 
-        delay_sec : int
-            The number of seconds delay.
+        delay_sec : float
+            The number of seconds delay (millisecond resolution).
         """
         self.delay_sec = delay_sec
-        self.start_time = 0
-        super().__init__(name, "op/gameTime_in_sec")
+        self.timer = None
+        # Wall clock time the delay ends (kept in snapshots)
+        self.end_time = None
+        super().__init__(name, None)
 
     def _execute(self, client):
         """
@@ -336,39 +440,45 @@ class DelayWorkflow(Workflow):
         client : Client
             MQTT client
         """
-        print(f"[{self.name}] DelayWorkflow started with delay of {self.delay_sec}s.")
-        super()._subscripeToTopic(client)
+        self.log.info("DelayWorkflow started with delay of %ss.", self.delay_sec)
         self.state = WorkflowState.ACTIVE
+        self.end_time = time.time() + self.delay_sec
+        self.timer = client.timers.schedule(self.delay_sec, self.__on_delay_reached)
 
-    def on_message(self, msg):
+    def _dispose(self, client):
         """
-        Processes the message sent by the MQTT server.
+        Disposes this workflow.
 
         Parameters
         ----------
-        msg : Message
-            Message from the MQTT topic.
+        client : Client
+            MQTT client
         """
-        try:
-            # Check for relevant topic
-            if msg.topic != self.topic:
-                return
-
-            try:
-                current_sec = float(msg.payload.decode("utf-8"))
-            except:
-                return
-
-            if self.start_time > 0 and current_sec - self.start_time >= self.delay_sec:
-                print(f"[{self.name}] DelayWorkflow delay reached, done.")
-                self.state = WorkflowState.FINISHED
-                if self._on_workflow_finished:
-                    self._on_workflow_finished(self.name)
-            elif self.start_time <= 0:
-                print(f"[{self.name}] DelayWorkflow start_time set to {current_sec} (was {self.start_time})")
-                self.start_time = current_sec
-
-        except Exception as e:
-            error_msg = f"[{self.name}] Error: {str(e)}"
-            print(error_msg)
-            self.on_error(self.name, error_msg)
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        self.end_time = None
+        super()._dispose(client)
+
+    def snapshot(self):
+        data = super().snapshot()
+        if self.end_time is not None:
+            data['e'] = self.end_time
+        return data
+
+    def restore(self, data):
+        super().restore(data)
+        self.end_time = data.get('e')
+
+    def resume(self, client):
+        self.client = client
+        if self.state is WorkflowState.ACTIVE:
+            remaining = max(self.end_time - time.time(), 0)
+            self.log.info("DelayWorkflow resumed, %.3fs remaining.", remaining)
+            self.timer = client.timers.schedule(remaining, self.__on_delay_reached)
+
+    def __on_delay_reached(self):
+        self.timer = None
+        if self.state is WorkflowState.ACTIVE:
+            self.log.info("DelayWorkflow delay reached, done.")
+            self.on_finished(self.name)
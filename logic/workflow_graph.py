@@ -0,0 +1,136 @@
+import json
+import time
+import uuid
+from metrics import registry as metrics
+
+
+class WorkflowGraph:
+    """
+    The workflow graph caches the cytoscape graph configuration of a
+    workflow tree. Workflows report changes of their state, message state
+    or message, so only their nodes are patched in place and the
+    configuration is only serialized again if something changed.
+
+    Every change increments the sequence number of the graph. The changed
+    node data is collected as delta, so clients which already know the
+    full configuration only have to apply the changes.
+    """
+
+    def __init__(self, workflow):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        workflow : BaseWorkflow
+            The root of the workflow tree.
+        """
+        self.workflow = workflow
+        self.graph_id = uuid.uuid4().hex[:8]
+        self.sequence = 0
+        self.config = None
+        self._json = None
+        self._changed = set()
+        self._delta = {}
+        self._delta_base = 0
+        self._on_workflow_changed = None
+        for child in self.workflow.walk():
+            child.register_on_changed(self._on_changed)
+        self.rebuild()
+
+    def register_on_changed(self, func):
+        """
+        Register a new handler for handling changes of the workflows
+        (state, message state or message).
+
+        Parameters
+        ----------
+        func : Function
+            Handler function: func(workflow)
+        """
+        self._on_workflow_changed = func
+
+    def rebuild(self):
+        """
+        Rebuilds the whole graph configuration.
+        """
+        start = time.perf_counter()
+        self.config = self.workflow.build_graph()
+        metrics.graph_rebuild.observe(time.perf_counter() - start)
+        self._changed.clear()
+        self._delta.clear()
+        self._delta_base = self.sequence
+        self._set_sequence(self.sequence)
+
+    def update(self):
+        """
+        Patches the nodes of all changed workflows.
+
+        Return
+        ------
+        changed : bool
+            True, if the graph configuration was changed.
+        """
+        changed = False
+        while self._changed:
+            workflow = self._changed.pop()
+            for nodeData in workflow.update_graph_nodes():
+                self._delta[nodeData['id']] = {
+                    'id': nodeData['id'],
+                    'status': nodeData.get('status'),
+                    'messageState': nodeData.get('messageState'),
+                    'message': nodeData.get('message')
+                }
+                changed = True
+        if changed:
+            self._set_sequence(self.sequence + 1)
+        return changed
+
+    def to_json(self):
+        """
+        Returns the JSON graph configuration. The same string object is
+        returned as long as the graph didn't change.
+        """
+        start = time.perf_counter()
+        changed = self.update()
+        if self._json is None:
+            self._json = json.dumps(self.config)
+        if changed:
+            metrics.graph_update.observe(time.perf_counter() - start)
+        return self._json
+
+    def pop_delta(self):
+        """
+        Returns the changes since the last call as JSON.
+        The delta contains the graph ID, the sequence number the delta
+        is based on ('base') and the resulting sequence number ('seq').
+
+        Return
+        ------
+        delta : str
+            The JSON delta or None, if nothing changed.
+        """
+        self.update()
+        if not self._delta:
+            return None
+
+        delta = json.dumps({
+            'graph': self.graph_id,
+            'base': self._delta_base,
+            'seq': self.sequence,
+            'nodes': list(self._delta.values())
+        })
+        self._delta.clear()
+        self._delta_base = self.sequence
+        return delta
+
+    def _set_sequence(self, sequence):
+        self.sequence = sequence
+        self.config['graph'] = self.graph_id
+        self.config['seq'] = sequence
+        self._json = None
+
+    def _on_changed(self, workflow):
+        self._changed.add(workflow)
+        if self._on_workflow_changed:
+            self._on_workflow_changed(workflow)
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+import functools
+import json
+import os
+import sys
+from workflow import Workflow, SequenceWorkflow, ParallelWorkflow, CombinedWorkflow, BurstWorkflow
+from workflow_extras import (InitWorkflow, ExitWorkflow, SendTriggerWorkflow,
+                             SendMessageWorkflow, TTSAudioWorkflow,
+                             LightControlWorkflow, DelayWorkflow)
+from workflow_definition import WorkflowDefinition
+from message import State
+from util import Location, LEDPattern
+from engine_log import get_logger
+
+# YAML is optional, JSON definitions are always supported
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+log = get_logger("loader")
+
+# The topic list of the escape room (next to the logic directory)
+TOPICS_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, "MQTTTopics.md")
+
+
+class WorkflowDefinitionError(ValueError):
+    """
+    Raised if a workflow definition file is invalid. All problems of the
+    file are collected in "errors".
+    """
+
+    def __init__(self, path, errors):
+        self.path = path
+        self.errors = errors
+        super().__init__(
+            f"Invalid workflow definition '{path}':\n  " + "\n  ".join(errors))
+
+
+def read_topics(path=TOPICS_FILE):
+    """
+    Reads the topic names of the topic table in MQTTTopics.md.
+
+    Parameters
+    ----------
+    path : str
+        The path of the markdown file.
+
+    Return
+    ------
+    topics : set
+        The topic names or None, if the file doesn't exist.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            lines = file.readlines()
+    except FileNotFoundError:
+        return None
+    topics = set()
+    for line in lines:
+        columns = line.split("|")
+        if len(columns) > 3 and "/" in columns[3]:
+            topics.add(columns[3].strip())
+    return topics
+
+
+def _enum(enum, value, where, errors, by_value=False):
+    if isinstance(value, bool) and enum is State:
+        # YAML reads unquoted ON/OFF as booleans
+        return State.ON if value else State.OFF
+    if isinstance(value, str):
+        if value.upper() in enum.__members__:
+            return enum[value.upper()]
+        if by_value:
+            for member in enum:
+                if member.value == value:
+                    return member
+    names = ", ".join(enum.__members__)
+    errors.append(f"{where}: unknown {enum.__name__} '{value}' ({names})")
+    return None
+
+
+def _color(value, where, errors):
+    if isinstance(value, (list, tuple)) and len(value) == 3 and \
+            all(isinstance(c, int) and 0 <= c <= 255 for c in value):
+        return tuple(value)
+    errors.append(f"{where}: color must be [r, g, b] with values 0-255")
+    return None
+
+
+class _Compiler:
+    """
+    Validates a parsed definition and compiles every node into a
+    constructor without arguments.
+    """
+
+    # type: (required keys, optional keys)
+    TYPES = {
+        'sequence': ({'workflows'}, set()),
+        'parallel': ({'workflows'}, {'quorum', 'timeout'}),
+        'combined': ({'workflows'}, set()),
+        'burst': ({'workflows'}, set()),
+        'init': ({'workflows'}, set()),
+        'exit': ({'workflows'}, set()),
+        'puzzle': ({'topic'}, set()),
+        'trigger': ({'topic', 'state'}, {'data'}),
+        'message': ({'topic', 'payload'}, set()),
+        'tts': (set(), {'text', 'file'}),
+        'light': ({'state'}, {'brightness', 'color', 'pattern', 'qos'}),
+        'delay': ({'seconds'}, set()),
+    }
+
+    # Types which are displayed as one node (their children are hidden)
+    COMBINED = {'combined', 'burst', 'init', 'exit', 'light'}
+
+    # Types of single commands, which can be published in a burst
+    COMMANDS = ('trigger', 'message', 'tts', 'light', 'burst')
+
+    def __init__(self, known_topics):
+        self.known_topics = known_topics
+        self.errors = []
+        self.used_topics = {}
+        self.names = {}
+        self.visible_names = []
+
+    def compile_list(self, nodes, where, visible):
+        if not isinstance(nodes, list):
+            self.errors.append(f"{where}: expected a list of workflows")
+            return []
+        return [self.compile_node(node, f"{where}[{i}]", visible)
+                for i, node in enumerate(nodes)]
+
+    def compile_node(self, node, where, visible):
+        if not isinstance(node, dict):
+            self.errors.append(f"{where}: expected a mapping")
+            return None
+        types = [key for key in node if key in self.TYPES]
+        if len(types) != 1:
+            self.errors.append(
+                f"{where}: expected exactly one type of "
+                f"{', '.join(self.TYPES)}")
+            return None
+        kind = types[0]
+        required, optional = self.TYPES[kind]
+        keys = set(node) - {kind}
+        for key in sorted(required - keys):
+            self.errors.append(f"{where}: '{kind}' requires '{key}'")
+        for key in sorted(keys - required - optional):
+            self.errors.append(f"{where}: unknown key '{key}' for '{kind}'")
+
+        name = node[kind]
+        if kind in ('init', 'exit'):
+            name = kind.capitalize()
+        elif kind == 'light':
+            name = None
+        elif not isinstance(name, str) or not name:
+            self.errors.append(f"{where}: '{kind}' requires a name")
+            return None
+        if name is not None:
+            where = f"{where} '{name}'"
+            if visible:
+                self.__add_name(name, where)
+        if 'topic' in node:
+            self.__add_topic(node['topic'], where)
+
+        return getattr(self, f"_compile_{kind}")(
+            node, name, where, visible and kind not in self.COMBINED)
+
+    def __add_name(self, name, where):
+        # Graph nodes are identified by their name, skip by name
+        other = self.names.setdefault(name.upper(), where)
+        if other != where:
+            self.errors.append(
+                f"{where}: duplicate workflow name (see {other})")
+        else:
+            self.visible_names.append(name)
+
+    def __add_topic(self, topic, where):
+        if not isinstance(topic, str) or not topic:
+            self.errors.append(f"{where}: topic must be a string")
+        elif self.known_topics is not None and topic not in self.known_topics:
+            self.errors.append(
+                f"{where}: unknown topic '{topic}' (add it to MQTTTopics.md "
+                f"or the 'topics' of the definition)")
+        else:
+            self.used_topics.setdefault(topic, where)
+
+    def __children(self, node, where, visible):
+        return self.compile_list(
+            node.get('workflows'), f"{where}.workflows", visible)
+
+    def _compile_sequence(self, node, name, where, visible):
+        return self.__composite(SequenceWorkflow, name,
+                                self.__children(node, where, visible))
+
+    def _compile_parallel(self, node, name, where, visible):
+        children = self.__children(node, where, visible)
+        quorum = node.get('quorum')
+        valid = isinstance(quorum, int) and not isinstance(quorum, bool) and \
+            0 < quorum <= len(children)
+        if quorum is not None and not valid:
+            self.errors.append(
+                f"{where}: quorum must be 1-{len(children)}")
+        timeout = node.get('timeout')
+        valid = isinstance(timeout, (int, float)) and \
+            not isinstance(timeout, bool) and timeout > 0
+        if timeout is not None and not valid:
+            self.errors.append(f"{where}: timeout must be a positive number")
+        return lambda: ParallelWorkflow(
+            name, [child() for child in children],
+            quorum=quorum, timeout_sec=timeout)
+
+    def _compile_combined(self, node, name, where, visible):
+        return self.__composite(CombinedWorkflow, name,
+                                self.__children(node, where, visible))
+
+    def _compile_burst(self, node, name, where, visible):
+        return self.__composite(BurstWorkflow, name,
+                                self.__commands(node, where, visible))
+
+    def _compile_init(self, node, name, where, visible):
+        children = self.__commands(node, where, visible)
+        return lambda: InitWorkflow([child() for child in children])
+
+    def _compile_exit(self, node, name, where, visible):
+        children = self.__commands(node, where, visible)
+        return lambda: ExitWorkflow([child() for child in children])
+
+    def __commands(self, node, where, visible):
+        children = node.get('workflows')
+        if isinstance(children, list):
+            for i, child in enumerate(children):
+                kinds = [key for key in child if key in self.TYPES] \
+                    if isinstance(child, dict) else []
+                if len(kinds) == 1 and kinds[0] not in self.COMMANDS:
+                    self.errors.append(
+                        f"{where}.workflows[{i}]: '{kinds[0]}' isn't a "
+                        f"command ({', '.join(self.COMMANDS)})")
+        return self.__children(node, where, visible)
+
+    @staticmethod
+    def __composite(cls, name, children):
+        return lambda: cls(name, [child() for child in children])
+
+    def _compile_puzzle(self, node, name, where, visible):
+        return functools.partial(Workflow, name, node.get('topic'))
+
+    def _compile_trigger(self, node, name, where, visible):
+        state = _enum(State, node.get('state'), where, self.errors)
+        return functools.partial(
+            SendTriggerWorkflow, name, node.get('topic'), state,
+            node.get('data'))
+
+    def _compile_message(self, node, name, where, visible):
+        return functools.partial(
+            SendMessageWorkflow, name, node.get('topic'), node.get('payload'))
+
+    def _compile_tts(self, node, name, where, visible):
+        if ('text' in node) == ('file' in node):
+            self.errors.append(f"{where}: 'tts' requires 'text' or 'file'")
+        if 'file' in node:
+            return functools.partial(TTSAudioWorkflow, name, node['file'], True)
+        return functools.partial(TTSAudioWorkflow, name, node.get('text'))
+
+    def _compile_light(self, node, name, where, visible):
+        location = _enum(Location, node['light'], where, self.errors)
+        state = _enum(State, node.get('state'), where, self.errors)
+        brightness = node.get('brightness', 255)
+        if not isinstance(brightness, int) or not 0 <= brightness <= 255:
+            self.errors.append(f"{where}: brightness must be 0-255")
+        color = _color(node.get('color', [255, 255, 255]), where, self.errors)
+        pattern = _enum(LEDPattern, node.get('pattern', 'RGB'), where,
+                        self.errors, by_value=True)
+        qos = node.get('qos', 2)
+        if qos not in (0, 1, 2):
+            self.errors.append(f"{where}: qos must be 0, 1 or 2")
+        return functools.partial(
+            LightControlWorkflow, location, state, brightness, color,
+            pattern, qos)
+
+    def _compile_delay(self, node, name, where, visible):
+        seconds = node.get('seconds')
+        if isinstance(seconds, bool) or \
+                not isinstance(seconds, (int, float)) or seconds < 0:
+            self.errors.append(f"{where}: seconds must be a positive number")
+        return functools.partial(DelayWorkflow, name, seconds)
+
+
+class WorkflowTemplate:
+    """
+    A compiled workflow definition. The definition is validated once and
+    every workflow is compiled into a constructor with resolved arguments,
+    so creating a new workflow tree on every game start only calls the
+    constructors.
+    """
+
+    def __init__(self, path, workflows, names, topics):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        path : str
+            The path of the definition file.
+
+        workflows : Function[]
+            The constructors of the top level workflows.
+
+        names : str[]
+            The names of the workflows displayed in the graph.
+
+        topics : str[]
+            The topics used by the definition.
+        """
+        self.path = path
+        self.workflows = workflows
+        self.names = names
+        self.topics = topics
+
+    def instantiate(self):
+        """
+        Creates a new workflow tree and returns it's top level workflows.
+        """
+        return [workflow() for workflow in self.workflows]
+
+
+def parse_definition(path):
+    """
+    Parses a YAML (.yaml, .yml) or JSON definition file.
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise WorkflowDefinitionError(
+                    path, ["PyYAML is not installed (python3-yaml)"])
+            try:
+                return yaml.safe_load(file)
+            except yaml.YAMLError as e:
+                raise WorkflowDefinitionError(path, [str(e)])
+        try:
+            return json.load(file)
+        except ValueError as e:
+            raise WorkflowDefinitionError(path, [str(e)])
+
+
+def compile_definition(definition, path="<definition>", topics_file=TOPICS_FILE):
+    """
+    Validates a parsed definition and compiles it into a template.
+
+    >>> template = compile_definition({'workflow': [
+    ...     {'sequence': 'Room', 'workflows': [
+    ...         {'puzzle': 'Cube', 'topic': '1/cube/state'},
+    ...         {'delay': 'Wait', 'seconds': 1}]}]})
+    >>> [w.name for w in template.instantiate()[0].workflows]
+    ['Cube', 'Wait']
+    >>> compile_definition({'workflow': [
+    ...     {'puzzle': 'Cube', 'topic': '1/cube/state'},
+    ...     {'puzzle': 'cube', 'topic': '9/unknown'}]})
+    Traceback (most recent call last):
+    ...
+    workflow_loader.WorkflowDefinitionError: Invalid workflow definition '<definition>':
+      workflow[1] 'cube': duplicate workflow name (see workflow[0] 'Cube')
+      workflow[1] 'cube': unknown topic '9/unknown' (add it to MQTTTopics.md or the 'topics' of the definition)
+
+    Parameters
+    ----------
+    definition : dict
+        The definition with the list of the top level workflows ("workflow")
+        and optional additional topics ("topics").
+
+    path : str
+        The path of the definition file (used in the errors).
+
+    topics_file : str
+        The topic list to validate the topics against (None: no validation).
+
+    Return
+    ------
+    template : WorkflowTemplate
+        The compiled definition.
+    """
+    if not isinstance(definition, dict) or 'workflow' not in definition:
+        raise WorkflowDefinitionError(path, ["expected a mapping with 'workflow'"])
+    known_topics = read_topics(topics_file) if topics_file else None
+    if known_topics is None and topics_file:
+        log.warning("Topic list '%s' not found, topics aren't validated",
+                    topics_file)
+    compiler = _Compiler(known_topics)
+    if known_topics is not None:
+        extra_topics = definition.get('topics') or []
+        if not isinstance(extra_topics, list):
+            compiler.errors.append("topics: expected a list of topics")
+            extra_topics = []
+        known_topics.update(extra_topics)
+    workflows = compiler.compile_list(definition['workflow'], "workflow", True)
+    if compiler.errors:
+        raise WorkflowDefinitionError(path, compiler.errors)
+    return WorkflowTemplate(path, workflows, compiler.visible_names,
+                            list(compiler.used_topics))
+
+
+# Compiled templates by path: (modification time, size, template)
+_templates = {}
+
+
+def load_definition(path, topics_file=TOPICS_FILE):
+    """
+    Loads a workflow definition file. The compiled template is cached
+    and only compiled again if the file was modified.
+
+    Parameters
+    ----------
+    path : str
+        The path of the YAML or JSON definition file.
+
+    topics_file : str
+        The topic list to validate the topics against (None: no validation).
+
+    Return
+    ------
+    template : WorkflowTemplate
+        The compiled definition.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _templates.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    template = compile_definition(parse_definition(path), path, topics_file)
+    _templates[path] = (key, template)
+    log.info("Compiled workflow definition '%s' (%d workflows)",
+             path, len(template.names))
+    return template
+
+
+class WorkflowFile(WorkflowDefinition):
+    """
+    This class serves as factory for a workflow defined in a YAML or JSON
+    file. The file is validated when the factory is created. If the file
+    is changed, it's compiled again on the next start; if the changed file
+    is invalid, the last valid definition is used.
+    """
+
+    def __init__(self, path, topics_file=TOPICS_FILE):
+        """
+        Initializes a new instance of this class.
+
+        Parameters
+        ----------
+        path : str
+            The path of the YAML or JSON definition file.
+
+        topics_file : str
+            The topic list to validate the topics against
+            (None: no validation).
+        """
+        self.path = path
+        self.topics_file = topics_file
+        self.template = load_definition(path, topics_file)
+
+    def create(self, settings):
+        try:
+            self.template = load_definition(self.path, self.topics_file)
+        except (OSError, WorkflowDefinitionError) as e:
+            log.error("%s\nUsing the last valid definition.", e)
+        workflow = self.template.instantiate()
+        self.apply_initial_settings(workflow)
+        return workflow
+
+
+def is_definition_file(definition):
+    """
+    Returns True, if the workflow definition is a YAML or JSON file
+    instead of "module:class".
+    """
+    return definition.endswith((".yaml", ".yml", ".json"))
+
+
+if __name__ == "__main__":
+    # Validates definition files, ex. python3 workflow_loader.py game.yaml
+    failed = False
+    for path in sys.argv[1:]:
+        try:
+            template = load_definition(path)
+            print(f"{path}: {len(template.names)} workflows, "
+                  f"{len(template.topics)} topics")
+        except (OSError, WorkflowDefinitionError) as e:
+            print(e, file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
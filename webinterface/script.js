@@ -3,10 +3,12 @@ let reconnectTimeout = 2000;
 let host = "10.0.0.2";
 let port = 9001;
 let topicsUser = new Set();
-let topicsUI = new Set(["op/gameTime_formatted", "op/gameControl", "op/gameOptions", "op/gameState", "4/door/entrance", "4/door/serverRoom"]);
+let topicsUI = new Set(["op/gameTime_formatted", "op/gameControl", "op/gameOptions", "op/gameState", "op/gameState/delta", "4/door/entrance", "4/door/serverRoom"]);
 let tabs = new Set(["control", "cameras", "cameras-fallback", "mosquitto"]);
 let printTime = false;
 let controlleft = true;
+let gameStateGraph = null;
+let gameStateSeq = -1;
 
 /**
  * Short version of getElementById
@@ -125,8 +127,22 @@ function onMessageArrived(msg) {
     // Draw graph from gameState
     else if (topic === "op/gameState") {
         try {
-            displayGraph(JSON.parse(msg.payloadString));
+            let data = JSON.parse(msg.payloadString);
+            displayGraph(data);
+            gameStateGraph = data.graph;
+            gameStateSeq = data.seq;
             getID("startnote").style.display = "none";
+            // Further changes are received over the delta topic
+            if (gameStateGraph !== undefined) {
+                mqtt.unsubscribe("op/gameState");
+            }
+        } catch {
+        }
+    }
+    // Update graph from gameState changes
+    else if (topic === "op/gameState/delta") {
+        try {
+            applyGraphDelta(JSON.parse(msg.payloadString));
         } catch {
         }
     }
@@ -766,10 +782,22 @@ function displayGraph(data) {
 
     });
 
-    /**
-     * This part displays a tooltip for those nodes who have a message set
-     */
-    for (let popper of document.getElementsByClassName("popper")) {
+    displayTooltips(cy);
+    cy.on("mouseover", 'node[message]', function (evt) {
+        getID(btoa(evt.target.data("id"))).style.display = "block";
+    });
+    cy.on("mouseout", 'node[message]', function (evt) {
+        getID(btoa(evt.target.data("id"))).style.display = "none";
+
+    });
+}
+
+/**
+ * This function displays a tooltip for those nodes who have a message set
+ * @param cy The cytoscape instance
+ */
+function displayTooltips(cy) {
+    for (let popper of Array.from(document.getElementsByClassName("popper"))) {
         popper.remove();
     }
     for (let el of cy.elements('node[message]')) {
@@ -779,11 +807,31 @@ function displayGraph(data) {
         div.id = btoa(el.data("id"));
         document.body.appendChild(div);
     }
-    cy.on("mouseover", 'node[message]', function (evt) {
-        getID(btoa(evt.target.data("id"))).style.display = "block";
-    });
-    cy.on("mouseout", 'node[message]', function (evt) {
-        getID(btoa(evt.target.data("id"))).style.display = "none";
+}
 
-    });
+/**
+ * Applies the changed node states to the displayed graph without redrawing it.
+ * If an update was missed, the full graph is requested again.
+ * @param delta The changes published to "op/gameState/delta"
+ */
+function applyGraphDelta(delta) {
+    if (delta.graph !== gameStateGraph || delta.base !== gameStateSeq || !window.cy) {
+        if (delta.graph !== gameStateGraph || delta.seq > gameStateSeq) {
+            // Resync from the retained full graph
+            mqtt.subscribe("op/gameState");
+        }
+        return;
+    }
+    for (let node of delta.nodes) {
+        let el = cy.getElementById(node.id);
+        for (let key of ["status", "messageState", "message"]) {
+            if (node[key] === null || node[key] === undefined) {
+                el.removeData(key);
+            } else {
+                el.data(key, node[key]);
+            }
+        }
+    }
+    gameStateSeq = delta.seq;
+    displayTooltips(cy);
 }